@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import uuid
+import boto3
+from functools import lru_cache
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+# Environment variables
+STATE_BUCKET_NAME = os.environ.get("STATE_BUCKET_NAME")
+REGION = os.environ.get("REGION")
+RESPONSE_FUNCTION_ARN = os.environ.get("RESPONSE_FUNCTION_ARN")
+MAX_QUESTIONS = int(os.environ.get("MAX_QUESTIONS", "20"))
+# Each question is a full agent run; keep well under the Bedrock quota left for users.
+CONCURRENCY = int(os.environ.get("CONCURRENCY", "2"))
+# How long to wait for the catalog to list the ingested outputs.
+CATALOG_WAIT_SECONDS = int(os.environ.get("CATALOG_WAIT_SECONDS", "120"))
+CATALOG_POLL_SECONDS = 5
+# No new question is started unless a whole agent run still fits before the deadline.
+AGENT_TIMEOUT_SECONDS = 130
+
+QUESTIONS_KEY = "warmup/frequent_questions.json"
+REPORT_KEY = "warmup/latest.json"
+CATALOG_KEY = "catalog.json"
+ANSWER_PREFIX = "answers/"
+
+# Created on first use and reused by warm invocations.
+@lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client("s3", region_name=REGION, config=Config(connect_timeout=5, read_timeout=30, retries={"max_attempts": 3, "mode": "standard"}))
+
+# Agent runs happen on worker threads, and the default session is not thread-safe,
+# so the client is built up front in lambda_handler.
+@lru_cache(maxsize=None)
+def get_lambda_client():
+    return boto3.client("lambda", region_name=REGION, config=Config(connect_timeout=5, read_timeout=AGENT_TIMEOUT_SECONDS, retries={"max_attempts": 0}))
+
+def read_json(key):
+    try:
+        return json.loads(get_s3_client().get_object(Bucket=STATE_BUCKET_NAME, Key=key)["Body"].read())
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        return None
+
+def write_json(key, value):
+    get_s3_client().put_object(Bucket=STATE_BUCKET_NAME, Key=key, Body=json.dumps(value, indent=2), ContentType="application/json")
+
+def wait_for_catalog(outputs, deadline):
+    """
+    Returns the catalog version once the catalog lists every ingested output at
+    its content hash. A newer change to one of them moves the catalog past the
+    ingested data; answers keyed by that version would describe data the
+    knowledge base does not hold yet, so None is returned once the deadline
+    passes and the next completed job starts another precompute.
+    """
+    expected = {output["key"]: output["sha256"] for output in outputs if output.get("key") and output.get("sha256")}
+    while True:
+        catalog = read_json(CATALOG_KEY) or {"version": 0, "datasets": {}}
+        published = {entry.get("key"): entry.get("sha256") for entry in catalog.get("datasets", {}).values()}
+        missing = [key for key, sha256 in expected.items() if published.get(key) != sha256]
+        if not missing and catalog.get("version"):
+            return catalog["version"]
+        if time.monotonic() + CATALOG_POLL_SECONDS > deadline:
+            print(f"[DEBUG] Catalog still missing {missing} at version {catalog.get('version')}")
+            return None
+        time.sleep(CATALOG_POLL_SECONDS)
+
+def precompute(question, data_version):
+    """
+    Has the agent answer one question in precompute mode, where it streams to no
+    connection and stores the answer under data_version. Never raises.
+    """
+    started = time.monotonic()
+    result = {"question": question, "status": "failed"}
+    try:
+        response = get_lambda_client().invoke(
+            FunctionName=RESPONSE_FUNCTION_ARN,
+            InvocationType="RequestResponse",
+            # A fresh session per question, so no answer depends on another one
+            Payload=json.dumps({"prompt": question, "sessionId": f"precompute-{uuid.uuid4().hex}", "precompute": True, "dataVersion": data_version}),
+        )
+        payload = json.loads(response["Payload"].read() or b"null")
+        if response.get("FunctionError"):
+            error = payload.get("errorMessage") if isinstance(payload, dict) else str(payload)
+            raise RuntimeError(f"{response['FunctionError']}: {error}")
+        result["status"] = "succeeded"
+        result["hash"] = payload["questionHash"]
+    except Exception as e:
+        result["error"] = str(e)
+        print(f"[DEBUG] Precompute failed for {question!r}: {e}")
+    result["duration_seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+def lambda_handler(event, context):
+    """
+    Warms the answer cache after a data refresh. Invoked asynchronously by
+    KnowledgeBaseIngestion once an ingestion job has completed with nothing else
+    queued, with {"ingestionJobId", "outputs": [{"key", "sha256"}, ...]}, so the
+    document answers are generated from the data the version describes:
+      1. Waits until the data catalog reflects the ingested outputs and takes its
+         version as the data version.
+      2. Has the agent answer the most frequent questions (warmup/frequent_questions.json,
+         built by tools/build_frequent_questions.py) that are not cached for that
+         version yet, a few at a time.
+      3. Publishes the answered questions in answers/<version>/index.json, which is
+         what makes the agent serve them, and writes a report to warmup/latest.json.
+    """
+    start = time.monotonic()
+    deadline = start + (context.get_remaining_time_in_millis() / 1000 - 10 if context is not None else 600)
+    get_lambda_client()
+
+    questions = [entry["question"] for entry in (read_json(QUESTIONS_KEY) or {}).get("questions", [])][:MAX_QUESTIONS]
+    report = {"ingestion_job_id": event.get("ingestionJobId"), "started_at": datetime.now(timezone.utc).isoformat(), "questions": len(questions)}
+    data_version = wait_for_catalog(event.get("outputs", []), min(deadline, start + CATALOG_WAIT_SECONDS)) if questions else None
+    report["data_version"] = data_version
+
+    results = []
+    if data_version:
+        index_key = f"{ANSWER_PREFIX}{data_version}/index.json"
+        index = read_json(index_key) or {"data_version": data_version, "questions": {}}
+        cached = set(index["questions"].values())
+        pending = [question for question in questions if question not in cached]
+        print(f"[DEBUG] Data version {data_version}: {len(pending)} of {len(questions)} questions to precompute")
+
+        def run(question):
+            if time.monotonic() + AGENT_TIMEOUT_SECONDS > deadline:
+                return {"question": question, "status": "skipped", "error": "out of time"}
+            return precompute(question, data_version)
+
+        with ThreadPoolExecutor(max_workers=max(1, CONCURRENCY)) as executor:
+            results = list(executor.map(run, pending))
+
+        answered = {result["hash"]: result["question"] for result in results if result["status"] == "succeeded"}
+        if answered:
+            # Re-read so a concurrent run for the same version is not overwritten
+            index = read_json(index_key) or index
+            index["questions"].update(answered)
+            index["updated_at"] = datetime.now(timezone.utc).isoformat()
+            write_json(index_key, index)
+
+    report["results"] = results
+    report["answered"] = sum(1 for result in results if result["status"] == "succeeded")
+    report["duration_seconds"] = round(time.monotonic() - start, 3)
+    write_json(REPORT_KEY, report)
+    print(f"[DEBUG] Precomputed {report['answered']} answers for data version {data_version} in {report['duration_seconds']}s")
+    return {"statusCode": 200 if data_version or not questions else 500, "body": json.dumps({k: report[k] for k in ("data_version", "questions", "answered")})}
@@ -0,0 +1,122 @@
+import re
+import json
+import time
+import base64
+import hashlib
+import threading
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+ANSWER_PREFIX = "answers/"
+
+
+def normalize_question(text):
+    """
+    Folds the trivial differences between two askings of the same question: case,
+    punctuation and whitespace. Shared with tools/build_frequent_questions.py.
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+
+def question_hash(text):
+    return hashlib.sha256(normalize_question(text).encode("utf-8")).hexdigest()[:32]
+
+
+def encode_files(files):
+    """
+    Raw code-interpreter files ({"name", "type", "bytes"}) in JSON-safe form. The
+    raw bytes are cached rather than the built frame entries, so every hit goes
+    through artifacts.build_files again and gets fresh presigned URLs.
+    """
+    return [{"name": f.get("name"), "type": f.get("type"), "base64": base64.b64encode(f.get("bytes", b"")).decode("utf-8")} for f in files]
+
+
+def decode_files(files):
+    return [{"name": f.get("name"), "type": f.get("type"), "bytes": base64.b64decode(f.get("base64", ""))} for f in files]
+
+
+class AnswerCache:
+    """
+    Precomputed answers to frequent questions, stored in the state bucket per data
+    version (the catalog version):
+
+        answers/<version>/index.json      {"data_version", "questions": {hash: question}}
+        answers/<version>/<hash>.json     {"question", "text", "files", "data_version", "created_at"}
+
+    Only the index is read on the request path; a question missing from it is a
+    miss without another S3 call. Indexes are revalidated at most every `ttl`
+    seconds, so answers published after a container loaded the index are picked
+    up, and answers are kept in memory once read.
+    """
+
+    def __init__(self, s3_client, bucket, prefix=ANSWER_PREFIX, ttl=60, max_answers=64, clock=time.monotonic):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_answers = max_answers
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._answers = {}
+
+    def _key(self, data_version, name):
+        return f"{self.prefix}{data_version}/{name}.json"
+
+    def _read(self, key):
+        try:
+            return json.loads(self.s3_client.get_object(Bucket=self.bucket, Key=key)["Body"].read())
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                print(f"DEBUG: Could not read {key}: {e}")
+            return None
+
+    def index(self, data_version):
+        with self._lock:
+            cached = self._indexes.get(data_version)
+        if cached and self.clock() - cached[0] < self.ttl:
+            return cached[1]
+        index = self._read(self._key(data_version, "index")) or {"data_version": data_version, "questions": {}}
+        with self._lock:
+            # Only the current version is ever asked for; drop the others
+            self._indexes = {data_version: (self.clock(), index)}
+        return index
+
+    def get(self, question, data_version):
+        if not self.bucket or not data_version:
+            return None
+        digest = question_hash(question)
+        if digest not in self.index(data_version)["questions"]:
+            return None
+        with self._lock:
+            answer = self._answers.get((data_version, digest))
+        if answer is None:
+            answer = self._read(self._key(data_version, digest))
+            if answer is None:
+                return None
+            with self._lock:
+                if len(self._answers) >= self.max_answers:
+                    self._answers.pop(next(iter(self._answers)))
+                self._answers[(data_version, digest)] = answer
+        return answer
+
+    def put(self, question, data_version, text, files=()):
+        """
+        Stores one answer. It is only served once the question is in the version's
+        index, which AnswerPrecompute writes once its run is done.
+        """
+        digest = question_hash(question)
+        answer = {
+            "question": question,
+            "text": text,
+            "files": encode_files(files),
+            "data_version": data_version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(data_version, digest),
+            Body=json.dumps(answer),
+            ContentType="application/json",
+        )
+        return digest
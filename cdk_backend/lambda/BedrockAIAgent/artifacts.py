@@ -0,0 +1,141 @@
+import io
+import gzip
+import base64
+import hashlib
+import mimetypes
+from functools import lru_cache
+
+# API Gateway rejects WebSocket messages over 128 KB, so everything inlined into one
+# "files" frame has to fit well under that; larger content is only linked.
+INLINE_ARTIFACT_MAX_BYTES = 48 * 1024
+FRAME_INLINE_BUDGET_BYTES = 96 * 1024
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 70
+TEXT_TYPES = {"application/json", "application/csv", "application/xml"}
+ARTIFACT_PREFIX = "artifacts/"
+
+
+@lru_cache(maxsize=None)
+def pillow():
+    """
+    Pillow is imported on first use, since most answers carry no images, and is
+    optional: without it images are passed through unchanged and get no preview.
+    """
+    try:
+        from PIL import Image
+        return Image
+    except ImportError:
+        print("DEBUG: Pillow is not installed; images are sent without recompression or previews.")
+        return None
+
+
+def is_text(file_type, filename):
+    return file_type.startswith("text/") or file_type in TEXT_TYPES or filename.lower().endswith((".csv", ".txt", ".json"))
+
+
+def recompress_image(data, file_type):
+    """
+    Returns (full_resolution_bytes, thumbnail_jpeg_bytes). Charts are flat-colour,
+    so a 256-colour palette keeps them visually identical at a fraction of the size;
+    the smaller of the original and the re-encoded image is kept.
+    """
+    Image = pillow()
+    if Image is None:
+        return data, None
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        print(f"DEBUG: Could not decode image, sending it unchanged: {e}")
+        return data, None
+
+    full = data
+    buffer = io.BytesIO()
+    if file_type == "image/png":
+        image.convert("RGBA").quantize(colors=256, method=Image.Quantize.FASTOCTREE).save(buffer, format="PNG", optimize=True)
+    elif file_type in ("image/jpeg", "image/jpg"):
+        image.convert("RGB").save(buffer, format="JPEG", quality=85, optimize=True, progressive=True)
+    if 0 < buffer.tell() < len(data):
+        full = buffer.getvalue()
+
+    thumbnail = image.convert("RGBA")
+    thumbnail.thumbnail(THUMBNAIL_SIZE)
+    background = Image.new("RGB", thumbnail.size, (255, 255, 255))
+    background.paste(thumbnail, mask=thumbnail.getchannel("A"))
+    preview = io.BytesIO()
+    background.save(preview, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return full, preview.getvalue()
+
+
+def store_artifact(s3_client, bucket, data, filename, file_type, encoding=None, expires_in=3600):
+    """
+    Uploads the full artifact under a content-addressed key and returns a presigned
+    URL, so the browser only downloads it when the user opens it.
+    """
+    key = f"{ARTIFACT_PREFIX}{hashlib.sha256(data).hexdigest()[:32]}/{filename}"
+    params = {"Bucket": bucket, "Key": key, "Body": data, "ContentType": file_type}
+    if encoding:
+        params["ContentEncoding"] = encoding
+    s3_client.put_object(**params)
+    disposition = "inline" if file_type.startswith("image/") else f'attachment; filename="{filename}"'
+    return s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket, "Key": key, "ResponseContentDisposition": disposition},
+        ExpiresIn=expires_in,
+    )
+
+
+def process_artifact(data, filename, file_type, s3_client=None, bucket=None, inline_limit=INLINE_ARTIFACT_MAX_BYTES):
+    """
+    Turns one code-interpreter file into its "files" frame entry:
+      - images are recompressed and get a small JPEG "preview" for immediate display
+      - text and CSV content is gzipped ("encoding": "gzip")
+      - content above inline_limit is uploaded and only linked through "url"
+    "size" is always the original byte count.
+    """
+    if not file_type or file_type == "unknown":
+        file_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    entry = {"filename": filename, "type": file_type, "size": len(data)}
+
+    body, encoding = data, None
+    if file_type.startswith("image/"):
+        body, preview = recompress_image(data, file_type)
+        if preview:
+            entry["preview"] = base64.b64encode(preview).decode("utf-8")
+            entry["preview_type"] = "image/jpeg"
+    elif is_text(file_type, filename):
+        compressed = gzip.compress(data, compresslevel=6)
+        if len(compressed) < len(data):
+            body, encoding = compressed, "gzip"
+
+    if len(body) <= inline_limit or not (s3_client and bucket):
+        entry["base64"] = base64.b64encode(body).decode("utf-8")
+        if encoding:
+            entry["encoding"] = encoding
+    else:
+        entry["url"] = store_artifact(s3_client, bucket, body, filename, file_type, encoding)
+    print(f"DEBUG: Artifact {filename}: {len(data)} bytes -> {len(body)} bytes {'inline' if 'base64' in entry else 'linked'}")
+    return entry
+
+
+def build_files(raw_files, s3_client=None, bucket=None, budget=FRAME_INLINE_BUDGET_BYTES):
+    """
+    Processes every returned file and keeps the frame within budget: once the inline
+    content and previews would exceed it, the remaining files are linked instead of
+    inlined and their previews are dropped. Previews are only kept for images that
+    end up linked.
+    """
+    files, used = [], 0
+    for raw in raw_files:
+        entry = process_artifact(raw.get("bytes", b""), raw.get("name", "unknown"), raw.get("type", "unknown"), s3_client, bucket)
+        if "base64" in entry and used + len(entry["base64"]) > budget and s3_client and bucket:
+            content = base64.b64decode(entry.pop("base64"))
+            entry["url"] = store_artifact(s3_client, bucket, content, entry["filename"], entry["type"], entry.pop("encoding", None))
+        if "base64" in entry or used + len(entry.get("preview", "")) > budget:
+            # Either the full image is inline anyway, or the preview no longer fits and
+            # the image is only opened through its link.
+            entry.pop("preview", None)
+            entry.pop("preview_type", None)
+        used += len(entry.get("base64", "")) + len(entry.get("preview", ""))
+        files.append(entry)
+    return files
@@ -0,0 +1,89 @@
+import re
+import json
+import time
+from botocore.exceptions import ClientError
+
+# Words too common in questions to say anything about which dataset is meant.
+STOPWORDS = {
+    "the", "and", "for", "are", "was", "were", "what", "which", "who", "how", "many",
+    "much", "with", "from", "that", "this", "there", "their", "have", "has", "list",
+    "show", "give", "tell", "about", "data", "number", "total", "all", "any",
+}
+
+
+def tokens(text):
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    # Fold simple plurals so "counties" finds a "county" column.
+    folded = {w[:-3] + "y" if w.endswith("ies") else w[:-1] if w.endswith("s") and len(w) > 3 else w for w in words}
+    return {w for w in folded if len(w) >= 3 and w not in STOPWORDS}
+
+
+class CatalogCache:
+    """
+    Warm-container copy of the data catalog the scrapers publish (catalog.json in
+    the state bucket). It is loaded on first use and afterwards revalidated at most
+    every `ttl` seconds with a conditional GET, which returns 304 without a body
+    while the catalog is unchanged. Any failure leaves the last good copy in place.
+    """
+
+    def __init__(self, s3_client, bucket, key="catalog.json", ttl=60, clock=time.monotonic):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.ttl = ttl
+        self.clock = clock
+        self.catalog = {"version": 0, "updated_at": None, "datasets": {}}
+        self.etag = None
+        self.checked_at = None
+
+    def get(self):
+        now = self.clock()
+        if not self.bucket or (self.checked_at is not None and now - self.checked_at < self.ttl):
+            return self.catalog
+        self.checked_at = now
+        params = {"Bucket": self.bucket, "Key": self.key}
+        if self.etag:
+            params["IfNoneMatch"] = self.etag
+        try:
+            response = self.s3_client.get_object(**params)
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code not in ("304", "NotModified", "NoSuchKey"):
+                print(f"DEBUG: Catalog refresh failed, keeping version {self.catalog.get('version')}: {e}")
+            return self.catalog
+        try:
+            self.catalog = json.loads(response["Body"].read())
+            self.etag = response["ETag"]
+            print(f"DEBUG: Loaded catalog version {self.catalog.get('version')}")
+        except ValueError as e:
+            print(f"DEBUG: Catalog is not valid JSON, keeping the previous copy: {e}")
+        return self.catalog
+
+    @property
+    def version(self):
+        return self.get().get("version", 0)
+
+    def entry_for_key(self, key):
+        for entry in self.get().get("datasets", {}).values():
+            if entry.get("key") == key:
+                return entry
+        return None
+
+    def discover(self, prompt, data_bucket, limit=5):
+        """
+        Returns S3 URIs of catalogued CSV datasets whose name or columns share words
+        with the prompt, best matches first. Name matches count double.
+        """
+        wanted = tokens(prompt)
+        scored = []
+        for name, entry in self.get().get("datasets", {}).items():
+            key = entry.get("key", "")
+            if not key.lower().endswith(".csv"):
+                continue
+            name_tokens = tokens(name.replace("_", " "))
+            column_tokens = set().union(*(tokens(c.replace("_", " ")) for c in entry.get("schema", []))) if entry.get("schema") else set()
+            score = 2 * len(wanted & name_tokens) + len(wanted & (column_tokens - name_tokens))
+            if score:
+                scored.append((score, name, f"s3://{data_bucket}/{key}"))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [uri for _, _, uri in scored[:limit]]
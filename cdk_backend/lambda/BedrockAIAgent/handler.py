@@ -1,66 +1,298 @@
 import json
 import boto3
-import base64
 import os
 import time  # Needed for the sleep between retries
+import uuid
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from catalog import CatalogCache
+from record_index import RecordIndexCache, describe, lookup
+from artifacts import build_files
+from answer_cache import AnswerCache, decode_files
+from stream import AnswerStream, StreamStore
+from retrieval import adaptive_retrieval, batch_query, chunk_text, dataset_uri, group_related, metadata_filter, source_uri
+from routing import DATA, DOCUMENTS, classify, is_follow_up, retrieve_and_generate_request
+from tracing import OrchestrationSpans, Tracer, exporter_from_env
+from session_files import DynamoDBSessionStore, InMemorySessionStore, SessionFileTracker, object_version
 
-agent_client = boto3.client('bedrock-agent-runtime')
-gateway = boto3.client(
-    "apigatewaymanagementapi",
-    endpoint_url=os.environ['URL']
-)
+# Clients are created on first use and reused by warm invocations, so a request only
+# pays for the clients its path needs. invoke_agent streams for as long as the code
+# interpreter runs, hence the long read timeout on the agent runtime client.
+AGENT_CONFIG = Config(connect_timeout=3, read_timeout=100, retries={'max_attempts': 3, 'mode': 'standard'}, tcp_keepalive=True)
+GATEWAY_CONFIG = Config(connect_timeout=2, read_timeout=5, retries={'max_attempts': 3, 'mode': 'standard'}, tcp_keepalive=True)
+S3_CONFIG = Config(connect_timeout=2, read_timeout=5, retries={'max_attempts': 3, 'mode': 'standard'})
+DYNAMODB_CONFIG = Config(connect_timeout=2, read_timeout=3, retries={'max_attempts': 3, 'mode': 'standard'})
+
+RETRIEVAL_INITIAL_K = int(os.environ.get('RETRIEVAL_INITIAL_K', '5'))
+RETRIEVAL_MAX_K = int(os.environ.get('RETRIEVAL_MAX_K', '15'))
+# Below this best vector score the first pass is widened to RETRIEVAL_MAX_K
+RETRIEVAL_MIN_SCORE = float(os.environ.get('RETRIEVAL_MIN_SCORE', '0.5'))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '2000'))
+# Document questions whose best chunk scores below this still go to the supervisor
+ROUTING_MIN_SCORE = float(os.environ.get('ROUTING_MIN_SCORE', '0.6'))
+# Questions of one batch answered at once; each is a full agent run against the Bedrock quota
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+MAX_BATCH_QUESTIONS = int(os.environ.get('MAX_BATCH_QUESTIONS', '50'))
+# Questions of one group answered one after another in one agent session, which attaches the group's CSVs once
+BATCH_SESSION_QUESTIONS = int(os.environ.get('BATCH_SESSION_QUESTIONS', '3'))
+# No batch question is started unless a whole agent run still fits before the timeout
+QUESTION_TIMEOUT_SECONDS = 120
+
+@lru_cache(maxsize=None)
+def get_agent_client():
+    return boto3.client('bedrock-agent-runtime', config=AGENT_CONFIG)
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    return boto3.client("apigatewaymanagementapi", endpoint_url=os.environ['URL'], config=GATEWAY_CONFIG)
+
+@lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client('s3', config=S3_CONFIG)
+
+# Loaded once per warm container and revalidated with a conditional GET at most once a minute
+@lru_cache(maxsize=None)
+def get_catalog():
+    return CatalogCache(get_s3_client(), os.environ.get('STATE_BUCKET_NAME'), ttl=int(os.environ.get('CATALOG_TTL_SECONDS', '60')))
+
+# Lookup indexes named by catalog entries, revalidated like the catalog
+@lru_cache(maxsize=None)
+def get_record_indexes():
+    return RecordIndexCache(get_s3_client(), os.environ.get('STATE_BUCKET_NAME'), ttl=int(os.environ.get('CATALOG_TTL_SECONDS', '60')))
+
+# Which CSVs each session's code interpreter already has and how many turns it had; DynamoDB when SESSION_TABLE_NAME is set
+@lru_cache(maxsize=None)
+def get_session_files():
+    table_name = os.environ.get('SESSION_TABLE_NAME')
+    if table_name:
+        store = DynamoDBSessionStore(boto3.client('dynamodb', config=DYNAMODB_CONFIG), table_name)
+    else:
+        store = InMemorySessionStore()
+    return SessionFileTracker(store, ttl=int(os.environ.get('SESSION_FILES_TTL_SECONDS', '540')))
+
+# Answers precomputed for frequent questions after each data refresh, per catalog version
+@lru_cache(maxsize=None)
+def get_answer_cache():
+    return AnswerCache(get_s3_client(), os.environ.get('STATE_BUCKET_NAME'), ttl=int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', '60')))
+
+# Completed answer streams, kept briefly so a reconnecting client can resume one
+@lru_cache(maxsize=None)
+def get_stream_store():
+    return StreamStore(get_s3_client(), os.environ.get('STATE_BUCKET_NAME'), retention=int(os.environ.get('STREAM_RETENTION_SECONDS', '900')))
+
+# Span exporter from TRACE_EXPORTER: "log" (default), "file" (TRACE_FILE) or "none"
+@lru_cache(maxsize=None)
+def get_span_exporter():
+    return exporter_from_env()
+
+def post_to_connection(tracer, connection_id, data):
+    if not connection_id:
+        # Precomputed answers have no client to stream to
+        return
+    started = tracer.clock()
+    try:
+        get_gateway().post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps(data)
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "GoneException":
+            raise
+        # The client disconnected; the answer is still finished and stored so it can resume
+        print(f"DEBUG: Connection {connection_id} is gone, frame {data.get('seq')} not delivered")
+    tracer.count("post_to_connection", started, tracer.clock())
+
+def prime():
+    """
+    Builds the clients and loads the data catalog ahead of the first request. Run
+    during init when PRIME_ON_INIT is set, where it is off the request path for
+    provisioned concurrency and runs at full CPU for on-demand cold starts.
+    """
+    started = time.perf_counter()
+    try:
+        get_agent_client()
+        get_gateway()
+        get_catalog().get()
+    except Exception as e:
+        print(f"DEBUG: Priming failed, continuing lazily: {e}")
+    print(f"DEBUG: Primed in {time.perf_counter() - started:.3f}s")
+
+if os.environ.get('PRIME_ON_INIT', '').lower() == 'true':
+    prime()
 
 def knowledge_base_retrieval(prompt):
-    kb_id = os.environ['KB_ID']
+    # Records the prompt names by a catalogued facet value (county, year) are fetched with a metadata filter
+    try:
+        record_filter = metadata_filter(prompt, get_catalog().get().get("datasets", {}))
+    except Exception as e:
+        print(f"DEBUG: Could not build a metadata filter: {e}")
+        record_filter = None
+    if record_filter:
+        print(f"DEBUG: Metadata filter: {json.dumps(record_filter)}")
+    # Start small and widen only when the first pass is weak; see retrieval.adaptive_retrieval
+    return adaptive_retrieval(
+        get_agent_client(),
+        os.environ['KB_ID'],
+        prompt,
+        initial_k=RETRIEVAL_INITIAL_K,
+        max_k=RETRIEVAL_MAX_K,
+        min_score=RETRIEVAL_MIN_SCORE,
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        metadata_filter=record_filter,
+    )
+
+def lambda_handler(event, context):
+    """
+    Answers one prompt over the WebSocket connection, answers a batch of
+    questions, or replays a completed answer when the event asks to resume one. The spans of every phase are
+    exported at the end, under the trace the opener started when it passes a
+    traceContext ({"traceId", "spanId", "receivedAt", "sentAt"}).
+    """
+    started = time.time()
+    trace_context = event.get("traceContext") or {}
+    tracer = Tracer.from_context(trace_context, get_span_exporter())
+    if trace_context.get("sentAt"):
+        # The opener's own work and the asynchronous invoke hop, from its timestamps
+        tracer.record("opener", trace_context.get("receivedAt", trace_context["sentAt"]), trace_context["sentAt"])
+        tracer.record("invoke_hop", trace_context["sentAt"], started)
+    try:
+        with tracer.start("agent", start=started, session_id=event.get("sessionId", "")):
+            if event.get("resume"):
+                return resume_stream(event, tracer)
+            if event.get("batch"):
+                deadline = time.time() + (context.get_remaining_time_in_millis() / 1000 - 10 if context is not None else 600)
+                return handle_batch(event, tracer, deadline)
+            return handle_prompt(event, tracer)
+    finally:
+        if trace_context.get("spanId"):
+            tracer.record("request", trace_context.get("receivedAt", started), tracer.clock(), parent_id=None, span_id=trace_context["spanId"])
+        tracer.flush()
 
-    query = {"text": prompt}
-    # Retrieve relevant information from the Knowledge Base
-    retrieval_configuration = {
-        'vectorSearchConfiguration': {
-            'numberOfResults': 15,
+def resume_stream(event, tracer):
+    """
+    Replays the frames of a completed answer from resume.fromSeq on, on the
+    client's current connection, without running the agent again. A stream that
+    is unknown, expired, from another session or still being answered gets a
+    stream_unavailable frame instead, whose reason ("pending" or "expired") tells
+    the client whether asking again later can help.
+    """
+    connection_id = event.get("connectionId")
+    stream_id = event["resume"].get("streamId")
+    from_seq = int(event["resume"].get("fromSeq") or 0)
+    print(f"DEBUG: Resuming stream {stream_id} from seq {from_seq}")
+
+    with tracer.start("resume", stream_id=stream_id or "") as span:
+        frames, reason = get_stream_store().get(stream_id, event.get("sessionId", ""))
+        span.set(found=frames is not None)
+    if frames is None:
+        data = {
+            "statusCode": 404,
+            "type": "stream_unavailable",
+            "streamId": stream_id,
+            "reason": reason
+        }
+        post_to_connection(tracer, connection_id, data)
+        return {
+            'statusCode': 404,
+            'body': json.dumps({'result': 'Stream unavailable'})
         }
+
+    for frame in frames:
+        if frame["seq"] >= from_seq:
+            post_to_connection(tracer, connection_id, frame)
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'result': 'Stream resumed'})
     }
-    # For 5 responses hardcoded
-    kb_response = agent_client.retrieve(knowledgeBaseId=kb_id, retrievalQuery=query, retrievalConfiguration=retrieval_configuration)
-    # kb_response = agent_client.retrieve(knowledgeBaseId=kb_id, retrievalQuery=query)
-    return kb_response
 
-def lambda_handler(event, context):
+def send_answer(tracer, stream, raw_files):
+    """
+    Sends the files frame, when the code interpreter returned files, and then the
+    final_text frame that ends the stream.
+    """
+    if raw_files:
+        # Recompressed/gzipped, with previews inline and large content behind presigned URLs
+        with tracer.start("artifacts", files=len(raw_files)):
+            files = build_files(raw_files, get_s3_client(), os.environ.get('STATE_BUCKET_NAME'))
+        stream.files(files)
 
-    connection_id = event.get("connectionId")
-    prompt = event.get("prompt", "")
-    session_id = event.get("sessionId", "")
-    print(f"DEBUG: Received prompt: {prompt}")
+    stream.final()
 
-    kb_response = knowledge_base_retrieval(prompt)
-    print("DEBUG: Knowledge Base response:")
-    print(kb_response)
-    sources = []
-    rag_info_lines = []
+def store_stream(stream, session_id):
+    try:
+        get_stream_store().put(stream.stream_id, session_id, stream.frames)
+    except Exception as e:
+        print(f"DEBUG: Could not store stream {stream.stream_id}: {e}")
+
+def answer_from_documents(prompt, stream, text_chunks, span):
+    """
+    Answers a document question with a single retrieve_and_generate_stream call,
+    streaming the output as delta frames and collecting it in text_chunks.
+    """
+    request = retrieve_and_generate_request(
+        prompt,
+        os.environ['KB_ID'],
+        os.environ['MODEL_ARN'],
+        RETRIEVAL_INITIAL_K,
+        os.environ.get('GUARDRAIL_ID'),
+        os.environ.get('GUARDRAIL_VERSION'),
+    )
+    response = get_agent_client().retrieve_and_generate_stream(**request)
+    citations = 0
+    for event_chunk in response["stream"]:
+        if "output" in event_chunk:
+            text_part = event_chunk["output"].get("text", "")
+            if text_part:
+                if "first_token_ms" not in span.attributes:
+                    span.set(first_token_ms=round((span.tracer.clock() - span.start) * 1000, 1))
+                text_chunks.append(text_part)
+                stream.delta(text_part)
+        elif "citation" in event_chunk:
+            citations += 1
+        elif "guardrail" in event_chunk:
+            print(f"DEBUG: Guardrail action: {event_chunk['guardrail'].get('action')}")
+    span.set(citations=citations)
 
-    retrieval_results = kb_response.get("retrievalResults") or []
-    for result in retrieval_results:
-        metadata = result.get("metadata") or {}
-        source_uri = metadata.get('x-amz-bedrock-kb-source-uri', "")
-        
+def rag_context(retrieval):
+    """
+    The packed context chunks (retrieval["context"], already within
+    CONTEXT_TOKEN_BUDGET) as "<filename> >> <chunk text>" lines.
+    """
+    rag_info_lines = []
+    for result in retrieval["context"]:
+        uri = source_uri(result)
         # Safely extract the filename from the S3 URI if available
-        filename = os.path.basename(source_uri) if source_uri else "Unknown"
-        
-        sources.append({
-            "s3_uri": source_uri,
-        })
-        
-        content = result.get("content") or {}
-        text = content.get("text", "")
-        rag_info_lines.append(f"{filename} >> {text}")
-
-    rag_info = "\n".join(rag_info_lines)
+        filename = os.path.basename(uri) if uri else "Unknown"
+        rag_info_lines.append(f"{filename} >> {chunk_text(result)}")
+    return "\n".join(rag_info_lines)
 
-    print("DEBUG: Combined RAG info:")
-    print(rag_info)
-    print("DEBUG: Sources:")
-    print(sources)
-    
+def record_lookup(prompt, tracer):
+    """
+    Exact counts and rows for the counties, years and last names the prompt names,
+    from the lookup indexes of catalogued datasets. Returns one {"s3_uri",
+    "context"} per matching dataset, the context being lines for the supervisor.
+    """
+    with tracer.start("record_lookup") as span:
+        found = []
+        try:
+            for entry in get_catalog().get().get("datasets", {}).values():
+                index = get_record_indexes().get(entry["index"]) if entry.get("index") else None
+                result = lookup(prompt, index) if index else None
+                if result:
+                    found.append({"s3_uri": f"s3://{os.environ.get('BUCKET_NAME')}/{entry['key']}",
+                                  "context": describe(os.path.basename(entry["key"]), result)})
+        except Exception as e:
+            print(f"DEBUG: Record lookup failed: {e}")
+        span.set(matches=len(found))
+    return found
+
+def select_csv_files(prompt, sources, tracer):
+    """
+    The CSVs (up to five) for the supervisor's code interpreter: the CSV sources
+    the retrieval found, or the catalogued datasets that match the prompt.
+    """
     # Prepare CSV files from sources (up to five)
     csv_files = [src for src in sources if src.get("s3_uri", "").lower().endswith(".csv")]
     # remove duplicates
@@ -70,6 +302,49 @@ def lambda_handler(event, context):
     print("DEBUG: FINAL CSV files:")
     csv_files = csv_files[:5]  # Limit to up to 5 CSV files
     print(csv_files)
+
+    # Vector search found no CSVs; fall back to the catalogued datasets whose name or columns match the prompt
+    if not csv_files:
+        with tracer.start("catalog_discovery"):
+            catalog = get_catalog()
+            csv_files = [{"s3_uri": uri} for uri in catalog.discover(prompt, os.environ.get('BUCKET_NAME'), limit=5)]
+        print(f"DEBUG: CSV files discovered from catalog version {catalog.version}:")
+        print(csv_files)
+    return csv_files
+
+def conversation_history(history):
+    """
+    The session's earlier exchanges the supervisor did not answer itself, as
+    sessionState.conversationHistory. Its own turns are already in the agent's
+    session memory.
+    """
+    messages = []
+    for entry in history:
+        if entry.get("route") != DATA and entry.get("answer"):
+            messages.append({"role": "user", "content": [{"text": entry["question"]}]})
+            messages.append({"role": "assistant", "content": [{"text": entry["answer"]}]})
+    return {"messages": messages} if messages else None
+
+def answer_with_supervisor(prompt, session_id, csv_files, stream, tracer, rag_info="", history=()):
+    """
+    Has the supervisor agent answer with csv_files attached to its code
+    interpreter, rag_info (see rag_context) as a prompt session attribute and
+    the turns of the session it did not answer (see conversation_history),
+    streaming deltas and rationale as frames. Returns the text chunks and the
+    files the code interpreter returned.
+    """
+    # Only attach the CSVs this session's code interpreter does not already have at this version
+    files_to_attach = csv_files
+    if csv_files and session_id:
+        with tracer.start("session_files") as span:
+            try:
+                for file in csv_files:
+                    file["version"] = object_version(get_s3_client(), get_catalog(), os.environ.get('BUCKET_NAME'), file["s3_uri"])
+                files_to_attach = get_session_files().pending(session_id, csv_files)
+            except Exception as e:
+                print(f"DEBUG: Session file lookup failed, attaching all CSV files: {e}")
+            span.set(files=len(csv_files), attached=len(files_to_attach))
+        print(f"DEBUG: {len(csv_files) - len(files_to_attach)} of {len(csv_files)} CSV files already attached to session {session_id}")
     
     # Prepare invocation parameters
     invocation_params = {
@@ -80,54 +355,68 @@ def lambda_handler(event, context):
         'inputText': prompt,
     }
 
-    if csv_files:
-        invocation_params['sessionState'] = {
-            'files': [
-                {
-                    'name': os.path.basename(file["s3_uri"]),
-                    'source': {
-                        's3Location': {
-                            'uri': file["s3_uri"]
-                        },
-                        'sourceType': 'S3',
+    session_state = {}
+    # The packed chunks go into the orchestration prompt for this turn only, so the
+    # supervisor starts from the budgeted context instead of searching again
+    if rag_info:
+        session_state['promptSessionAttributes'] = {'retrieved_context': rag_info}
+    earlier = conversation_history(history)
+    if earlier:
+        session_state['conversationHistory'] = earlier
+    if files_to_attach:
+        session_state['files'] = [
+            {
+                'name': os.path.basename(file["s3_uri"]),
+                'source': {
+                    's3Location': {
+                        'uri': file["s3_uri"]
                     },
-                    'useCase': 'CODE_INTERPRETER'
-                }
-                for file in csv_files
-            ]
-        }
+                    'sourceType': 'S3',
+                },
+                'useCase': 'CODE_INTERPRETER'
+            }
+            for file in files_to_attach
+        ]
+    if session_state:
+        invocation_params['sessionState'] = session_state
     print("DEBUG: Invocation parameters:")
     print(invocation_params)
     
-    max_attempts = 3
-    for attempt in range(max_attempts):
-        try:
-            # Attempt to invoke the agent
-            response = agent_client.invoke_agent(**invocation_params)
-            print("DEBUG: invoke_agent response received. Now streaming...")
-            break  # Exit loop on success
-        except Exception as e:
-            error_message = str(e)
-            print(f"ERROR on attempt {attempt+1}: {error_message}")
-            # Check for errors that indicate a transient dependency issue
-            if ("internalServerException" in error_message or "dependencyFailedException" in error_message):
-                if attempt < max_attempts - 1:
-                    wait_time = 2 ** (attempt + 1)  # Exponential backoff: 2, 4, 8 seconds...
-                    print(f"Retrying after {wait_time} seconds...")
-                    time.sleep(wait_time)
-                    continue
+    with tracer.start("invoke_agent") as invoke_span:
+        max_attempts = 3
+        for attempt in range(max_attempts):
+            try:
+                # Attempt to invoke the agent
+                response = get_agent_client().invoke_agent(**invocation_params)
+                print("DEBUG: invoke_agent response received. Now streaming...")
+                invoke_span.set(attempts=attempt + 1)
+                break  # Exit loop on success
+            except Exception as e:
+                error_message = str(e)
+                print(f"ERROR on attempt {attempt+1}: {error_message}")
+                # Check for errors that indicate a transient dependency issue
+                if ("internalServerException" in error_message or "dependencyFailedException" in error_message):
+                    if attempt < max_attempts - 1:
+                        wait_time = 2 ** (attempt + 1)  # Exponential backoff: 2, 4, 8 seconds...
+                        print(f"Retrying after {wait_time} seconds...")
+                        time.sleep(wait_time)
+                        continue
+                    else:
+                        print("Max retries reached. Raising exception.")
+                        raise
                 else:
-                    print("Max retries reached. Raising exception.")
+                    # For other errors, don't retry
                     raise
-            else:
-                # For other errors, don't retry
-                raise
 
 
     # Gather final text and returned files
     final_text_chunks = []
     returned_files = []
 
+    # Streaming covers the agent's orchestration (model calls, code interpreter, collaborators)
+    stream_span = tracer.start("stream")
+    orchestration = OrchestrationSpans(tracer, stream_span.span_id)
+
     for event_chunk in response.get("completion", []):
         print(f"DEBUG: event_chunk => {event_chunk}")
 
@@ -135,6 +424,8 @@ def lambda_handler(event, context):
         if "chunk" in event_chunk:
             chunk_bytes = event_chunk["chunk"].get("bytes", b"")
             chunk_str = chunk_bytes.decode("utf-8", errors="replace").strip()
+            if "first_token_ms" not in stream_span.attributes:
+                stream_span.set(first_token_ms=round((tracer.clock() - stream_span.start) * 1000, 1))
 
             print(f"DEBUG: Received chunk string => {chunk_str!r}")
 
@@ -149,18 +440,8 @@ def lambda_handler(event, context):
             except json.JSONDecodeError:
                 # Not JSON => raw text from the model
                 print("DEBUG: chunk_str is raw text (non-JSON). Forwarding to client.")
-                block_type = "delta"
                 final_text_chunks.append(chunk_str)
-
-                data = {
-                    "statusCode": 200,
-                    "type": block_type,
-                    "text": chunk_str
-                }
-                gateway.post_to_connection(
-                    ConnectionId=connection_id,
-                    Data=json.dumps(data)
-                )
+                stream.delta(chunk_str)
                 continue
 
             # If JSON parsed successfully, see what keys we have
@@ -171,16 +452,7 @@ def lambda_handler(event, context):
                 print("DEBUG: Found 'contentBlockDelta' in chunk_json.")
                 text_part = chunk_json["contentBlockDelta"]["delta"].get("text", "")
                 final_text_chunks.append(text_part)
-
-                data = {
-                    "statusCode": 200,
-                    "type": "delta",
-                    "text": text_part
-                }
-                gateway.post_to_connection(
-                    ConnectionId=connection_id,
-                    Data=json.dumps(data)
-                )
+                stream.delta(text_part)
 
             elif "messageStop" in chunk_json:
                 print("DEBUG: Found 'messageStop' in chunk_json.")
@@ -191,22 +463,14 @@ def lambda_handler(event, context):
         # CASE 2: "files"
         elif "files" in event_chunk:
             print(f"DEBUG: Found 'files' => {event_chunk['files']}")
-            for f in event_chunk["files"]["files"]:
-                file_bytes = f.get("bytes", b"")
-                filename = f.get("name", "unknown")
-                file_type = f.get("type", "unknown")
-
-                b64_data = base64.b64encode(file_bytes).decode("utf-8")
-                returned_files.append({
-                    "filename": filename,
-                    "type": file_type,
-                    "base64": b64_data
-                })
+            # Encoded once the stream ends, so the frame's inline budget covers every file
+            returned_files.extend(event_chunk["files"]["files"])
 
         # CASE 3: "trace"
         elif "trace" in event_chunk:
             trace_obj0 = event_chunk["trace"]
             trace_obj1 = trace_obj0.get("trace")
+            orchestration.on_trace(trace_obj0)
 
             # Check if orchestrationTrace exists
             orchestration_trace = trace_obj1.get("orchestrationTrace")
@@ -215,15 +479,7 @@ def lambda_handler(event, context):
                 if rationale_obj and "text" in rationale_obj:
                     rationale_text = rationale_obj["text"]
                     print(f"DEBUG: Found rationale text: {rationale_text}")
-                    data = {
-                        "statusCode": 200,
-                        "type": "thinking",
-                        "text": rationale_text
-                    }
-                    gateway.post_to_connection(
-                        ConnectionId=connection_id,
-                        Data=json.dumps(data)
-                    )
+                    stream.thinking(rationale_text)
                 else:
                     print("DEBUG: No rationale text in rationale_obj.")
             else:
@@ -234,30 +490,314 @@ def lambda_handler(event, context):
             print(f"DEBUG: Unhandled event => {event_chunk}")
 
     # After the stream loop ends
-    final_text = "".join(final_text_chunks).strip()
-    if final_text:
-        data = {
-            "statusCode": 200,
-            "type": "final_text",
-            "text": final_text
+    orchestration.close()
+    stream_span.end(text_chunks=len(final_text_chunks), files=len(returned_files))
+
+    if csv_files and session_id:
+        try:
+            get_session_files().record(session_id, csv_files)
+        except Exception as e:
+            print(f"DEBUG: Could not record attached files for session {session_id}: {e}")
+
+    return final_text_chunks, returned_files
+
+def route_and_answer(prompt, session_id, retrieval, sources, follow_up, stream, tracer, history=(), csv_files=None):
+    """
+    Answers one prompt on its route and returns the text chunks, the returned
+    files and the route that answered it.
+    Document questions are answered by one retrieve-and-generate call; data
+    questions, and document answers that fail before producing text, go to the
+    supervisor with csv_files, which are picked from sources when not given, the
+    retrieval's packed context and whatever the lookup indexes hold for the
+    records the prompt names.
+    """
+    indexed = record_lookup(prompt, tracer)
+    with tracer.start("route") as span:
+        route, reason = classify(prompt, retrieval, ROUTING_MIN_SCORE, follow_up)
+        if route == DOCUMENTS and indexed:
+            route, reason = DATA, "names indexed records"
+        if not os.environ.get('MODEL_ARN'):
+            route, reason = DATA, "document routing disabled"
+        span.set(route=route, reason=reason)
+    print(f"DEBUG: Route: {route} ({reason})")
+
+    final_text_chunks, returned_files = [], []
+    if route == DOCUMENTS:
+        try:
+            with tracer.start("retrieve_and_generate") as span:
+                answer_from_documents(prompt, stream, final_text_chunks, span)
+        except Exception as e:
+            if final_text_chunks:
+                raise
+            print(f"DEBUG: Retrieve and generate failed, using the supervisor: {e}")
+            route = DATA
+    if route == DATA:
+        # The datasets the lookup matched come first, so they are always attached
+        indexed_files = [{"s3_uri": found["s3_uri"]} for found in indexed]
+        if csv_files is None:
+            csv_files = select_csv_files(prompt, indexed_files + sources, tracer)
+        else:
+            csv_files = list({file["s3_uri"]: file for file in indexed_files + csv_files}.values())[:5]
+        rag_info = "\n".join([found["context"] for found in indexed] + [rag_context(retrieval)]).strip()
+        final_text_chunks, returned_files = answer_with_supervisor(prompt, session_id, csv_files, stream, tracer, rag_info, history)
+    return final_text_chunks, returned_files, route
+
+def start_turn(session_id, tracer):
+    """
+    Starts the prompt's turn of its session and returns the session's earlier
+    exchanges, from the session store rather than anything the client sends.
+    None when the store cannot be read, which treats the prompt as a follow-up
+    and only costs the shortcuts.
+    """
+    if not session_id:
+        return []
+    with tracer.start("session_history") as span:
+        try:
+            history = get_session_files().begin_turn(session_id)
+        except Exception as e:
+            print(f"DEBUG: Could not read the history of session {session_id}, treating it as a follow-up: {e}")
+            history = None
+        span.set(earlier_turns=-1 if history is None else len(history))
+    return history
+
+def record_exchange(session_id, prompt, final_text, route):
+    if not session_id:
+        return
+    try:
+        get_session_files().record_exchange(session_id, prompt, final_text, route)
+    except Exception as e:
+        print(f"DEBUG: Could not record the turn in session {session_id}: {e}")
+
+def cached_answer(prompt, tracer):
+    """
+    The answer precomputed for prompt against the current data version, or None.
+    """
+    with tracer.start("answer_cache") as span:
+        try:
+            data_version = get_catalog().version
+            cached = get_answer_cache().get(prompt, data_version)
+        except Exception as e:
+            print(f"DEBUG: Answer cache lookup failed: {e}")
+            cached = None
+        span.set(hit=cached is not None)
+    if cached:
+        print(f"DEBUG: Serving precomputed answer for data version {data_version}")
+    return cached
+
+def handle_prompt(event, tracer):
+    connection_id = event.get("connectionId")
+    prompt = event.get("prompt", "")
+    session_id = event.get("sessionId", "")
+    # Set by AnswerPrecompute: answer without a connection and cache the result under dataVersion
+    precompute = bool(event.get("precompute"))
+    # Logged differently so tools/build_frequent_questions.py only counts user prompts
+    print(f"DEBUG: {'Precomputing' if precompute else 'Received'} prompt: {prompt}")
+    # The client names the stream so it can resume it even if it missed every frame
+    stream = AnswerStream(event.get("streamId") or uuid.uuid4().hex, lambda data: post_to_connection(tracer, connection_id, data))
+
+    try:
+        return answer_prompt(event, prompt, session_id, precompute, stream, tracer)
+    except Exception as e:
+        if precompute:
+            # AnswerPrecompute counts the failure from the function error
+            raise
+        print(f"DEBUG: Answering failed: {e}")
+        try:
+            stream.error(str(e))
+        except Exception as send_error:
+            print(f"DEBUG: Could not send the error frame: {send_error}")
+        # Stored like an answer, so a client resuming the stream gets the error instead of waiting
+        store_stream(stream, session_id)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'result': 'Answering failed'})
         }
-        gateway.post_to_connection(
-            ConnectionId=connection_id,
-            Data=json.dumps(data)
-        )
 
-    if returned_files:
-        data = {
-            "statusCode": 200,
-            "type": "files",
-            "files": returned_files
+def answer_prompt(event, prompt, session_id, precompute, stream, tracer):
+    """
+    Answers one prompt on stream: from the answer cache, or retrieved, routed and
+    answered by the agent. A precomputed answer is put into the answer cache
+    instead of being sent.
+    """
+    history = [] if precompute else start_turn(session_id, tracer)
+    follow_up, reason = is_follow_up(prompt, history)
+    print(f"DEBUG: Follow-up: {follow_up} ({reason})")
+
+    # Frequent questions answered against the current data are served without the agent.
+    # A follow-up may give the same words another meaning, so it always goes to the agent.
+    if not precompute and not follow_up:
+        cached = cached_answer(prompt, tracer)
+        if cached:
+            # A follow-up to it goes to the supervisor, which needs to see this turn
+            record_exchange(session_id, prompt, cached["text"], "cache")
+            stream.delta(cached["text"])
+            send_answer(tracer, stream, decode_files(cached.get("files", [])))
+            store_stream(stream, session_id)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'result': 'Answered from cache'})
+            }
+
+    with tracer.start("retrieve") as span:
+        retrieval = knowledge_base_retrieval(prompt)
+        span.set(**retrieval["stats"])
+    print("DEBUG: Retrieval stats:")
+    print(retrieval["stats"])
+
+    # Every deduplicated source is a CSV candidate (per-record documents stand for
+    # the CSV they were cut from); only the chunks within the token budget make up
+    # the context text.
+    sources = [{"s3_uri": dataset_uri(result)} for result in retrieval["candidates"]]
+
+    print("DEBUG: Combined RAG info:")
+    print(rag_context(retrieval))
+    print("DEBUG: Sources:")
+    print(sources)
+    
+    final_text_chunks, returned_files, route = route_and_answer(prompt, session_id, retrieval, sources, follow_up, stream, tracer,
+                                                                history or ())
+
+    final_text = "".join(final_text_chunks).strip()
+    if precompute:
+        if not final_text:
+            raise RuntimeError("The agent returned no answer")
+        digest = get_answer_cache().put(prompt, event["dataVersion"], final_text, returned_files)
+        print(f"DEBUG: Stored precomputed answer {digest} for data version {event['dataVersion']}")
+        return {
+            'statusCode': 200,
+            'questionHash': digest,
+            'dataVersion': event["dataVersion"]
         }
-        gateway.post_to_connection(
-            ConnectionId=connection_id,
-            Data=json.dumps(data)
-        )
+
+    # Recorded before the final frame, so a follow-up sent right after it finds the turn
+    record_exchange(session_id, prompt, final_text, route)
+    send_answer(tracer, stream, returned_files)
+    store_stream(stream, session_id)
 
     return {
         'statusCode': 200,
         'body': json.dumps({'result': 'Streaming complete'})
     }
+
+def handle_batch(event, tracer, deadline):
+    """
+    Answers a batch of related questions for a report ({"batch": {"batchId",
+    "questions"}}). Questions are grouped by the catalogued dataset each matches
+    best (see retrieval.group_related); each group shares one retrieval pass over its
+    combined text and one set of CSVs. A group's questions are answered in
+    order in agent sessions of up to BATCH_SESSION_QUESTIONS, so each session
+    attaches the CSVs once, and up to BATCH_CONCURRENCY sessions run at once.
+    Each question is streamed as its own stream (<batchId>-<index>), whose frames
+    carry batchId and questionIndex and can be resumed like any other. A
+    batch_complete frame, outside any stream, ends the batch.
+    """
+    connection_id = event.get("connectionId")
+    session_id = event.get("sessionId") or ""
+    batch_id = event["batch"].get("batchId") or uuid.uuid4().hex
+    questions = [str(question) for question in event["batch"].get("questions", [])][:MAX_BATCH_QUESTIONS]
+    print(f"DEBUG: Received batch {batch_id} of {len(questions)} questions")
+
+    # Clients are shared by the worker threads, and building them is not thread-safe
+    get_agent_client()
+    get_gateway()
+    get_s3_client()
+    get_catalog()
+    get_record_indexes()
+    get_session_files()
+    get_answer_cache()
+    get_stream_store()
+    batch_span = tracer.start("batch", questions=len(questions), concurrency=BATCH_CONCURRENCY)
+
+    with tracer.start("group") as span:
+        try:
+            # Only the best match: generic column words like "date" would otherwise join every dataset
+            datasets = [set(get_catalog().discover(question, os.environ.get('BUCKET_NAME'), limit=1)) for question in questions]
+        except Exception as e:
+            print(f"DEBUG: Could not match the batch questions to datasets, answering each on its own: {e}")
+            datasets = [set() for _ in questions]
+        groups = group_related(datasets)
+        span.set(groups=len(groups))
+    print(f"DEBUG: Batch {batch_id} groups: {groups}")
+
+    def prepare(group):
+        # One retrieval pass and one CSV set for the group's questions
+        group_tracer = Tracer(tracer.trace_id, batch_span.span_id, tracer.exporter, tracer.clock)
+        try:
+            query = batch_query([questions[index] for index in group])
+            with group_tracer.start("retrieve", questions=len(group)) as span:
+                retrieval = knowledge_base_retrieval(query)
+                span.set(**retrieval["stats"])
+            sources = [{"s3_uri": dataset_uri(result)} for result in retrieval["candidates"]]
+            # The datasets the group was formed on come first, so they are always attached
+            matched = [{"s3_uri": uri} for uri in sorted(set().union(*(datasets[index] for index in group)))]
+            return {"retrieval": retrieval, "sources": sources, "csv_files": select_csv_files(query, matched + sources, group_tracer)}
+        except Exception as e:
+            print(f"DEBUG: Retrieval for batch questions {group} failed: {e}")
+            return {"error": str(e)}
+        finally:
+            group_tracer.flush()
+
+    def answer(index, shared, question_session):
+        question = questions[index]
+        # The tracer is not thread-safe; every question records its spans on its own under the batch span
+        question_tracer = Tracer(tracer.trace_id, batch_span.span_id, tracer.exporter, tracer.clock)
+        stream = AnswerStream(f"{batch_id}-{index}", lambda data: post_to_connection(question_tracer, connection_id, data),
+                              batchId=batch_id, questionIndex=index)
+        if time.time() + QUESTION_TIMEOUT_SECONDS > deadline:
+            stream.error("The batch ran out of time before this question was started.")
+            # Stored like an answer, so a client resuming the question gets the error instead of waiting
+            store_stream(stream, session_id)
+            return {"index": index, "status": "skipped"}
+        try:
+            with question_tracer.start("question", index=index):
+                print(f"DEBUG: Received prompt: {question}")
+                cached = cached_answer(question, question_tracer)
+                if cached:
+                    stream.delta(cached["text"])
+                    send_answer(question_tracer, stream, decode_files(cached.get("files", [])))
+                else:
+                    if "error" in shared:
+                        raise RuntimeError(shared["error"])
+                    # Copies, as the session's version lookups annotate them
+                    _, returned_files, _ = route_and_answer(question, question_session, shared["retrieval"], shared["sources"], False,
+                                                            stream, question_tracer, csv_files=[dict(file) for file in shared["csv_files"]])
+                    send_answer(question_tracer, stream, returned_files)
+            store_stream(stream, session_id)
+            return {"index": index, "status": "succeeded"}
+        except Exception as e:
+            print(f"DEBUG: Batch question {index} failed: {e}")
+            stream.error(str(e))
+            store_stream(stream, session_id)
+            return {"index": index, "status": "failed", "error": str(e)}
+        finally:
+            question_tracer.flush()
+
+    # A session's questions run one after another, so they never queue behind each other inside the agent
+    sessions = [(number, group[start:start + BATCH_SESSION_QUESTIONS])
+                for number, group in enumerate(groups) for start in range(0, len(group), BATCH_SESSION_QUESTIONS)]
+
+    def run(session):
+        number, indexes = session
+        question_session = f"{session_id[:36] or 'batch'}-{batch_id[:32]}-{number}-{indexes[0]}"
+        return [answer(index, shared[number], question_session) for index in indexes]
+
+    workers = max(1, min(BATCH_CONCURRENCY, len(sessions)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        shared = list(executor.map(prepare, groups))
+        results = sorted((result for session in executor.map(run, sessions) for result in session), key=lambda result: result["index"])
+    answered = sum(1 for result in results if result["status"] == "succeeded")
+    batch_span.end(answered=answered, sessions=len(sessions))
+
+    data = {
+        "statusCode": 200,
+        "type": "batch_complete",
+        "batchId": batch_id,
+        "questions": len(questions),
+        "answered": answered,
+        "failed": [result for result in results if result["status"] != "succeeded"]
+    }
+    post_to_connection(tracer, connection_id, data)
+    return {
+        'statusCode': 200 if answered == len(questions) else 207,
+        'body': json.dumps({'result': f'Answered {answered} of {len(questions)} questions'})
+    }
@@ -0,0 +1,132 @@
+import re
+import json
+import time
+from datetime import date
+from botocore.exceptions import ClientError
+
+# Four-digit years a prompt may name as a received year
+YEAR_PATTERN = re.compile(r"\b(?:19|20)\d{2}\b")
+# Capitalized words, the candidates for a last name
+NAME_PATTERN = re.compile(r"\b[A-Z][A-Za-z'\-]{2,}\b")
+LAST_NAME_PREFIX_LENGTH = 2
+
+
+def normalized(text):
+    return " " + " ".join(re.findall(r"[a-z0-9]+", (text or "").lower())) + " "
+
+
+def whole_years_between(start, end):
+    years = end.year - start.year
+    if (end.month, end.day) < (start.month, start.day):
+        years -= 1
+    return years
+
+
+class RecordIndexCache:
+    """
+    Warm-container copies of the lookup indexes the scrapers publish next to their
+    datasets (the catalog entry's "index" key in the state bucket), revalidated
+    like the catalog: at most every `ttl` seconds, with a conditional GET. Any
+    failure leaves the last good copy in place.
+    """
+
+    def __init__(self, s3_client, bucket, ttl=60, clock=time.monotonic):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.ttl = ttl
+        self.clock = clock
+        self.indexes = {}   # key -> {"index", "etag", "checked_at"}
+
+    def get(self, key):
+        now = self.clock()
+        cached = self.indexes.setdefault(key, {"index": None, "etag": None, "checked_at": None})
+        if not self.bucket or (cached["checked_at"] is not None and now - cached["checked_at"] < self.ttl):
+            return cached["index"]
+        cached["checked_at"] = now
+        params = {"Bucket": self.bucket, "Key": key}
+        if cached["etag"]:
+            params["IfNoneMatch"] = cached["etag"]
+        try:
+            response = self.s3_client.get_object(**params)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("304", "NotModified", "NoSuchKey"):
+                print(f"DEBUG: Index {key} refresh failed, keeping the previous copy: {e}")
+            return cached["index"]
+        try:
+            cached["index"] = json.loads(response["Body"].read())
+            cached["etag"] = response["ETag"]
+        except ValueError as e:
+            print(f"DEBUG: Index {key} is not valid JSON, keeping the previous copy: {e}")
+        return cached["index"]
+
+
+def lookup(prompt, index, today=None):
+    """
+    Answers the filters a prompt names from an index document: trial counties and
+    received years it mentions, and capitalized words that are last names on the
+    list. Values of one filter are alternatives; different filters narrow each
+    other. Returns {"filters", "count", "columns", "rows"} with years_on_list
+    added to every row as of today, or None when the prompt names no indexed value.
+    """
+    indexes = index.get("indexes", {})
+    text = normalized(prompt)
+    matched = {}
+
+    counties = [key for key in indexes.get("by_trial_county", {}) if normalized(key) in text]
+    if counties:
+        matched["trial_county"] = (counties, {p for key in counties for p in indexes["by_trial_county"][key]["rows"]})
+
+    years = sorted({year for year in YEAR_PATTERN.findall(prompt or "") if year in indexes.get("by_received_year", {})})
+    if years:
+        matched["received_year"] = (years, {p for year in years for p in indexes["by_received_year"][year]["rows"]})
+
+    columns = index.get("columns", [])
+    rows = index.get("rows", [])
+    last_name = columns.index("last_name") if "last_name" in columns else None
+    names, positions = [], set()
+    for word in NAME_PATTERN.findall(prompt or ""):
+        entry = indexes.get("by_last_name_prefix", {}).get(word[:LAST_NAME_PREFIX_LENGTH].upper())
+        if entry is None or last_name is None:
+            continue
+        # The prefix index narrows the rows to compare; only exact last names count
+        hits = {p for p in entry["rows"] if rows[p][last_name].lower() == word.lower()}
+        if hits:
+            names.append(word)
+            positions |= hits
+    if names:
+        matched["last_name"] = (names, positions)
+
+    if not matched:
+        return None
+    selected = set.intersection(*(positions for _, positions in matched.values()))
+
+    today = today or date.today()
+    received = columns.index("received_date") if "received_date" in columns else None
+    result_rows = []
+    for position in sorted(selected):
+        row = list(rows[position])
+        years_on_list = None
+        if received is not None and row[received]:
+            years_on_list = whole_years_between(date.fromisoformat(row[received]), today)
+        result_rows.append(row + [years_on_list])
+    return {
+        "filters": {name: values for name, (values, _) in matched.items()},
+        "count": len(selected),
+        "columns": columns + ["years_on_list"],
+        "rows": result_rows,
+    }
+
+
+def describe(dataset, result, limit=20):
+    """
+    The lookup result as context lines for the supervisor: the exact count, then up
+    to `limit` matching rows as CSV.
+    """
+    filters = ", ".join(f"{name} in {values}" for name, values in result["filters"].items())
+    lines = [f"{dataset} index >> {result['count']} rows with {filters} (years_on_list as of today)"]
+    lines.append(",".join(result["columns"]))
+    for row in result["rows"][:limit]:
+        lines.append(",".join("" if value is None else str(value) for value in row))
+    if result["count"] > limit:
+        lines.append(f"... {result['count'] - limit} more rows in {dataset}")
+    return "\n".join(lines)
@@ -0,0 +1,251 @@
+import re
+import math
+from collections import Counter
+
+SOURCE_URI_KEY = "x-amz-bedrock-kb-source-uri"
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def words(text):
+    return WORD_PATTERN.findall((text or "").lower())
+
+
+def source_uri(result):
+    return (result.get("metadata") or {}).get(SOURCE_URI_KEY, "")
+
+
+def dataset_uri(result):
+    """
+    The CSV a result comes from: per-record documents name theirs in the
+    "source_key" metadata attribute, in the same bucket as the document.
+    """
+    uri = source_uri(result)
+    source_key = (result.get("metadata") or {}).get("source_key")
+    if uri.startswith("s3://") and source_key:
+        return "s3://" + uri[len("s3://"):].split("/", 1)[0] + "/" + source_key
+    return uri
+
+
+def chunk_text(result):
+    return (result.get("content") or {}).get("text", "")
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English prose and CSV rows.
+    return len(text) // 4 + 1
+
+
+def shingles(text, size=5):
+    tokens = words(text)
+    if len(tokens) <= size:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def retrieve(agent_client, kb_id, prompt, k, metadata_filter=None):
+    search = {"numberOfResults": k}
+    if metadata_filter:
+        search["filter"] = metadata_filter
+    response = agent_client.retrieve(
+        knowledgeBaseId=kb_id,
+        retrievalQuery={"text": prompt},
+        retrievalConfiguration={"vectorSearchConfiguration": search},
+    )
+    return response.get("retrievalResults") or []
+
+
+def batch_query(questions, limit=1000):
+    """
+    One retrieval query for a group of related questions: their text, in order and
+    without repeated words, cut at limit characters (the knowledge base's query
+    length limit).
+    """
+    seen, kept, length = set(), [], 0
+    for word in (w for question in questions for w in (question or "").split()):
+        key = word.lower().strip("?.,!;:")
+        if key in seen:
+            continue
+        if length + len(word) + 1 > limit:
+            break
+        seen.add(key)
+        kept.append(word)
+        length += len(word) + 1
+    return " ".join(kept)
+
+
+def group_related(datasets):
+    """
+    Groups questions by the datasets they are about: datasets[i] is the set of
+    dataset URIs question i matches, and questions sharing one, directly or
+    through other questions, form one group. A question matching none is a group
+    of its own. Returns lists of question indexes, in order of their first question.
+    """
+    groups = []   # (datasets, indexes)
+    for index, wanted in enumerate(datasets):
+        wanted = set(wanted)
+        overlapping = [group for group in groups if wanted and group[0] & wanted]
+        merged = (wanted.union(*(group[0] for group in overlapping)), sorted([index] + [i for group in overlapping for i in group[1]]))
+        groups = [group for group in groups if group not in overlapping] + [merged]
+    return [indexes for _, indexes in sorted(groups, key=lambda group: group[1][0])]
+
+
+def combine(operator, filters):
+    # andAll/orAll take at least two members
+    return filters[0] if len(filters) == 1 else {operator: filters}
+
+
+def metadata_filter(prompt, datasets):
+    """
+    Builds a knowledge base filter from the facet values the data catalog publishes
+    for per-record documents (entry["records"]["facets"]) that the prompt mentions,
+    e.g. {"andAll": [{"equals": {"key": "dataset", ...}}, {"equals": {"key": "trial_county",
+    "value": "Kern"}}]}. Datasets are alternatives (orAll); several values of one
+    attribute are too. None when the prompt mentions no facet value.
+    """
+    text = " " + " ".join(words(prompt)) + " "
+    per_dataset = []
+    for name, entry in datasets.items():
+        facets = (entry.get("records") or {}).get("facets") or {}
+        conditions = []
+        for attribute, facet in facets.items():
+            matched = [v for v in facet.get("values", []) if len(str(v)) >= 3 and " " + " ".join(words(str(v))) + " " in text]
+            if matched:
+                conditions.append(combine("orAll", [{"equals": {"key": attribute, "value": v}} for v in matched]))
+        if conditions:
+            per_dataset.append(combine("andAll", [{"equals": {"key": "dataset", "value": name}}] + conditions))
+    return combine("orAll", per_dataset) if per_dataset else None
+
+
+def needs_expansion(results, k, min_score, min_sources):
+    """
+    A small first pass is widened when it came back full (more results exist) and
+    either its best score is weak or it covers too few distinct documents.
+    """
+    if len(results) < k:
+        return False
+    scores = [r["score"] for r in results if r.get("score") is not None]
+    if scores and max(scores) < min_score:
+        return True
+    return len({source_uri(r) for r in results}) < min_sources
+
+
+def collapse_near_duplicates(results, threshold=0.8, max_per_source=3):
+    """
+    Keeps, per source document, only chunks that are not near-copies (shingle
+    Jaccard >= threshold) of a better-ranked chunk from the same document, and at
+    most max_per_source of them. Input order is treated as rank order.
+    """
+    kept, seen = [], {}
+    for result in results:
+        uri = source_uri(result)
+        fingerprint = shingles(chunk_text(result))
+        previous = seen.setdefault(uri, [])
+        if len(previous) >= max_per_source or any(jaccard(fingerprint, other) >= threshold for other in previous):
+            continue
+        previous.append(fingerprint)
+        kept.append(result)
+    return kept
+
+
+def lexical_scores(prompt, texts, k1=1.2, b=0.75):
+    """
+    BM25 over the candidate chunks themselves, normalized so the best chunk scores 1.
+    Document frequencies come from the candidates, which is enough to favour chunks
+    that contain the prompt's rarer terms.
+    """
+    query = set(words(prompt))
+    documents = [Counter(words(text)) for text in texts]
+    if not query or not documents:
+        return [0.0] * len(texts)
+    average_length = sum(sum(d.values()) for d in documents) / len(documents) or 1
+    frequency = Counter(term for d in documents for term in query if term in d)
+    scores = []
+    for d in documents:
+        length = sum(d.values())
+        score = 0.0
+        for term in query:
+            tf = d.get(term, 0)
+            if tf:
+                idf = math.log(1 + (len(documents) - frequency[term] + 0.5) / (frequency[term] + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+        scores.append(score)
+    best = max(scores)
+    return [s / best if best else 0.0 for s in scores]
+
+
+def rerank(prompt, results, vector_weight=0.7):
+    """
+    Orders results by a blend of the knowledge base's vector score and the local
+    lexical score. Each result gets a "rerank_score".
+    """
+    lexical = lexical_scores(prompt, [chunk_text(r) for r in results])
+    for result, lexical_score in zip(results, lexical):
+        result["rerank_score"] = vector_weight * (result.get("score") or 0.0) + (1 - vector_weight) * lexical_score
+    return sorted(results, key=lambda r: -r["rerank_score"])
+
+
+def pack_to_budget(results, max_tokens):
+    """
+    Takes results in order while they fit in max_tokens; a chunk too large for the
+    remaining budget is skipped so a smaller, lower-ranked one can still fit.
+    """
+    packed, used = [], 0
+    for result in results:
+        cost = estimate_tokens(chunk_text(result))
+        if used + cost <= max_tokens:
+            packed.append(result)
+            used += cost
+    return packed, used
+
+
+def adaptive_retrieval(agent_client, kb_id, prompt, initial_k=5, max_k=15, min_score=0.5,
+                       min_sources=2, duplicate_threshold=0.8, max_per_source=3, token_budget=2000,
+                       metadata_filter=None):
+    """
+    Retrieves initial_k chunks and only asks for max_k when the first pass looks
+    weak, then drops near-duplicate chunks per source, reranks lexically and packs
+    the best chunks into the context-token budget. With a metadata_filter, a
+    filtered pass over the per-record documents adds the records the prompt names
+    to the unfiltered results; documents without the attributes (PDFs, whole
+    CSVs) never match a filter, so it only ever adds to the first pass.
+
+    Returns a dict with "candidates" (every deduplicated result, reranked, used to
+    find the CSV sources), "context" (the chunks within budget) and stats.
+    """
+    k = initial_k
+    results = retrieve(agent_client, kb_id, prompt, k)
+    expanded = max_k > initial_k and needs_expansion(results, k, min_score, min_sources)
+    if expanded:
+        k = max_k
+        results = retrieve(agent_client, kb_id, prompt, k)
+
+    filtered = []
+    if metadata_filter:
+        try:
+            filtered = retrieve(agent_client, kb_id, prompt, initial_k, metadata_filter)
+        except Exception as e:
+            print(f"DEBUG: Filtered retrieval failed, using the unfiltered results: {e}")
+        results = results + filtered
+
+    ranked = sorted(results, key=lambda r: -(r.get("score") or 0.0))
+    candidates = rerank(prompt, collapse_near_duplicates(ranked, duplicate_threshold, max_per_source))
+    context, tokens_used = pack_to_budget(candidates, token_budget)
+    return {
+        "candidates": candidates,
+        "context": context,
+        "stats": {
+            "k": k,
+            "expanded": expanded,
+            "filtered": len(filtered),
+            "retrieved": len(results),
+            "after_dedup": len(candidates),
+            "in_context": len(context),
+            "context_tokens": tokens_used,
+        },
+    }
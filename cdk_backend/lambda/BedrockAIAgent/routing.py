@@ -0,0 +1,111 @@
+import os
+import re
+from retrieval import dataset_uri
+
+DOCUMENTS = "documents"
+DATA = "data"
+
+# Wording that asks for counting, aggregating, ranking or charting, which only the
+# supervisor's code interpreter can do over the CSVs.
+DATA_CUES = re.compile(
+    r"\b(how many|number of|count|counts|average|mean|median|percent|percentage|proportion|rate|ratio|"
+    r"total|sum|most|least|highest|lowest|top \d+|trend|compare|comparison|distribution|breakdown|"
+    r"per (?:year|month|county)|by (?:year|month|county|age|race|ethnicity|gender|sex)|"
+    r"chart|graph|plot|table|list|csv|statistics|stats)\b",
+    re.IGNORECASE,
+)
+
+# Wording that only makes sense against an earlier turn: pronouns and other
+# references back, and openings that continue the previous question.
+FOLLOW_UP_CUES = re.compile(
+    r"^\s*(?:and|but|also|so|then|what about|how about|why|same)\b|"
+    r"\b(?:it|its|they|them|their|that|those|these|this one|he|him|his|she|her|"
+    r"above|previous|earlier|before that|same|instead|more|else)\b",
+    re.IGNORECASE,
+)
+# Prompts this short ("In 2020?", "By county") lean on the turn before them
+MIN_STANDALONE_WORDS = 4
+
+# The PDF agent's instruction, for the single retrieve-and-generate call that
+# answers document questions without the supervisor.
+DOCUMENT_PROMPT_TEMPLATE = """You are an AI assistant with access to a library of PDF documents. Answer the user's question using only the search results below.
+1. Use the results that come from PDF documents; ignore any CSV rows.
+2. Extract and summarize the key information from those documents.
+3. Answer the user clearly and concisely, citing only the PDF-sourced data.
+4. If no document contains the requested information, reply: "I couldn't find any relevant information in the available PDF documents I have."
+5. If the documents hold data that differs by a dimension such as year, demographic group or region, list the dimensions and the available options and ask which one the user would like to focus on.
+
+Search results:
+$search_results$
+
+$output_format_instructions$"""
+
+
+def is_follow_up(prompt, history):
+    """
+    Whether a prompt depends on the session's earlier turns: there are some, and
+    the prompt refers back to them or is too short to stand on its own. history
+    None means the earlier turns could not be read, which counts as a follow-up.
+    Returns (follow_up, reason).
+    """
+    if history is None:
+        return True, "session history unavailable"
+    if not history:
+        return False, "first turn"
+    match = FOLLOW_UP_CUES.search(prompt or "")
+    if match:
+        return True, f"refers back ({match.group(0).strip().lower()!r})"
+    if len(re.findall(r"\w+", prompt or "")) < MIN_STANDALONE_WORDS:
+        return True, "too short to stand alone"
+    return False, "stands alone"
+
+
+def classify(prompt, retrieval, min_score, follow_up=False):
+    """
+    Picks the route for a prompt from its wording and its retrieval results,
+    without a model call. Returns (route, reason).
+
+    A prompt goes to the documents route only when nothing points at the data: it
+    does not ask for analysis, none of the chunks in context comes from a dataset
+    (a whole CSV or a per-record document), and the best chunk scores at least
+    min_score. Everything else, and every follow-up in a session (whose meaning
+    depends on the turns before it, see is_follow_up), goes to the supervisor
+    with the session's history.
+    """
+    if follow_up:
+        return DATA, "follow-up in session"
+    match = DATA_CUES.search(prompt or "")
+    if match:
+        return DATA, f"asks for analysis ({match.group(0).lower()!r})"
+    context = retrieval["context"]
+    if not context:
+        return DATA, "no retrieved context"
+    datasets = sorted({os.path.basename(dataset_uri(r)) for r in context if dataset_uri(r).lower().endswith(".csv")})
+    if datasets:
+        return DATA, f"context from {', '.join(datasets)}"
+    best = max((r.get("score") or 0.0) for r in context)
+    if best < min_score:
+        return DATA, f"weak retrieval ({best:.2f})"
+    return DOCUMENTS, f"document context (best score {best:.2f})"
+
+
+def retrieve_and_generate_request(prompt, kb_id, model_arn, k, guardrail_id=None, guardrail_version=None):
+    """
+    Keyword arguments for bedrock-agent-runtime retrieve_and_generate_stream: one
+    knowledge base retrieval and one generation, under the supervisor's guardrail.
+    """
+    generation = {"promptTemplate": {"textPromptTemplate": DOCUMENT_PROMPT_TEMPLATE}}
+    if guardrail_id:
+        generation["guardrailConfiguration"] = {"guardrailId": guardrail_id, "guardrailVersion": guardrail_version or "DRAFT"}
+    return {
+        "input": {"text": prompt},
+        "retrieveAndGenerateConfiguration": {
+            "type": "KNOWLEDGE_BASE",
+            "knowledgeBaseConfiguration": {
+                "knowledgeBaseId": kb_id,
+                "modelArn": model_arn,
+                "retrievalConfiguration": {"vectorSearchConfiguration": {"numberOfResults": k}},
+                "generationConfiguration": generation,
+            },
+        },
+    }
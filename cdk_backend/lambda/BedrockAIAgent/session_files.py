@@ -0,0 +1,231 @@
+import json
+import time
+import threading
+from urllib.parse import urlparse
+from botocore.exceptions import ClientError
+
+
+def parse_s3_uri(uri):
+    parsed = urlparse(uri)
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+def object_version(s3_client, catalog, data_bucket, uri):
+    """
+    Returns a token that changes whenever the object's content does: the catalog's
+    content hash for datasets in the data bucket, otherwise the object's version id
+    or ETag from a HEAD request. None when it cannot be determined.
+    """
+    bucket, key = parse_s3_uri(uri)
+    if bucket == data_bucket:
+        entry = catalog.entry_for_key(key)
+        if entry and entry.get("sha256"):
+            return f"sha256:{entry['sha256']}"
+    try:
+        response = s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        print(f"DEBUG: Could not read the version of {uri}: {e}")
+        return None
+    if response.get("VersionId") and response["VersionId"] != "null":
+        return f"version:{response['VersionId']}"
+    return f"etag:{response['ETag']}"
+
+
+# Earlier turns passed to the agent, and how much of each is kept
+MAX_HISTORY_TURNS = 10
+MAX_QUESTION_CHARS = 1000
+MAX_ANSWER_CHARS = 2000
+
+
+def attachment(uri, version):
+    # One string per attached object version, so attaching is a set union
+    return json.dumps([uri, version])
+
+
+def exchange(question, answer, route):
+    return {"question": question[:MAX_QUESTION_CHARS], "answer": answer[:MAX_ANSWER_CHARS], "route": route}
+
+
+class InMemorySessionStore:
+    """
+    Per-container stand-in for DynamoDBSessionStore. Safe as a fallback: a session
+    handled by another container just looks new, so its files are sent again.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def _live(self, session_id):
+        item = self._items.get(session_id)
+        if not item or item["expires_at"] <= self.clock():
+            return None
+        return item
+
+    def attached(self, session_id):
+        with self._lock:
+            item = self._live(session_id)
+            return set(item["attached"]) if item else set()
+
+    def start_turn(self, session_id, expires_at):
+        with self._lock:
+            item = self._live(session_id) or {"attached": set(), "history": []}
+            self._items[session_id] = dict(item, history=item["history"][-MAX_HISTORY_TURNS:], expires_at=expires_at)
+            return list(item["history"])
+
+    def add_exchange(self, session_id, entry, expires_at):
+        with self._lock:
+            item = self._live(session_id) or {"attached": set(), "history": []}
+            self._items[session_id] = dict(item, history=item["history"] + [entry], expires_at=expires_at)
+
+    def add_files(self, session_id, attachments, expires_at):
+        with self._lock:
+            item = self._live(session_id)
+            if item is None and not attachments:
+                return
+            item = item or {"attached": set(), "history": []}
+            self._items[session_id] = dict(item, attached=item["attached"] | set(attachments), expires_at=expires_at)
+
+
+class DynamoDBSessionStore:
+    """
+    One item per session: {"sessionId", "attached" (string set, see attachment),
+    "history" (list of exchange maps), "expiresAt"}. Every change is a single
+    UpdateItem (ADD to the attached set, list_append to the history), so
+    concurrent turns of one session never overwrite each other. expiresAt is also
+    the table's TTL attribute, but TTL deletion can lag by hours, so expiry is
+    checked on every read and update.
+    """
+
+    def __init__(self, dynamodb_client, table_name, clock=time.time):
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+        self.clock = clock
+
+    def attached(self, session_id):
+        response = self.dynamodb_client.get_item(
+            TableName=self.table_name,
+            Key={"sessionId": {"S": session_id}},
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        if not item or int(item["expiresAt"]["N"]) <= self.clock():
+            return set()
+        return set(item.get("attached", {}).get("SS", []))
+
+    def _update(self, session_id, expression, values, condition=None, return_values="NONE"):
+        params = {
+            "TableName": self.table_name,
+            "Key": {"sessionId": {"S": session_id}},
+            "UpdateExpression": expression,
+            "ExpressionAttributeValues": values,
+            "ReturnValues": return_values,
+        }
+        if condition:
+            params["ConditionExpression"] = condition
+        return self.dynamodb_client.update_item(**params)
+
+    def start_turn(self, session_id, expires_at):
+        values = {":expires": {"N": str(int(expires_at))}, ":now": {"N": str(int(self.clock()))}}
+        for _ in range(2):
+            try:
+                response = self._update(session_id, "SET expiresAt = :expires", values,
+                                        "attribute_not_exists(expiresAt) OR expiresAt > :now", "ALL_OLD")
+                history = [
+                    {name: value["S"] for name, value in entry["M"].items()}
+                    for entry in response.get("Attributes", {}).get("history", {}).get("L", [])
+                ]
+                if len(history) > 2 * MAX_HISTORY_TURNS:
+                    self._trim(session_id, len(history))
+                return history
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+            # The item outlived its session: start over, unless a concurrent turn already did
+            try:
+                self._update(session_id, "SET expiresAt = :expires REMOVE attached, history", values, "expiresAt <= :now")
+                return []
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+        raise RuntimeError(f"Session {session_id} kept changing while its turn was started")
+
+    def _trim(self, session_id, length):
+        # Drops all but the last MAX_HISTORY_TURNS exchanges, unless one was appended meanwhile
+        removed = ", ".join(f"history[{i}]" for i in range(length - MAX_HISTORY_TURNS))
+        try:
+            self._update(session_id, f"REMOVE {removed}", {":length": {"N": str(length)}}, "size(history) = :length")
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    def add_exchange(self, session_id, entry, expires_at):
+        values = {
+            ":entry": {"L": [{"M": {name: {"S": value} for name, value in entry.items()}}]},
+            ":empty": {"L": []},
+            ":expires": {"N": str(int(expires_at))},
+        }
+        self._update(session_id, "SET history = list_append(if_not_exists(history, :empty), :entry), expiresAt = :expires", values)
+
+    def add_files(self, session_id, attachments, expires_at):
+        values = {":expires": {"N": str(int(expires_at))}}
+        if attachments:
+            values[":attached"] = {"SS": sorted(attachments)}
+            self._update(session_id, "ADD attached :attached SET expiresAt = :expires", values)
+            return
+        # Only extend a session that exists
+        try:
+            self._update(session_id, "SET expiresAt = :expires", values, "attribute_exists(sessionId)")
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+
+class SessionFileTracker:
+    """
+    Remembers which S3 objects, at which versions, are already loaded into a
+    session's code-interpreter sandbox, so later turns only attach new or changed
+    files, and the session's earlier questions and answers, so a follow-up can be
+    told from a first question without trusting the client and the agent sees
+    turns it did not answer itself. Entries live for `ttl` seconds after the
+    session's last turn, which has to stay below the agent's idle session timeout:
+    once the agent drops the session, its sandbox, files and conversation are gone
+    too.
+    """
+
+    def __init__(self, store, ttl=540, clock=time.time):
+        self.store = store
+        self.ttl = ttl
+        self.clock = clock
+
+    def pending(self, session_id, files):
+        """
+        Returns the subset of files ({"s3_uri", "version"}) that still has to be
+        attached. Files without a known version are always attached.
+        """
+        attached = self.store.attached(session_id)
+        return [f for f in files if f.get("version") is None or attachment(f["s3_uri"], f["version"]) not in attached]
+
+    def begin_turn(self, session_id):
+        """
+        Starts a new turn of the session and returns its earlier exchanges
+        ({"question", "answer", "route"}, oldest first, at most
+        MAX_HISTORY_TURNS); none means the prompt opens the conversation.
+        """
+        return self.store.start_turn(session_id, self.clock() + self.ttl)[-MAX_HISTORY_TURNS:]
+
+    def record_exchange(self, session_id, question, answer, route):
+        """
+        Adds a finished turn's question and answer, and the route that answered
+        it, to the session's history.
+        """
+        self.store.add_exchange(session_id, exchange(question, answer, route), self.clock() + self.ttl)
+
+    def record(self, session_id, files):
+        """
+        Marks files as attached after a successful turn and extends the session's
+        expiry, since every turn resets the agent's idle timer.
+        """
+        attachments = {attachment(f["s3_uri"], f["version"]) for f in files if f.get("version") is not None}
+        self.store.add_files(session_id, attachments, self.clock() + self.ttl)
@@ -0,0 +1,121 @@
+import json
+import time
+import hashlib
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+STREAM_PREFIX = "streams/"
+# Why a stream cannot be replayed (the stream_unavailable frame's "reason")
+PENDING = "pending"
+EXPIRED = "expired"
+
+
+def text_digest(text):
+    """
+    What the final frame carries instead of the text: the UTF-8 length and SHA-256
+    of everything the delta frames sent, so a client can check what it assembled.
+    """
+    data = text.encode("utf-8")
+    return {"length": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+
+class AnswerStream:
+    """
+    One answer's frames over the WebSocket. Every frame carries the streamId and a
+    seq that starts at 0 and increases by one per frame, so a client can tell when
+    it missed one. The text is only sent once, as delta frames; the final_text
+    frame carries its length and checksum (text_digest).
+
+        {"type": "delta", "streamId", "seq", "text"}
+        {"type": "thinking", "streamId", "seq", "text"}
+        {"type": "final_text", "streamId", "seq", "length", "sha256"}
+        {"type": "files", "streamId", "seq", "files"}
+        {"type": "error", "streamId", "seq", "message"}
+
+    tags are added to every frame, e.g. a batch question's batchId and questionIndex.
+    Every frame sent is kept, so the completed stream can be stored and replayed.
+    """
+
+    def __init__(self, stream_id, send, **tags):
+        self.stream_id = stream_id
+        self.send = send
+        self.tags = tags
+        self.frames = []
+        self.text = []
+
+    def _frame(self, frame_type, **fields):
+        frame = {"statusCode": 200, "type": frame_type, "streamId": self.stream_id, "seq": len(self.frames), **self.tags, **fields}
+        self.frames.append(frame)
+        self.send(frame)
+        return frame
+
+    def delta(self, text):
+        self.text.append(text)
+        return self._frame("delta", text=text)
+
+    def thinking(self, text):
+        return self._frame("thinking", text=text)
+
+    def final(self):
+        return self._frame("final_text", **text_digest("".join(self.text)))
+
+    def files(self, files):
+        return self._frame("files", files=files)
+
+    def error(self, message):
+        return self._frame("error", statusCode=500, message=message)
+
+
+class StreamStore:
+    """
+    Completed streams, kept in the state bucket for `retention` seconds so a client
+    that reconnects can have the frames it missed replayed instead of asking again:
+
+        streams/<streamId>.json    {"streamId", "sessionId", "frames", "expires_at", ...}
+
+    The bucket's lifecycle rule removes them eventually; expires_at is what makes
+    them unavailable after the retention period.
+    """
+
+    def __init__(self, s3_client, bucket, prefix=STREAM_PREFIX, retention=900, clock=time.time):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.retention = retention
+        self.clock = clock
+
+    def _key(self, stream_id):
+        return f"{self.prefix}{stream_id}.json"
+
+    def put(self, stream_id, session_id, frames):
+        if not self.bucket or not stream_id:
+            return
+        record = {
+            "streamId": stream_id,
+            "sessionId": session_id,
+            "frames": frames,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "expires_at": self.clock() + self.retention,
+        }
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._key(stream_id), Body=json.dumps(record), ContentType="application/json")
+
+    def get(self, stream_id, session_id):
+        """
+        Returns (frames, None) for a completed stream of the session, or (None,
+        reason): EXPIRED once its retention has passed, otherwise PENDING, which is
+        what an answer that is still being generated looks like. Unknown streams
+        and other sessions' streams look the same, so they cannot be told apart.
+        """
+        if not self.bucket or not stream_id:
+            return None, PENDING
+        try:
+            record = json.loads(self.s3_client.get_object(Bucket=self.bucket, Key=self._key(stream_id))["Body"].read())
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            return None, PENDING
+        if record.get("sessionId") != session_id:
+            return None, PENDING
+        if record.get("expires_at", 0) < self.clock():
+            return None, EXPIRED
+        return record["frames"], None
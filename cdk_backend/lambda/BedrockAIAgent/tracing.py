@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import uuid
+import threading
+
+
+# Default parent: the innermost open span. Pass parent_id=None for a root span.
+CURRENT = object()
+
+
+def new_span_id():
+    return uuid.uuid4().hex[:16]
+
+
+class Span:
+    """
+    One timed phase of a request. Times are epoch seconds so spans recorded by
+    different functions line up on one timeline.
+    """
+
+    def __init__(self, tracer, name, parent_id, start, attributes, span_id=None):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = span_id or new_span_id()
+        self.parent_id = parent_id
+        self.start = start
+        self.end_time = None
+        self.attributes = dict(attributes)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def end(self, end=None, **attributes):
+        if self.end_time is None:
+            self.attributes.update(attributes)
+            self.end_time = end if end is not None else self.tracer.clock()
+            self.tracer.finished.append(self)
+        return self
+
+    def __enter__(self):
+        self.tracer.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer.stack.remove(self)
+        self.end()
+        return False
+
+    def to_dict(self):
+        return {
+            "traceId": self.tracer.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end_time,
+            "durationMs": round((self.end_time - self.start) * 1000, 1),
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Collects the spans of one request and hands them to an exporter on flush().
+    A tracer belongs to a single invocation and is not shared between threads.
+
+    New spans are children of the innermost span entered with `with`, or of
+    parent_id (the caller's span) at the top level. Spans still open at flush()
+    are ended there and marked unfinished, e.g. when the handler raised.
+    """
+
+    def __init__(self, trace_id=None, parent_id=None, exporter=None, clock=time.time):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.parent_id = parent_id
+        self.exporter = exporter or NullSpanExporter()
+        self.clock = clock
+        self.stack = []
+        self.started = []
+        self.finished = []
+        self.aggregates = {}
+
+    @classmethod
+    def from_context(cls, trace_context, exporter=None, clock=time.time):
+        trace_context = trace_context or {}
+        return cls(trace_context.get("traceId"), trace_context.get("spanId"), exporter, clock)
+
+    def current_id(self):
+        return self.stack[-1].span_id if self.stack else self.parent_id
+
+    def start(self, name, parent_id=CURRENT, start=None, **attributes):
+        """
+        Starts a span that is ended explicitly with span.end(); use it as a context
+        manager to make it the parent of spans started inside the block.
+        """
+        parent_id = self.current_id() if parent_id is CURRENT else parent_id
+        span = Span(self, name, parent_id, start if start is not None else self.clock(), attributes)
+        self.started.append(span)
+        return span
+
+    def record(self, name, start, end, parent_id=CURRENT, span_id=None, **attributes):
+        """
+        Adds a span whose timings are already known, such as the invoke hop.
+        """
+        parent_id = self.current_id() if parent_id is CURRENT else parent_id
+        return Span(self, name, parent_id, start, attributes, span_id).end(end)
+
+    def count(self, name, start, end):
+        """
+        Folds a frequent, short call (one per streamed frame) into a single span per
+        name: first start to last end, with the call count and time actually spent.
+        """
+        parent_id = self.current_id()
+        aggregate = self.aggregates.setdefault(name, {"start": start, "end": end, "calls": 0, "total": 0.0, "max": 0.0, "parent_id": parent_id})
+        aggregate["end"] = max(aggregate["end"], end)
+        aggregate["calls"] += 1
+        aggregate["total"] += end - start
+        aggregate["max"] = max(aggregate["max"], end - start)
+
+    def flush(self):
+        for span in self.started:
+            if span.end_time is None:
+                span.end(unfinished=True)
+        self.started = []
+        for name, aggregate in self.aggregates.items():
+            self.record(name, aggregate["start"], aggregate["end"], aggregate["parent_id"], calls=aggregate["calls"],
+                        total_ms=round(aggregate["total"] * 1000, 1), max_ms=round(aggregate["max"] * 1000, 1))
+        self.aggregates = {}
+        spans = [span.to_dict() for span in sorted(self.finished, key=lambda s: s.start)]
+        self.finished = []
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            print(f"DEBUG: Span export failed: {e}")
+        return spans
+
+
+# Bedrock orchestration step kinds, by invocationInput/observation "type".
+INVOCATION_SPAN_NAMES = {
+    "ACTION_GROUP": "action_group",
+    "ACTION_GROUP_CODE_INTERPRETER": "code_interpreter",
+    "KNOWLEDGE_BASE": "knowledge_base_lookup",
+    "AGENT_COLLABORATOR": "agent_collaborator",
+}
+
+
+class OrchestrationSpans:
+    """
+    Turns the agent's orchestrationTrace events into child spans. Each step's input
+    event opens a span and the output/observation event with the same Bedrock
+    traceId closes it; the timings are when the events arrived on our side, and
+    Bedrock's own step duration is attached when the event carries it.
+    """
+
+    def __init__(self, tracer, parent_id):
+        self.tracer = tracer
+        self.parent_id = parent_id
+        self.open = {}
+
+    def _start(self, key, name, **attributes):
+        self.open[key] = self.tracer.start(name, parent_id=self.parent_id, **attributes)
+
+    def _end(self, key, metadata=None, **attributes):
+        span = self.open.pop(key, None)
+        if span is None:
+            return
+        if metadata and metadata.get("totalTimeMs") is not None:
+            attributes["bedrock_ms"] = metadata["totalTimeMs"]
+        span.end(**attributes)
+
+    def on_trace(self, trace_event):
+        trace = trace_event.get("trace") or {}
+        orchestration = trace.get("orchestrationTrace")
+        if not orchestration:
+            return
+        agent_id = trace_event.get("agentId")
+        if "modelInvocationInput" in orchestration:
+            step = orchestration["modelInvocationInput"].get("traceId")
+            self._start(("model", step), "model_invocation", step=step, agent_id=agent_id)
+        elif "modelInvocationOutput" in orchestration:
+            output = orchestration["modelInvocationOutput"]
+            usage = (output.get("metadata") or {}).get("usage") or {}
+            self._end(("model", output.get("traceId")), output.get("metadata"),
+                      input_tokens=usage.get("inputTokens"), output_tokens=usage.get("outputTokens"))
+        elif "invocationInput" in orchestration:
+            invocation = orchestration["invocationInput"]
+            name = INVOCATION_SPAN_NAMES.get(invocation.get("invocationType"))
+            if name:
+                self._start(("invocation", invocation.get("traceId")), name, step=invocation.get("traceId"), agent_id=agent_id)
+        elif "observation" in orchestration:
+            observation = orchestration["observation"]
+            self._end(("invocation", observation.get("traceId")), observation.get("metadata"), observation_type=observation.get("type"))
+
+    def close(self):
+        """
+        Ends steps that never reported an output, e.g. when the stream broke off.
+        """
+        for key in list(self.open):
+            self._end(key, unterminated=True)
+
+
+class NullSpanExporter:
+    def export(self, spans):
+        pass
+
+
+class LogSpanExporter:
+    """
+    One "TRACE {...}" line per span in the function's log, where Logs Insights or
+    tools/trace_waterfall.py can pick them up.
+    """
+
+    def export(self, spans):
+        for span in spans:
+            print("TRACE " + json.dumps(span, default=str))
+
+
+class FileSpanExporter:
+    """
+    Appends spans as JSON lines to a local file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock, open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span, default=str) + "\n")
+
+
+EXPORTERS = {
+    "log": lambda: LogSpanExporter(),
+    "file": lambda: FileSpanExporter(os.environ.get("TRACE_FILE", "/tmp/traces.jsonl")),
+    "none": lambda: NullSpanExporter(),
+}
+
+
+def exporter_from_env():
+    name = os.environ.get("TRACE_EXPORTER", "log")
+    if name not in EXPORTERS:
+        print(f"DEBUG: Unknown TRACE_EXPORTER {name!r}, using log")
+        name = "log"
+    return EXPORTERS[name]()
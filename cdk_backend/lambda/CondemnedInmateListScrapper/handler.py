@@ -1,77 +1,200 @@
 import os
 import io
+import json
 import csv
+import hashlib
 import boto3
 import requests
+from functools import lru_cache
+from botocore.config import Config
 from bs4 import BeautifulSoup
+from datetime import date, datetime, timezone
+from ingestion_client import notify_ingestion
 
 # Environment variables
 BUCKET_NAME = os.environ.get("BUCKET_NAME")
+STATE_BUCKET_NAME = os.environ.get("STATE_BUCKET_NAME")
 REGION = os.environ.get("REGION")
 
-s3_client = boto3.client("s3", region_name=REGION)
+# Clients are created on first use and reused by warm invocations.
+@lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client("s3", region_name=REGION, config=Config(connect_timeout=5, read_timeout=30, retries={"max_attempts": 3, "mode": "standard"}))
 
-def lambda_handler(event, context):
+@lru_cache(maxsize=None)
+def get_lambda_client():
+    return boto3.client("lambda", region_name=REGION, config=Config(connect_timeout=2, read_timeout=5, retries={"max_attempts": 3, "mode": "standard"}))
+
+URL = "https://www.cdcr.ca.gov/capital-punishment/condemned-inmate-list-secure-request/"
+FILE_KEY = "condemned_inmate_list.csv"
+INDEX_KEY = "indexes/condemned_inmate_list.json"
+
+# Source header -> output column
+HEADER_MAPPING = {
+    "Last Name": "last_name",
+    "First Name": "first_name",
+    "Age": "age",
+    "Age at Offense": "age_at_offense",
+    "Received Date": "received_date",
+    "Sentenced Date": "sentenced_date",
+    "Offense Date": "offense_date",
+    "Trial County": "trial_county",
+}
+INTEGER_COLUMNS = {"age", "age_at_offense"}
+DATE_COLUMNS = {"received_date", "sentenced_date", "offense_date"}
+# Only what the row itself determines, so unchanged source data keeps the same CSV
+# hash; years on the list is computed by the index reader from received_date.
+DERIVED_COLUMNS = ["received_year", "age_bucket"]
+# Upper bound (exclusive) -> bucket label
+AGE_BUCKETS = [(30, "under_30"), (40, "30-39"), (50, "40-49"), (60, "50-59"), (70, "60-69")]
+LAST_NAME_PREFIX_LENGTH = 2
+
+def extract_condemned_table(html):
+    """
+    Extracts the output column names and raw cell text rows from the condemned list page.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    table = soup.find('table', class_='has-fixed-layout')
+    if not table:
+        raise ValueError("Could not find the table with class 'has-fixed-layout'.")
+
+    headers = [th.text.strip() for th in table.find('thead').find_all('th')]
+    # Fallback for unexpected headers
+    columns = [HEADER_MAPPING.get(h, h.lower().replace(" ", "_")) for h in headers]
+
+    rows = []
+    for tr in table.find('tbody').find_all('tr'):
+        cells = [td.text.strip() for td in tr.find_all('td')]
+        rows.append(cells)
+    return columns, rows
+
+def parse_int(value):
     try:
-        # URL to scrape
-        url = "https://www.cdcr.ca.gov/capital-punishment/condemned-inmate-list-secure-request/"
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for non-200 responses
+        return int(value.strip())
+    except (AttributeError, ValueError):
+        return None
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value.strip(), "%m/%d/%Y").date()
+    except (AttributeError, ValueError):
+        return None
+
+def age_bucket(age):
+    if age is None:
+        return None
+    for upper, label in AGE_BUCKETS:
+        if age < upper:
+            return label
+    return "70_plus"
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        table = soup.find('table', class_='has-fixed-layout')
-        if not table:
-            raise ValueError("Could not find the table with class 'has-fixed-layout'.")
-
-        # Extract original headers
-        headers = [th.text.strip() for th in table.find('thead').find_all('th')]
-
-        # Rename headers with underscores and date formats
-        renamed_headers = []
-        for h in headers:
-            if h == "Last Name":
-                renamed_headers.append("last_name")
-            elif h == "First Name":
-                renamed_headers.append("first_name")
-            elif h == "Age":
-                renamed_headers.append("age")
-            elif h == "Age at Offense":
-                renamed_headers.append("age_at_offense")
-            elif h == "Received Date":
-                renamed_headers.append("received_date(MM/DD/YYYY)")
-            elif h == "Sentenced Date":
-                renamed_headers.append("sentenced_date(MM/DD/YYYY)")
-            elif h == "Offense Date":
-                renamed_headers.append("offense_date(MM/DD/YYYY)")
-            elif h == "Trial County":
-                renamed_headers.append("trial_county")
+def normalize_records(columns, rows):
+    """
+    Converts raw rows into typed records:
+      - ages become integers and dates become datetime.date (None when blank or malformed),
+      - trial counties are whitespace-normalized,
+      - received_year and age_bucket are derived.
+    """
+    records = []
+    for cells in rows:
+        record = {}
+        for column, value in zip(columns, cells):
+            if column in INTEGER_COLUMNS:
+                record[column] = parse_int(value)
+            elif column in DATE_COLUMNS:
+                record[column] = parse_date(value)
+            elif column == "trial_county":
+                record[column] = " ".join(value.split())
             else:
-                # Fallback for unexpected headers
-                renamed_headers.append(h.lower().replace(" ", "_"))
+                record[column] = value
+        received = record.get("received_date")
+        record["received_year"] = received.year if received else None
+        record["age_bucket"] = age_bucket(record.get("age"))
+        records.append(record)
+    return records
 
-        # Extract data rows
-        rows = []
-        for tr in table.find('tbody').find_all('tr'):
-            cells = [td.text.strip() for td in tr.find_all('td')]
-            rows.append(cells)
+def build_indexes(records):
+    """
+    Builds lookup indexes over the normalized records. Each index maps a key to the
+    zero-based positions of matching data rows in the CSV plus a precomputed count,
+    so point lookups and filtered counts never scan the list:
+      - by_trial_county: lower-cased county name
+      - by_received_year: four-digit year as a string
+      - by_last_name_prefix: first two letters of the last name, upper-cased
+    """
+    indexes = {"by_trial_county": {}, "by_received_year": {}, "by_last_name_prefix": {}}
+    for position, record in enumerate(records):
+        keys = {
+            "by_trial_county": (record.get("trial_county") or "").lower(),
+            "by_received_year": str(record["received_year"]) if record["received_year"] else "",
+            "by_last_name_prefix": (record.get("last_name") or "")[:LAST_NAME_PREFIX_LENGTH].upper(),
+        }
+        for index_name, key in keys.items():
+            if key:
+                indexes[index_name].setdefault(key, []).append(position)
+
+    return {
+        name: {key: {"count": len(positions), "rows": positions} for key, positions in sorted(index.items())}
+        for name, index in indexes.items()
+    }
+
+def to_csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+def lambda_handler(event, context):
+    try:
+        response = requests.get(URL)
+        response.raise_for_status()  # Raise an exception for non-200 responses
+
+        columns, rows = extract_condemned_table(response.content)
+        records = normalize_records(columns, rows)
+        output_columns = columns + DERIVED_COLUMNS
 
         # Write CSV to an in-memory buffer
         csv_buffer = io.StringIO()
         writer = csv.writer(csv_buffer)
-        writer.writerow(renamed_headers)
-        writer.writerows(rows)
+        writer.writerow(output_columns)
+        for record in records:
+            writer.writerow([to_csv_value(record.get(column)) for column in output_columns])
 
         # Upload CSV to S3
-        file_key = "condemned_inmate_list.csv"
-        s3_client.put_object(
+        body = csv_buffer.getvalue().encode("utf-8")
+        get_s3_client().put_object(
             Bucket=BUCKET_NAME,
-            Key=file_key,
-            Body=csv_buffer.getvalue()
+            Key=FILE_KEY,
+            Body=body
+        )
+        sha256 = hashlib.sha256(body).hexdigest()
+
+        # The sidecar index lives in the state bucket so it is not ingested into the
+        # knowledge base. It carries the rows its positions refer to, so the agent
+        # answers a lookup with one read (see BedrockAIAgent/record_index.py).
+        index = {
+            "dataset": FILE_KEY,
+            "dataset_sha256": sha256,
+            "row_count": len(records),
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "columns": output_columns,
+            "rows": [[to_csv_value(record.get(column)) for column in output_columns] for record in records],
+            "indexes": build_indexes(records),
+        }
+        get_s3_client().put_object(
+            Bucket=STATE_BUCKET_NAME,
+            Key=INDEX_KEY,
+            Body=json.dumps(index),
+            ContentType="application/json"
         )
+        output = {"key": FILE_KEY, "schema": output_columns, "rows": len(records), "bytes": len(body), "sha256": sha256, "index": INDEX_KEY}
+        notify_ingestion("CondemnedInmateListScrapper", [output], get_lambda_client)
 
         return {
             "statusCode": 200,
-            "body": f"CSV file '{file_key}' has been created and uploaded to bucket '{BUCKET_NAME}'."
+            "body": f"CSV file '{FILE_KEY}' has been created and uploaded to bucket '{BUCKET_NAME}'.",
+            "outputs": [output]
         }
 
     except Exception as e:
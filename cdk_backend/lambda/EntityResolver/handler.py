@@ -0,0 +1,106 @@
+import os
+import io
+import csv
+import hashlib
+import boto3
+from functools import lru_cache
+from botocore.config import Config
+from matching import match_records, parse_date, timeline_consistency
+from ingestion_client import notify_ingestion
+
+# Environment variables
+BUCKET_NAME = os.environ.get("BUCKET_NAME")
+REGION = os.environ.get("REGION")
+MIN_CONFIDENCE = float(os.environ.get("MIN_CONFIDENCE", "0.85"))
+
+# Clients are created on first use and reused by warm invocations.
+@lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client("s3", region_name=REGION, config=Config(connect_timeout=5, read_timeout=30, retries={"max_attempts": 3, "mode": "standard"}))
+
+@lru_cache(maxsize=None)
+def get_lambda_client():
+    return boto3.client("lambda", region_name=REGION, config=Config(connect_timeout=2, read_timeout=5, retries={"max_attempts": 3, "mode": "standard"}))
+
+SCORE_KEY = "score_jail_data.csv"
+CONDEMNED_KEY = "condemned_inmate_list.csv"
+MATCHES_KEY = "score_condemned_matches.csv"
+
+MATCH_HEADERS = [
+    "booking_number",
+    "score_first_name",
+    "score_middle_name",
+    "score_last_name",
+    "booking_datetime",
+    "In_Score_Custody",
+    "condemned_first_name",
+    "condemned_last_name",
+    "condemned_trial_county",
+    "condemned_received_date",
+    "condemned_offense_date",
+    "confidence",
+    "match_method",
+]
+
+def read_csv(key):
+    """
+    Reads a CSV from the data bucket into a list of dictionaries.
+    """
+    body = get_s3_client().get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read().decode("utf-8")
+    return list(csv.DictReader(io.StringIO(body)))
+
+def lambda_handler(event, context):
+    """
+    Post-scrape stage that joins the SCORE roster with the condemned inmate list:
+      1. Reads both scraped CSVs from the data bucket.
+      2. Normalizes names and compares only candidates that share a phonetic or
+         last-name-prefix block.
+      3. Weighs each candidate's booking date against the condemned record's
+         offense and received dates (the roster carries no age or date of birth).
+      4. Publishes every pair above MIN_CONFIDENCE, with its confidence score, as
+         score_condemned_matches.csv so cross-dataset questions become a lookup.
+    """
+    score_rows = read_csv(SCORE_KEY)
+    condemned_rows = read_csv(CONDEMNED_KEY)
+    print(f"Matching {len(score_rows)} SCORE rows against {len(condemned_rows)} condemned rows")
+
+    matches = match_records(
+        score_rows,
+        condemned_rows,
+        lambda r: (r.get("first_name", ""), r.get("last_name", "")),
+        lambda r: (r.get("first_name", ""), r.get("last_name", "")),
+        MIN_CONFIDENCE,
+        lambda score, condemned: timeline_consistency(
+            parse_date(score.get("booking_datetime")),
+            parse_date(condemned.get("offense_date")),
+            parse_date(condemned.get("received_date")),
+        ),
+    )
+
+    csv_buffer = io.StringIO()
+    writer = csv.writer(csv_buffer)
+    writer.writerow(MATCH_HEADERS)
+    for score, condemned, confidence, method in matches:
+        writer.writerow([
+            score.get("booking_number", ""),
+            score.get("first_name", ""),
+            score.get("middle_name", ""),
+            score.get("last_name", ""),
+            score.get("booking_datetime", ""),
+            score.get("In_Score_Custody", ""),
+            condemned.get("first_name", ""),
+            condemned.get("last_name", ""),
+            condemned.get("trial_county", ""),
+            condemned.get("received_date", ""),
+            condemned.get("offense_date", ""),
+            confidence,
+            method,
+        ])
+    body = csv_buffer.getvalue().encode("utf-8")
+    get_s3_client().put_object(Bucket=BUCKET_NAME, Key=MATCHES_KEY, Body=body)
+    output = {"key": MATCHES_KEY, "schema": MATCH_HEADERS, "rows": len(matches), "bytes": len(body), "sha256": hashlib.sha256(body).hexdigest()}
+    notify_ingestion("EntityResolver", [output], get_lambda_client)
+
+    msg = f"Published {len(matches)} matches to '{MATCHES_KEY}' in bucket '{BUCKET_NAME}'."
+    print(msg)
+    return {"statusCode": 200, "body": msg, "outputs": [output]}
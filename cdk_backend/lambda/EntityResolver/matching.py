@@ -0,0 +1,175 @@
+import re
+import unicodedata
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+
+NAME_SUFFIXES = {"JR", "SR", "II", "III", "IV", "V"}
+SOUNDEX_CODES = {
+    **dict.fromkeys("BFPV", "1"),
+    **dict.fromkeys("CGJKQSXZ", "2"),
+    **dict.fromkeys("DT", "3"),
+    "L": "4",
+    **dict.fromkeys("MN", "5"),
+    "R": "6",
+}
+LAST_NAME_PREFIX_LENGTH = 4
+# Share of the confidence that rests on the dates when both records have them
+TIMELINE_WEIGHT = 0.2
+
+
+def normalize_name(name):
+    """
+    Upper-cases a name, strips accents and punctuation, and drops generational
+    suffixes. Returns the list of remaining name tokens.
+    """
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).upper()
+    tokens = re.findall(r"[A-Z]+", text)
+    return [t for t in tokens if t not in NAME_SUFFIXES] or tokens
+
+
+def soundex(word):
+    """
+    American Soundex code of a single upper-case word, e.g. ROBERT -> R163.
+    """
+    if not word:
+        return ""
+    code = word[0]
+    previous = SOUNDEX_CODES.get(word[0], "")
+    for ch in word[1:]:
+        digit = SOUNDEX_CODES.get(ch, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W do not separate letters with the same code; vowels do.
+        if ch not in "HW":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def name_key(first_name, last_name):
+    """
+    Normalized (first, last) pair used for blocking and scoring. Multi-part last
+    names such as "De La Cruz" are joined so spacing differences do not matter.
+    """
+    first_tokens = normalize_name(first_name)
+    last_tokens = normalize_name(last_name)
+    return (first_tokens[0] if first_tokens else ""), "".join(last_tokens)
+
+
+def blocking_keys(first, last):
+    """
+    Candidate blocks for a normalized name: the phonetic key of the last name with
+    the first initial, and a plain last-name prefix to catch phonetic misses.
+    """
+    if not last:
+        return set()
+    initial = first[:1]
+    return {
+        ("soundex", soundex(last), initial),
+        ("prefix", last[:LAST_NAME_PREFIX_LENGTH], initial),
+    }
+
+
+def first_name_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    # "J" vs "JOHN", "ROB" vs "ROBERT"
+    if a.startswith(b) or b.startswith(a):
+        return 0.9 if min(len(a), len(b)) > 1 else 0.8
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def score_pair(left, right):
+    """
+    Confidence in [0, 1] that two normalized (first, last) names are the same
+    person, plus the strongest evidence that matched.
+    """
+    (first_a, last_a), (first_b, last_b) = left, right
+    last_similarity = 1.0 if last_a == last_b else SequenceMatcher(None, last_a, last_b).ratio()
+    confidence = 0.6 * last_similarity + 0.4 * first_name_similarity(first_a, first_b)
+    if (first_a, last_a) == (first_b, last_b):
+        method = "exact"
+    elif soundex(last_a) == soundex(last_b):
+        method = "phonetic"
+        # Only an exact match earns full confidence.
+        confidence = min(0.99, confidence + 0.05)
+    else:
+        method = "fuzzy"
+    return round(confidence, 4), method
+
+
+def parse_date(value):
+    """
+    The date an ISO date or datetime string starts with, or None.
+    """
+    try:
+        return date.fromisoformat((value or "").strip()[:10])
+    except ValueError:
+        return None
+
+
+def timeline_consistency(booked, offense, received, grace_days=1):
+    """
+    How well a jail booking date fits a condemned record's offense and received
+    dates, in [0, 1], or None when either side lacks the dates to tell:
+      - 1.0: booked between the offense and the transfer to state prison,
+      - 0.5: booked before the offense, which neither supports nor rules out a match,
+      - 0.0: booked after the person was received on the condemned list.
+    """
+    if not booked or not received:
+        return None
+    if booked > received + timedelta(days=grace_days):
+        return 0.0
+    if offense and booked < offense:
+        return 0.5
+    return 1.0
+
+
+def combine(name_confidence, consistency):
+    """
+    Folds date evidence into a name confidence: a consistent timeline keeps it,
+    a contradicting one takes away TIMELINE_WEIGHT of it, so a common name alone
+    no longer clears a high threshold. Without evidence the name decides.
+    """
+    if consistency is None:
+        return name_confidence
+    return round(name_confidence * (1 - TIMELINE_WEIGHT + TIMELINE_WEIGHT * consistency), 4)
+
+
+def match_records(left_records, right_records, left_name, right_name, min_confidence, consistency=None):
+    """
+    Blocks both record lists by blocking_keys and scores only pairs that share a
+    block, instead of comparing every left record with every right record.
+    left_name/right_name map a record to its (first_name, last_name).
+    consistency(left, right), when given, rates other evidence both records carry
+    (see timeline_consistency) and is folded into the confidence with combine.
+    Returns (left_record, right_record, confidence, method) tuples above
+    min_confidence, best matches first.
+    """
+    blocks = {}
+    right_keys = []
+    for position, record in enumerate(right_records):
+        key = name_key(*right_name(record))
+        right_keys.append(key)
+        for block in blocking_keys(*key):
+            blocks.setdefault(block, []).append(position)
+
+    matches = []
+    for left in left_records:
+        key = name_key(*left_name(left))
+        candidates = set()
+        for block in blocking_keys(*key):
+            candidates.update(blocks.get(block, ()))
+        for position in candidates:
+            confidence, method = score_pair(key, right_keys[position])
+            if consistency:
+                confidence = combine(confidence, consistency(left, right_records[position]))
+            if confidence >= min_confidence:
+                matches.append((left, right_records[position], confidence, method))
+
+    matches.sort(key=lambda m: m[2], reverse=True)
+    return matches
@@ -1,19 +1,58 @@
 import os
 import io
+import re
 import csv
+import hashlib
 import boto3
 import requests
 from bs4 import BeautifulSoup
+from functools import lru_cache
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from ingestion_client import notify_ingestion
 
 # Environment variables for S3 bucket and region
 BUCKET_NAME = os.environ.get("BUCKET_NAME")
 REGION = os.environ.get("REGION")
 
-s3_client = boto3.client("s3", region_name=REGION)
+# Section CSVs are uploaded in parallel, so size the connection pool to match.
+MAX_UPLOAD_WORKERS = 8
+
+# Clients are created on first use and reused by warm invocations.
+@lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client("s3", region_name=REGION, config=Config(
+        connect_timeout=5, read_timeout=30, retries={"max_attempts": 3, "mode": "standard"},
+        max_pool_connections=MAX_UPLOAD_WORKERS))
+
+@lru_cache(maxsize=None)
+def get_lambda_client():
+    return boto3.client("lambda", region_name=REGION, config=Config(connect_timeout=2, read_timeout=5, retries={"max_attempts": 3, "mode": "standard"}))
 
 # URL of the webpage to scrape
 url = "https://www.cdcr.ca.gov/capital-punishment/condemned-inmate-summary-report/"
 
+# Known funky sequences and their correct characters.
+ENCODING_FIXES = {
+    "‚Äì": "–",  # en dash
+    "â€“": "–",  # en dash
+    "â€”": "—",  # em dash
+    "Â": ""      # stray char
+}
+# Longest sequences first so "Â" never pre-empts a longer match.
+ENCODING_FIX_PATTERN = re.compile("|".join(
+    re.escape(bad) for bad in sorted(ENCODING_FIXES, key=len, reverse=True)
+))
+
+# Column names for the sections we know about; any other section keeps its own
+# headers, normalized the same way as the section title.
+SECTION_HEADERS = {
+    "ethnicity":          ["ethnicity", "total_count", "overall_percent", "male_total", "male_percent", "female_total", "female_percent"],
+    "age_range":          ["age_range", "total_count", "overall_percent", "male_total", "male_percent", "female_total", "female_percent"],
+    "year_received":      ["year", "total_count", "overall_percent", "male_total", "male_percent", "female_total", "female_percent"],
+    "sentencing_county":  ["county", "total_count", "overall_percent", "male_total", "male_percent", "female_total", "female_percent"]
+}
+
 def fetch_webpage(url):
     """
     Fetch the HTML content of the webpage, forcing UTF-8 encoding.
@@ -27,34 +66,33 @@ def fetch_webpage(url):
 
 def fix_encoding_issues(text):
     """
-    Replace some known funky sequences with their correct characters.
+    Replace some known funky sequences with their correct characters in a single pass.
+    """
+    return ENCODING_FIX_PATTERN.sub(lambda m: ENCODING_FIXES[m.group(0)], text)
+
+def normalize_name(text):
+    """
+    Turns a section title or header into a snake_case identifier.
     """
-    replacements = {
-        "‚Äì": "–",  # en dash
-        "â€“": "–",  # en dash
-        "â€”": "—",  # em dash
-        "Â": ""      # stray char
-    }
-    for bad, good in replacements.items():
-        text = text.replace(bad, good)
-    return text
+    text = text.lower().replace("%", " percent ")
+    return "_".join(re.findall(r"[a-z0-9]+", text))
 
 def extract_tables(soup):
     """
-    Extract tables from the HTML based on section headings.
+    Extract every table that follows a section heading, walking the document once.
+    A heading claims the first table figure after it, unless another heading comes first.
     """
     tables = {}
-    target_sections = ["Ethnicity", "Age Range", "Year Received", "Sentencing County"]
-    headings = soup.find_all("h2", class_="wp-block-heading")
-    for heading in headings:
-        section_title = heading.text.strip()
-        if section_title in target_sections:
-            figure = heading.find_next("figure", class_="wp-block-table")
-            if figure:
-                table = figure.find("table")
-                if table:
-                    normalized_title = section_title.lower().replace(" ", "_")
-                    tables[normalized_title] = table
+    section_title = None
+    for element in soup.find_all(["h2", "figure"]):
+        classes = element.get("class") or []
+        if element.name == "h2" and "wp-block-heading" in classes:
+            section_title = element.text.strip()
+        elif element.name == "figure" and "wp-block-table" in classes and section_title:
+            table = element.find("table")
+            if table:
+                tables[normalize_name(section_title)] = table
+                section_title = None
     return tables
 
 def extract_table_data(table):
@@ -73,48 +111,58 @@ def post_process_table(section, headers, rows):
     """
     Update header names and fix the total row for the given table based on its section.
     """
-    mapping = {
-        "ethnicity":          ["ethnicity", "total_count", "overall_percent", "male_total", "male_percent", "female_total", "female_percent"],
-        "age_range":          ["age_range", "total_count", "overall_percent", "male_total", "male_percent", "female_total", "female_percent"],
-        "year_received":      ["year", "total_count", "overall_percent", "male_total", "male_percent", "female_total", "female_percent"],
-        "sentencing_county":  ["county", "total_count", "overall_percent", "male_total", "male_percent", "female_total", "female_percent"]
-    }
-    new_headers = mapping.get(section, headers)
-    
-    # Remove the last row if it exists (assumed to be the total row)
-    if rows:
-        rows = rows[:-1]
-    
+    if section in SECTION_HEADERS:
+        new_headers = SECTION_HEADERS[section]
+        # Remove the last row if it exists (assumed to be the total row)
+        if rows:
+            rows = rows[:-1]
+    else:
+        new_headers = [normalize_name(h) for h in headers]
+        # Only drop a trailing row that is labelled as a total
+        if rows and rows[-1][0].strip().lower().startswith("total"):
+            rows = rows[:-1]
+
     return new_headers, rows
 
 def save_csv_to_s3(headers, rows, filename):
     """
     Save table data as a CSV file to S3.
+    Returns the uploaded object's key, schema, row count, size and content hash.
     """
     csv_buffer = io.StringIO()
     writer = csv.writer(csv_buffer)
     writer.writerow(headers)
     writer.writerows(rows)
-    
-    s3_client.put_object(Bucket=BUCKET_NAME, Key=filename, Body=csv_buffer.getvalue())
+    body = csv_buffer.getvalue().encode("utf-8")
+
+    get_s3_client().put_object(Bucket=BUCKET_NAME, Key=filename, Body=body)
     print(f"Uploaded {filename} to S3 bucket {BUCKET_NAME}")
+    return {"key": filename, "schema": headers, "rows": len(rows), "bytes": len(body), "sha256": hashlib.sha256(body).hexdigest()}
 
 def lambda_handler(event, context):
     try:
         html = fetch_webpage(url)
         soup = BeautifulSoup(html, "html.parser")
         tables = extract_tables(soup)
-        
+        outputs = []
+
         for section, table in tables.items():
             headers, rows = extract_table_data(table)
             if headers and rows:
                 headers, rows = post_process_table(section, headers, rows)
-                filename = f"{section}.csv"
-                save_csv_to_s3(headers, rows, filename)
+                outputs.append((headers, rows, f"{section}.csv"))
             else:
                 print(f"No data found for {section}")
-        return {"status": "Success"}
-    
+
+        uploaded = []
+        if outputs:
+            # boto3 client creation is not thread-safe, so build the shared client first
+            get_s3_client()
+            with ThreadPoolExecutor(max_workers=min(MAX_UPLOAD_WORKERS, len(outputs))) as executor:
+                uploaded = list(executor.map(lambda output: save_csv_to_s3(*output), outputs))
+            notify_ingestion("InmateSummaryScrapper", uploaded, get_lambda_client)
+        return {"status": "Success", "outputs": uploaded}
+
     except Exception as e:
         print(f"An error occurred: {e}")
         return {"status": "Error", "message": str(e)}
@@ -0,0 +1,72 @@
+import os
+from datetime import datetime, timezone
+from coordinator import update_json
+
+CATALOG_KEY = "catalog.json"
+
+
+def empty_catalog():
+    return {
+        "version": 0,          # bumped whenever any dataset's content changes
+        "updated_at": None,
+        "datasets": {},        # dataset name -> entry, see update_catalog
+    }
+
+
+def dataset_name(key):
+    return os.path.splitext(os.path.basename(key))[0]
+
+
+def update_catalog(store, objects, source, now=None):
+    """
+    Records the published objects in the single catalog document. Each entry keeps
+    the dataset's key, schema, row count, size, content hash and last change time,
+    and where its lookup index is when the scraper writes one.
+    The catalog version only moves when a content hash changes, so readers can use
+    it as a cheap cache-invalidation token. Returns the names of changed datasets.
+    """
+    now = now or datetime.now(timezone.utc).isoformat()
+
+    def mutate(catalog):
+        changed = []
+        for obj in objects:
+            name = obj.get("dataset") or dataset_name(obj["key"])
+            previous = catalog["datasets"].get(name, {})
+            entry = {
+                "key": obj["key"],
+                "source": source,
+                "schema": obj.get("schema", previous.get("schema", [])),
+                "row_count": obj.get("rows", previous.get("row_count")),
+                "bytes": obj.get("bytes", previous.get("bytes")),
+                "sha256": obj["sha256"],
+                "updated_at": previous.get("updated_at"),
+            }
+            if obj.get("index") or previous.get("index"):
+                entry["index"] = obj.get("index", previous.get("index"))
+            if previous.get("sha256") != obj["sha256"]:
+                entry["updated_at"] = now
+                changed.append(name)
+            catalog["datasets"][name] = entry
+        if changed:
+            catalog["version"] += 1
+            catalog["updated_at"] = now
+        return changed
+
+    changed = update_json(store, mutate)
+    print(f"[DEBUG] Catalog: {len(changed)} datasets changed: {changed}")
+    return changed
+
+
+def update_record_facets(store, shards):
+    """
+    Notes on each sharded dataset's entry where its record documents live and the
+    facet values the agent can filter them on. Facets are derived from the
+    dataset's content, so the catalog version does not move.
+    """
+    def mutate(catalog):
+        for shard in shards:
+            entry = catalog["datasets"].get(dataset_name(shard["key"]))
+            if entry is not None:
+                entry["records"] = {"prefix": shard["prefix"], "count": shard["records"], "facets": shard["facets"]}
+
+    update_json(store, mutate)
@@ -0,0 +1,297 @@
+import json
+import time
+import threading
+from botocore.exceptions import ClientError
+
+# Ingestion job states in which Bedrock will reject a new job for the same data source.
+ACTIVE_JOB_STATUSES = {"STARTING", "IN_PROGRESS", "STOPPING"}
+# Ingestion job states in which the job's objects never made it into the knowledge base.
+FAILED_JOB_STATUSES = {"FAILED", "STOPPED"}
+# Conditional-write failures returned by S3 when another writer got there first.
+CONFLICT_ERROR_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
+
+
+class StateConflict(Exception):
+    """
+    Raised by a state store when the state changed between load and save.
+    """
+
+
+def empty_state():
+    return {
+        "objects": {},         # key -> {"sha256", "ingested_at"} as of the last started job
+        "pending": {},         # key -> {"sha256", "source", "changed_at", "attempts"} waiting for ingestion
+        "last_change_at": None,
+        "job": None,           # last started ingestion job and the keys it carried
+        "retry_after": None,   # no job before this time after a failed one
+        "failed": {},          # key -> pending entry given up on after max_job_attempts failed jobs
+    }
+
+
+class S3StateStore:
+    """
+    Keeps a JSON document (coordinator state, data catalog) as a single object in S3.
+    Writes are conditional on the ETag that was read, so concurrent coordinator
+    invocations never overwrite each other's changes.
+    """
+
+    def __init__(self, s3_client, bucket, key, empty=empty_state):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.empty = empty
+
+    def load(self):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return self.empty(), None
+            raise
+        return json.loads(response["Body"].read()), response["ETag"]
+
+    def save(self, state, etag):
+        params = {
+            "Bucket": self.bucket,
+            "Key": self.key,
+            "Body": json.dumps(state, indent=2, sort_keys=True),
+            "ContentType": "application/json",
+        }
+        if etag:
+            params["IfMatch"] = etag
+        else:
+            params["IfNoneMatch"] = "*"
+        try:
+            self.s3_client.put_object(**params)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in CONFLICT_ERROR_CODES:
+                raise StateConflict(self.key) from e
+            raise
+
+
+class InMemoryStateStore:
+    """
+    Local stand-in for S3StateStore with the same optimistic-concurrency contract.
+    """
+
+    def __init__(self, state=None, empty=empty_state):
+        self.empty = empty
+        self._lock = threading.Lock()
+        self._state = json.dumps(state) if state is not None else None
+        self._version = 0
+
+    def load(self):
+        with self._lock:
+            if self._state is None:
+                return self.empty(), None
+            return json.loads(self._state), str(self._version)
+
+    def save(self, state, etag):
+        with self._lock:
+            current = str(self._version) if self._state is not None else None
+            if etag != current:
+                raise StateConflict("in-memory state")
+            self._state = json.dumps(state)
+            self._version += 1
+
+
+def update_json(store, mutate, max_attempts=5):
+    """
+    Applies mutate(state) to a store's JSON document under optimistic concurrency,
+    retrying on conflicts. mutate must be free of side effects since it can run more
+    than once.
+    """
+    for attempt in range(max_attempts):
+        state, etag = store.load()
+        result = mutate(state)
+        try:
+            store.save(state, etag)
+            return result
+        except StateConflict:
+            print(f"[DEBUG] State conflict on attempt {attempt + 1}, retrying.")
+    raise StateConflict(f"Gave up after {max_attempts} attempts")
+
+
+class IngestionCoordinator:
+    """
+    Tracks which data-bucket objects changed by content hash and turns bursts of
+    changes into a single, debounced knowledge base ingestion job.
+
+    Scrapers report the objects they uploaded through record_changes(). Nothing is
+    ingested until no further change has arrived for quiet_period seconds, and a
+    flush with no pending changes never starts a job.
+
+    Objects of a job that fails are retried after quiet_period, doubling with every
+    further failure up to max_retry_delay. After max_job_attempts failed jobs they
+    are moved to state["failed"] and only ingested again once their content changes.
+    """
+
+    def __init__(self, agent_client, store, knowledge_base_id, data_source_id,
+                 quiet_period=300, max_attempts=5, max_job_attempts=4, max_retry_delay=3600, clock=time.time):
+        self.agent_client = agent_client
+        self.store = store
+        self.knowledge_base_id = knowledge_base_id
+        self.data_source_id = data_source_id
+        self.quiet_period = quiet_period
+        self.max_attempts = max_attempts
+        self.max_job_attempts = max_job_attempts
+        self.max_retry_delay = max_retry_delay
+        self.clock = clock
+
+    def _update(self, mutate):
+        return update_json(self.store, mutate, self.max_attempts)
+
+    def record_changes(self, objects, source="unknown"):
+        """
+        Records the given objects ({"key", "sha256"}) and returns the keys whose
+        content differs from what was last ingested or already queued.
+        """
+        now = self.clock()
+
+        def mutate(state):
+            changed = []
+            for obj in objects:
+                key, sha256 = obj["key"], obj["sha256"]
+                queued = state["pending"].get(key)
+                ingested = state["objects"].get(key)
+                if queued and queued["sha256"] == sha256:
+                    continue
+                if state.get("failed", {}).get(key, {}).get("sha256") == sha256:
+                    # Given up on; only new content is tried again
+                    continue
+                if ingested and ingested["sha256"] == sha256:
+                    # Reverted to the ingested content before the job started.
+                    if state["pending"].pop(key, None):
+                        changed.append(key)
+                    continue
+                state["pending"][key] = {"sha256": sha256, "source": source, "changed_at": now}
+                # New content gets a fresh set of attempts
+                state.setdefault("failed", {}).pop(key, None)
+                changed.append(key)
+            if changed:
+                state["last_change_at"] = now
+            return changed
+
+        changed = self._update(mutate)
+        print(f"[DEBUG] {source}: {len(changed)} of {len(objects)} objects changed: {changed}")
+        return changed
+
+    def _refresh_job(self, job):
+        if not job or job.get("status") not in ACTIVE_JOB_STATUSES:
+            return job
+        response = self.agent_client.get_ingestion_job(
+            knowledgeBaseId=self.knowledge_base_id,
+            dataSourceId=self.data_source_id,
+            ingestionJobId=job["ingestionJobId"],
+        )
+        return dict(job, status=response["ingestionJob"]["status"])
+
+    def _settle_job(self, job):
+        """
+        Saves the job's refreshed status. The objects of a failed or stopped job
+        were marked as ingested when it started, so they no longer count as
+        ingested and are queued again (unless a newer change is already pending)
+        with one more attempt, or given up on once they reach max_job_attempts.
+        Returns (requeued keys, given-up keys).
+        """
+        now = self.clock()
+
+        def mutate(state):
+            if (state["job"] or {}).get("ingestionJobId") != job["ingestionJobId"]:
+                # Another flush already moved on to a newer job
+                return [], []
+            state["job"] = dict(job)
+            if job["status"] not in FAILED_JOB_STATUSES:
+                return [], []
+            requeued, given_up = [], []
+            for key, entry in job.get("objects", {}).items():
+                if state["objects"].get(key, {}).get("sha256") == entry["sha256"]:
+                    del state["objects"][key]
+                if key in state["pending"]:
+                    continue
+                entry = dict(entry, attempts=entry.get("attempts", 0) + 1)
+                if entry["attempts"] >= self.max_job_attempts:
+                    state.setdefault("failed", {})[key] = dict(entry, failed_at=now, ingestionJobId=job["ingestionJobId"])
+                    given_up.append(key)
+                else:
+                    state["pending"][key] = entry
+                    requeued.append(key)
+            if requeued:
+                attempts = max(state["pending"][key]["attempts"] for key in requeued)
+                state["retry_after"] = now + min(self.quiet_period * 2 ** (attempts - 1), self.max_retry_delay)
+            state["job"]["objects"] = {}
+            return requeued, given_up
+
+        requeued, given_up = self._update(mutate)
+        if requeued:
+            print(f"[DEBUG] Ingestion job {job['ingestionJobId']} ended {job['status']}; requeued {sorted(requeued)}")
+        if given_up:
+            print(f"[DEBUG] Ingestion job {job['ingestionJobId']} ended {job['status']}; giving up on {sorted(given_up)} "
+                  f"after {self.max_job_attempts} failed jobs")
+        return requeued, given_up
+
+    def flush(self, force=False):
+        """
+        Starts one ingestion job for everything pending once the quiet period has
+        elapsed. The last job is checked first, so the objects of a job that ended
+        FAILED or STOPPED are retried, after their backoff, even when nothing new
+        arrived. Returns a dict describing what happened. When the last job has
+        just completed and nothing else is pending, the knowledge base holds all
+        the current data, and the dict's "completed" names that job and the
+        objects it ingested.
+        """
+        now = self.clock()
+        state, _ = self.store.load()
+        job = self._refresh_job(state["job"])
+        completed = None
+        if job and (job != state["job"] or (job["status"] in FAILED_JOB_STATUSES and job.get("objects"))):
+            self._settle_job(job)
+            state, _ = self.store.load()
+            if job["status"] == "COMPLETE" and state["job"] == job:
+                completed = {"ingestionJobId": job["ingestionJobId"], "objects": job.get("objects", {})}
+        if not state["pending"]:
+            result = {"action": "skipped", "reason": "no changes"}
+            if completed:
+                result["completed"] = completed
+            return result
+        idle = now - (state["last_change_at"] or 0)
+        if not force and idle < self.quiet_period:
+            return {"action": "deferred", "reason": f"last change {idle:.0f}s ago"}
+        retry_after = state.get("retry_after")
+        if not force and retry_after and now < retry_after:
+            return {"action": "deferred", "reason": f"retrying failed ingestion in {retry_after - now:.0f}s"}
+
+        if job and job["status"] in ACTIVE_JOB_STATUSES:
+            return {"action": "deferred", "reason": f"job {job['ingestionJobId']} is {job['status']}"}
+
+        batch = dict(state["pending"])
+        description = f"{len(batch)} changed: " + ", ".join(sorted(batch))
+        try:
+            response = self.agent_client.start_ingestion_job(
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=self.data_source_id,
+                description=description[:200],
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConflictException":
+                return {"action": "deferred", "reason": "another ingestion job is running"}
+            raise
+        started = response["ingestionJob"]
+
+        def mutate(s):
+            for key, entry in batch.items():
+                s["objects"][key] = {"sha256": entry["sha256"], "ingested_at": now}
+                # Leave newer changes that arrived while the job was starting.
+                if s["pending"].get(key, {}).get("sha256") == entry["sha256"]:
+                    del s["pending"][key]
+            s["job"] = {
+                "ingestionJobId": started["ingestionJobId"],
+                "status": started["status"],
+                "started_at": now,
+                "objects": batch,
+            }
+            s["retry_after"] = None
+
+        self._update(mutate)
+        print(f"[DEBUG] Started ingestion job {started['ingestionJobId']} for {sorted(batch)}")
+        return {"action": "started", "ingestionJobId": started["ingestionJobId"], "keys": sorted(batch)}
@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import boto3
+from functools import lru_cache
+from botocore.config import Config
+from coordinator import IngestionCoordinator, S3StateStore
+from catalog import CATALOG_KEY, empty_catalog, update_catalog, update_record_facets
+from records import RecordSharder
+
+# Environment variables
+BUCKET_NAME = os.environ.get("BUCKET_NAME")
+STATE_BUCKET_NAME = os.environ.get("STATE_BUCKET_NAME")
+REGION = os.environ.get("REGION")
+KB_ID = os.environ.get("KB_ID")
+DATA_SOURCE_ID = os.environ.get("DATA_SOURCE_ID")
+QUIET_PERIOD_SECONDS = int(os.environ.get("QUIET_PERIOD_SECONDS", "300"))
+# Warms the answer cache once an ingestion job has made the current data searchable
+ANSWER_PRECOMPUTE_FUNCTION_ARN = os.environ.get("ANSWER_PRECOMPUTE_FUNCTION_ARN")
+STATE_KEY = "ingestion/state.json"
+
+CLIENT_CONFIG = Config(connect_timeout=5, read_timeout=30, retries={"max_attempts": 3, "mode": "standard"})
+
+
+# Clients are created on first use and reused by warm invocations.
+@lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client("s3", region_name=REGION, config=CLIENT_CONFIG)
+
+
+@lru_cache(maxsize=None)
+def get_bedrock_agent_client():
+    return boto3.client("bedrock-agent", region_name=REGION, config=CLIENT_CONFIG)
+
+
+@lru_cache(maxsize=None)
+def get_lambda_client():
+    return boto3.client("lambda", region_name=REGION, config=CLIENT_CONFIG)
+
+
+def start_precompute(completed):
+    """
+    Hands the datasets a completed ingestion job carried to the answer precompute
+    function, so answers are only precomputed against data the knowledge base can
+    already retrieve. Record prefixes are left out; the catalog lists their CSVs.
+    A failure to start it is logged and does not fail the flush.
+    """
+    if not ANSWER_PRECOMPUTE_FUNCTION_ARN:
+        return {"status": "disabled"}
+    outputs = [{"key": key, "sha256": entry["sha256"]} for key, entry in completed["objects"].items() if not key.endswith("/")]
+    try:
+        get_lambda_client().invoke(
+            FunctionName=ANSWER_PRECOMPUTE_FUNCTION_ARN,
+            InvocationType="Event",
+            Payload=json.dumps({"ingestionJobId": completed["ingestionJobId"], "outputs": outputs}),
+        )
+        return {"status": "started", "outputs": len(outputs)}
+    except Exception as e:
+        print(f"[DEBUG] Could not start the answer precompute: {e}")
+        return {"status": "failed", "error": str(e)}
+
+
+def object_sha256(key):
+    """
+    Hashes an object in the data bucket, for callers that did not send a hash.
+    """
+    digest = hashlib.sha256()
+    body = get_s3_client().get_object(Bucket=BUCKET_NAME, Key=key)["Body"]
+    for chunk in iter(lambda: body.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def lambda_handler(event, context):
+    """
+    Two kinds of events are accepted:
+      - {"source": ..., "objects": [{"key": ..., "sha256": ..., "schema": ..., "rows": ...}, ...]}
+        from the scrapers after they upload; the data catalog is updated, sharded
+        datasets get their per-record documents brought up to date (see records.py)
+        and changed objects are queued for the next ingestion job.
+      - {"action": "flush"} from the schedule; starts one ingestion job for all queued
+        changes once no new change has arrived for QUIET_PERIOD_SECONDS, and starts
+        the answer precompute once a job has completed with nothing left queued.
+    """
+    print(f"[DEBUG] Event: {json.dumps(event)}")
+    coordinator = IngestionCoordinator(
+        get_bedrock_agent_client(),
+        S3StateStore(get_s3_client(), STATE_BUCKET_NAME, STATE_KEY),
+        KB_ID,
+        DATA_SOURCE_ID,
+        quiet_period=QUIET_PERIOD_SECONDS,
+    )
+
+    result = {}
+    objects = event.get("objects")
+    if objects:
+        for obj in objects:
+            if not obj.get("sha256"):
+                obj["sha256"] = object_sha256(obj["key"])
+        source = event.get("source", "unknown")
+        catalog_store = S3StateStore(get_s3_client(), STATE_BUCKET_NAME, CATALOG_KEY, empty=empty_catalog)
+        result["catalog_changed"] = update_catalog(catalog_store, objects, source)
+
+        sharder = RecordSharder(get_s3_client(), BUCKET_NAME, STATE_BUCKET_NAME)
+        shards = [shard for shard in (sharder.shard(obj["key"], obj["sha256"]) for obj in objects) if shard]
+        if shards:
+            result["records"] = [{k: v for k, v in shard.items() if k != "facets"} for shard in shards]
+            if any(not shard["skipped"] for shard in shards):
+                update_record_facets(catalog_store, shards)
+            # Each record prefix is queued as one object, changed whenever any of its records did
+            objects = objects + [{"key": shard["prefix"], "sha256": shard["manifest_sha256"]} for shard in shards if shard["manifest_sha256"]]
+        result["changed"] = coordinator.record_changes(objects, source=source)
+
+    if event.get("action") == "flush" or objects:
+        result["flush"] = coordinator.flush(force=bool(event.get("force")))
+        if result["flush"].get("completed"):
+            result["precompute"] = start_precompute(result["flush"]["completed"])
+
+    print(f"[DEBUG] Result: {json.dumps(result)}")
+    return {"statusCode": 200, "body": json.dumps(result)}
@@ -0,0 +1,68 @@
+import itertools
+import threading
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+
+class FakeBedrockAgentClient:
+    """
+    Offline stand-in for boto3.client("bedrock-agent") covering the ingestion job
+    calls used by the coordinator. Each get_ingestion_job call advances a job one
+    step through `progression`, and starting a job while another one is active
+    raises the same ConflictException the real service returns.
+    """
+
+    def __init__(self, progression=("STARTING", "IN_PROGRESS", "COMPLETE")):
+        self.progression = list(progression)
+        self.jobs = {}
+        self.started = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _job_view(self, job):
+        return {
+            "knowledgeBaseId": job["knowledgeBaseId"],
+            "dataSourceId": job["dataSourceId"],
+            "ingestionJobId": job["ingestionJobId"],
+            "description": job["description"],
+            "status": self.progression[job["step"]],
+            "startedAt": job["startedAt"],
+            "updatedAt": datetime.now(timezone.utc),
+        }
+
+    def _is_active(self, job):
+        return self.progression[job["step"]] not in ("COMPLETE", "FAILED", "STOPPED")
+
+    def start_ingestion_job(self, knowledgeBaseId, dataSourceId, description="", clientToken=None):
+        with self._lock:
+            for job in self.jobs.values():
+                if job["dataSourceId"] == dataSourceId and self._is_active(job):
+                    raise ClientError(
+                        {"Error": {"Code": "ConflictException",
+                                   "Message": f"Ingestion job {job['ingestionJobId']} is already running"}},
+                        "StartIngestionJob",
+                    )
+            job_id = f"FAKEJOB{next(self._ids):05d}"
+            job = {
+                "knowledgeBaseId": knowledgeBaseId,
+                "dataSourceId": dataSourceId,
+                "ingestionJobId": job_id,
+                "description": description,
+                "step": 0,
+                "startedAt": datetime.now(timezone.utc),
+            }
+            self.jobs[job_id] = job
+            self.started.append(job_id)
+            return {"ingestionJob": self._job_view(job)}
+
+    def get_ingestion_job(self, knowledgeBaseId, dataSourceId, ingestionJobId):
+        with self._lock:
+            job = self.jobs.get(ingestionJobId)
+            if job is None:
+                raise ClientError(
+                    {"Error": {"Code": "ResourceNotFoundException",
+                               "Message": f"Ingestion job {ingestionJobId} not found"}},
+                    "GetIngestionJob",
+                )
+            job["step"] = min(job["step"] + 1, len(self.progression) - 1)
+            return {"ingestionJob": self._job_view(job)}
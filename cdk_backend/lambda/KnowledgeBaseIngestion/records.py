@@ -0,0 +1,204 @@
+import io
+import re
+import csv
+import json
+import hashlib
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+RECORD_PREFIX = "records/"
+MAX_WRITE_WORKERS = 16
+# Facet values are published for the agent's metadata filters; beyond this many
+# distinct values an attribute is not a useful filter.
+MAX_FACET_VALUES = 200
+
+# Datasets split into one knowledge base document per row. Each row gets a stable
+# record id from its identity fields, so a row keeps its document across runs and
+# only rows whose content changed are rewritten (and re-embedded).
+#   attributes: metadata attribute -> (column, type); type YEAR takes the year out
+#               of a date column and is published as a NUMBER
+#   facets:     attributes whose values the agent may match in a prompt to filter on
+RECORD_DATASETS = {
+    "condemned_inmate_list.csv": {
+        "title": "Condemned inmate list record",
+        "id_fields": ["last_name", "first_name", "trial_county", "offense_date"],
+        "attributes": {
+            "trial_county": ("trial_county", "STRING"),
+            "received_year": ("received_date", "YEAR"),
+            "age_bucket": ("age_bucket", "STRING"),
+        },
+        "facets": ["trial_county", "received_year"],
+    },
+    "score_jail_data.csv": {
+        "title": "SCORE jail roster booking",
+        "id_fields": ["booking_number"],
+        "attributes": {
+            "booking_year": ("booking_datetime", "YEAR"),
+            "in_score_custody": ("In_Score_Custody", "BOOLEAN"),
+        },
+        "facets": ["booking_year"],
+    },
+}
+
+YEAR_PATTERN = re.compile(r"\b(19|20)\d{2}\b")
+
+
+def dataset_prefix(key):
+    return f"{RECORD_PREFIX}{key.rsplit('.', 1)[0]}/"
+
+
+def attribute_value(value, kind):
+    value = (value or "").strip()
+    if not value:
+        return None
+    if kind == "YEAR":
+        match = YEAR_PATTERN.search(value)
+        return int(match.group(0)) if match else None
+    if kind == "BOOLEAN":
+        return value.lower() == "true"
+    return value
+
+
+def record_id(row, id_fields):
+    identity = "|".join((row.get(field) or "").strip().lower() for field in id_fields)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16]
+
+
+def build_documents(rows, spec, key):
+    """
+    Returns {record_id: {"text", "metadata"}}. The text lists every non-empty
+    column under its CSV name, so the agent can relate a retrieved record to the
+    dataset's columns; the metadata becomes the document's .metadata.json sidecar.
+    """
+    documents = {}
+    for row in rows:
+        base = record_id(row, spec["id_fields"])
+        rid, n = base, 1
+        while rid in documents:
+            # Identical identity fields; keep both rows, numbered in file order
+            n += 1
+            rid = f"{base}-{n}"
+        lines = [spec["title"], f"dataset: {key}"]
+        lines += [f"{column}: {value.strip()}" for column, value in row.items() if column and value and value.strip()]
+        metadata = {"dataset": key.rsplit(".", 1)[0], "source_key": key, "record_id": rid}
+        for name, (column, kind) in spec["attributes"].items():
+            value = attribute_value(row.get(column), kind)
+            if value is not None:
+                metadata[name] = value
+        documents[rid] = {"text": "\n".join(lines) + "\n", "metadata": metadata}
+    return documents
+
+
+def document_hash(document):
+    return hashlib.sha256((document["text"] + json.dumps(document["metadata"], sort_keys=True)).encode("utf-8")).hexdigest()
+
+
+def facets(documents, spec):
+    """
+    Distinct values of the facet attributes, published in the data catalog so the
+    agent can build metadata filters without querying the knowledge base.
+    """
+    published = {}
+    for name in spec["facets"]:
+        kind = "NUMBER" if spec["attributes"][name][1] == "YEAR" else spec["attributes"][name][1]
+        values = sorted({d["metadata"][name] for d in documents.values() if name in d["metadata"]})
+        if 0 < len(values) <= MAX_FACET_VALUES:
+            published[name] = {"type": kind, "values": values}
+    return published
+
+
+class RecordSharder:
+    """
+    Keeps records/<dataset>/<record_id>.txt (and its .metadata.json sidecar) in the
+    data bucket in step with a sharded CSV. A manifest per dataset in the state
+    bucket holds each record's content hash, so a run only writes new or changed
+    records and deletes the ones that disappeared; unchanged documents are left
+    alone and the knowledge base does not re-embed them.
+    """
+
+    def __init__(self, s3_client, data_bucket, state_bucket, datasets=RECORD_DATASETS):
+        self.s3_client = s3_client
+        self.data_bucket = data_bucket
+        self.state_bucket = state_bucket
+        self.datasets = datasets
+
+    def _manifest_key(self, key):
+        # Same layout as the documents, but in the state bucket so it is never ingested
+        return f"{dataset_prefix(key)}manifest.json"
+
+    def _load_manifest(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.state_bucket, Key=self._manifest_key(key))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return {"source_sha256": None, "records": {}}
+            raise
+        return json.loads(response["Body"].read())
+
+    def _read_rows(self, key):
+        body = self.s3_client.get_object(Bucket=self.data_bucket, Key=key)["Body"].read()
+        return list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+
+    def _write(self, item):
+        doc_key, document = item
+        self.s3_client.put_object(Bucket=self.data_bucket, Key=doc_key, Body=document["text"].encode("utf-8"), ContentType="text/plain")
+        self.s3_client.put_object(
+            Bucket=self.data_bucket,
+            Key=f"{doc_key}.metadata.json",
+            Body=json.dumps({"metadataAttributes": document["metadata"]}),
+            ContentType="application/json",
+        )
+
+    def _delete(self, doc_keys):
+        keys = [k for doc_key in doc_keys for k in (doc_key, f"{doc_key}.metadata.json")]
+        for start in range(0, len(keys), 1000):
+            self.s3_client.delete_objects(
+                Bucket=self.data_bucket,
+                Delete={"Objects": [{"Key": k} for k in keys[start:start + 1000]], "Quiet": True},
+            )
+
+    def shard(self, key, sha256):
+        """
+        Brings one dataset's record documents up to date with the CSV at key, whose
+        content hash is sha256. Returns None for datasets that are not sharded, and
+        otherwise a summary including the manifest hash and the facets.
+        """
+        spec = self.datasets.get(key)
+        if not spec:
+            return None
+        prefix = dataset_prefix(key)
+        manifest = self._load_manifest(key)
+        if manifest.get("source_sha256") == sha256:
+            return {"key": key, "prefix": prefix, "skipped": True, "records": len(manifest["records"]),
+                    "manifest_sha256": manifest.get("manifest_sha256"), "facets": manifest.get("facets", {})}
+
+        documents = build_documents(self._read_rows(key), spec, key)
+        hashes = {rid: document_hash(document) for rid, document in documents.items()}
+        previous = manifest.get("records", {})
+        changed = [rid for rid, digest in hashes.items() if previous.get(rid) != digest]
+        removed = [rid for rid in previous if rid not in hashes]
+
+        with ThreadPoolExecutor(max_workers=MAX_WRITE_WORKERS) as executor:
+            list(executor.map(self._write, [(f"{prefix}{rid}.txt", documents[rid]) for rid in changed]))
+        if removed:
+            self._delete([f"{prefix}{rid}.txt" for rid in removed])
+
+        manifest = {
+            "source_key": key,
+            "source_sha256": sha256,
+            "records": hashes,
+            "facets": facets(documents, spec),
+            "manifest_sha256": hashlib.sha256(json.dumps(hashes, sort_keys=True).encode("utf-8")).hexdigest(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        # Written last, so the changes of a run that fails halfway are written again by the next one
+        self.s3_client.put_object(
+            Bucket=self.state_bucket,
+            Key=self._manifest_key(key),
+            Body=json.dumps(manifest),
+            ContentType="application/json",
+        )
+        print(f"[DEBUG] Records for {key}: {len(changed)} written, {len(removed)} deleted, {len(hashes) - len(changed)} unchanged")
+        return {"key": key, "prefix": prefix, "skipped": False, "records": len(hashes), "written": len(changed),
+                "deleted": len(removed), "manifest_sha256": manifest["manifest_sha256"], "facets": manifest["facets"]}
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import threading
+import requests
+from urllib.parse import urlparse
+from bs4 import BeautifulSoup
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "facilities.json")
+
+
+def load_config(path=None):
+    """
+    Reads the facility config (facilities.json next to this file unless path or
+    FACILITIES_CONFIG is given) and resolves every facility against its portal's
+    defaults, so each facility dict carries its own fields, roster_path, etc.
+    """
+    with open(path or os.environ.get("FACILITIES_CONFIG") or CONFIG_PATH) as f:
+        config = json.load(f)
+    facilities = []
+    for facility in config["facilities"]:
+        portal = config["portals"][facility.get("portal", "jils")]
+        resolved = dict(portal, **facility)
+        resolved.setdefault("portal", "jils")
+        resolved["fields"] = dict(portal.get("fields", {}), **facility.get("fields", {}))
+        facilities.append(resolved)
+    return facilities, config.get("politeness", {})
+
+
+class HostLimiter:
+    """
+    Per-host politeness budget: at most max_concurrent requests in flight and at
+    least min_interval_seconds between the starts of two requests to the same host.
+    Facilities on different hosts never wait for each other; facilities sharing a
+    portal host share its budget.
+    """
+
+    def __init__(self, politeness, clock=time.monotonic, sleep=time.sleep):
+        self.default = politeness.get("default", {})
+        self.hosts = politeness.get("hosts", {})
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def _host_state(self, host):
+        with self._lock:
+            if host not in self._state:
+                settings = dict(self.default, **self.hosts.get(host, {}))
+                self._state[host] = {
+                    "slots": threading.Semaphore(settings.get("max_concurrent", 1)),
+                    "interval": settings.get("min_interval_seconds", 1.0),
+                    "next_start": 0.0,
+                    "lock": threading.Lock(),
+                }
+            return self._state[host]
+
+    def acquire(self, host):
+        state = self._host_state(host)
+        state["slots"].acquire()
+        with state["lock"]:
+            start = max(self.clock(), state["next_start"])
+            state["next_start"] = start + state["interval"]
+        wait = start - self.clock()
+        if wait > 0:
+            self.sleep(wait)
+
+    def release(self, host):
+        self._host_state(host)["slots"].release()
+
+
+class PoliteFetcher:
+    """
+    requests.get through the host limiter, with one pooled session per host so
+    repeated requests to a portal reuse its connection.
+    """
+
+    def __init__(self, limiter, timeout=30):
+        self.limiter = limiter
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def _session(self, host):
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = requests.Session()
+            return self._sessions[host]
+
+    def get(self, url, **kwargs):
+        host = urlparse(url).netloc
+        kwargs.setdefault("timeout", self.timeout)
+        self.limiter.acquire(host)
+        try:
+            return self._session(host).get(url, **kwargs)
+        finally:
+            self.limiter.release(host)
+
+
+def normalize_label(text):
+    return " ".join((text or "").replace(":", " ").lower().split())
+
+
+def field_value(rows, labelled, spec):
+    """
+    Reads one field from a roster panel. The row is found by its label when the
+    portal prints one, which survives reordered rows, and by its position otherwise.
+    spec: {"labels": [...], "index": n, "attr": "href"} (attr reads a link instead
+    of the text).
+    """
+    row = None
+    for label in spec.get("labels", []):
+        row = labelled.get(normalize_label(label))
+        if row is not None:
+            break
+    if row is None and spec.get("index") is not None and spec["index"] < len(rows):
+        row = rows[spec["index"]]
+    if row is None:
+        return ""
+    li = row.find("li")
+    if not li:
+        return ""
+    if spec.get("attr"):
+        link = li.find("a", href=True)
+        return link[spec["attr"]] if link else ""
+    return li.get_text(strip=True)
+
+
+def parse_jils_roster(html, facility):
+    """
+    Parses a JILS roster page: one "uk-panel" per person with one labelled row per
+    field. Returns a list of dicts keyed by the facility's field names.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    panels = soup.find_all("div", class_=facility.get("panel_class", "uk-width-1 uk-panel"))
+    print(f"[DEBUG] {facility['id']}: found {len(panels)} inmate panels on roster page")
+    records = []
+    for idx, panel in enumerate(panels, start=1):
+        rows = panel.find_all("div", class_="row")
+        if len(rows) < facility.get("min_rows", 1):
+            print(f"  [DEBUG] {facility['id']}: skipping panel {idx} due to insufficient rows")
+            continue
+        labelled = {}
+        for row in rows:
+            label = row.find("b", class_="uk-visible-small")
+            if label:
+                labelled.setdefault(normalize_label(label.get_text()), row)
+        records.append({name: field_value(rows, labelled, spec) for name, spec in facility["fields"].items()})
+    return records
+
+
+# Roster parsers by portal type; a portal with a different page layout gets its own.
+PARSERS = {
+    "jils": parse_jils_roster,
+}
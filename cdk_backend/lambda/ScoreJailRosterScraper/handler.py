@@ -1,26 +1,43 @@
 import os
-import json
 import time
 import csv
 import boto3
 import re
+import hashlib
 import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
+from functools import lru_cache
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from facilities import PARSERS, HostLimiter, PoliteFetcher, load_config
+from ingestion_client import notify_ingestion
 
 # Regex to match date-time strings in "MM/DD/YYYY hh:mm AM/PM" format.
 DATETIME_PATTERN = re.compile(r"(\d{2}/\d{2}/\d{4})\s+(\d{1,2}:\d{2}\s*[AP]M)", re.IGNORECASE)
 
-def get_with_retry(url, max_retries=3, initial_delay=1, backoff_factor=2, **kwargs):
+# Tuned for the one upload per facility and one asynchronous invoke each run makes.
+CLIENT_CONFIG = Config(connect_timeout=5, read_timeout=30, retries={"max_attempts": 3, "mode": "standard"})
+
+@lru_cache(maxsize=None)
+def get_client(service, region):
+    """
+    Returns a boto3 client created on first use and reused by warm invocations.
+    """
+    return boto3.client(service, region_name=region, config=CLIENT_CONFIG)
+
+def get_with_retry(url, max_retries=3, initial_delay=1, backoff_factor=2, get=None, **kwargs):
     """
     Attempts to fetch the given URL with exponential backoff.
     If a request fails, it retries up to max_retries times.
+    get replaces requests.get, e.g. with a PoliteFetcher's, so retries count
+    against the host's politeness budget too.
     """
     delay = initial_delay
     for attempt in range(max_retries):
         try:
             print(f"[DEBUG] Attempt {attempt + 1} for URL: {url}")
-            response = requests.get(url, **kwargs)
+            response = (get or requests.get)(url, **kwargs)
             response.raise_for_status()
             return response
         except requests.exceptions.RequestException as e:
@@ -134,7 +151,17 @@ def scrape_inmate_view(base_url, inmate_nn):
 
     response = requests.post(view_url, data=payload)
     response.raise_for_status()
-    soup = BeautifulSoup("", "html.parser")  # Dummy blank soup
+    details = parse_inmate_view(response.text)
+    time.sleep(1)
+    return details
+
+
+def parse_inmate_view(html):
+    """
+    Parses a detailed inmate page into a dictionary of the inmate's current booking
+    details, offenses, and booking history.
+    """
+    soup = BeautifulSoup(html, "html.parser")
 
     details = {}
     # --- Process "Current Booking" section ---
@@ -211,62 +238,47 @@ def scrape_inmate_view(base_url, inmate_nn):
     else:
         print("    [DEBUG] 'Booking List' section not found.")
 
-    time.sleep(1)
     return details
 
-def scrape_score_jail(roster_url, base_url):
+def scrape_roster(facility, get=None):
     """
-    1. Fetch the main roster page.
-    2. For each inmate on the roster page, extract top-level info.
-    3. Return a list of dictionaries containing all main-page data.
+    Fetches a facility's roster page and parses it with its portal's parser.
+    Returns a list of dictionaries containing all main-page data.
     """
-    print(f"[DEBUG] Fetching roster page: {roster_url}")
-    response = get_with_retry(roster_url, max_retries=3, initial_delay=1, backoff_factor=2)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    inmate_panels = soup.find_all("div", class_="uk-width-1 uk-panel")
-    print(f"[DEBUG] Found {len(inmate_panels)} inmate panels on roster page")
-    all_inmates = []
-    for idx, panel in enumerate(inmate_panels, start=1):
-        rows = panel.find_all("div", class_="row")
-        if len(rows) < 9:
-            print(f"  [DEBUG] Skipping panel {idx} due to insufficient rows")
-            continue
-        inmate_data = {
-            "BookingNumber": rows[4].find("li").get_text(strip=True) if rows[4].find("li") else "",
-            "DateBooked(MM/DD/YYYY)": rows[5].find("li").get_text(strip=True) if rows[5].find("li") else "",
-            "DateReleased(MM/DD/YYYY)": rows[6].find("li").get_text(strip=True) if rows[6].find("li") else "",
-            "ScheduledReleaseDate(MM/DD/YYYY)": rows[7].find("li").get_text(strip=True) if rows[7].find("li") else "",
-            "FirstName": rows[2].find("li").get_text(strip=True) if rows[2].find("li") else "",
-            "LastName": rows[1].find("li").get_text(strip=True) if rows[1].find("li") else "",
-            "MiddleName": rows[3].find("li").get_text(strip=True) if rows[3].find("li") else "",
-            "NameNumber": rows[0].find_all("li")[0].get_text(strip=True) if rows[0].find_all("li") else "",
-            "VineLink": (rows[8].find("li").find("a", href=True)["href"]
-                         if rows[8].find("li") and rows[8].find("li").find("a", href=True)
-                         else "")
-        }
-        print(f"[DEBUG] Processing inmate {idx}: NN {inmate_data.get('NameNumber')}, {inmate_data.get('FirstName')} {inmate_data.get('LastName')}")
-        # Detailed inmate view scraping is currently disabled.
-        # Uncomment the lines below to include detailed inmate view data.
-        # additional_details = scrape_inmate_view(base_url, inmate_data["NameNumber"])
-        # inmate_data.update(additional_details)
-        all_inmates.append(inmate_data)
-    print(f"[DEBUG] Completed scraping roster. Total inmates processed: {len(all_inmates)}")
+    roster_url = facility.get("roster_url") or facility["base_url"].rstrip("/") + facility["roster_path"]
+    print(f"[DEBUG] {facility['id']}: fetching roster page: {roster_url}")
+    response = get_with_retry(roster_url, max_retries=3, initial_delay=1, backoff_factor=2, get=get)
+    all_inmates = PARSERS[facility["portal"]](response.text, facility)
+    # Detailed inmate view scraping is currently disabled; see scrape_inmate_view.
+    print(f"[DEBUG] {facility['id']}: completed scraping roster. Total inmates processed: {len(all_inmates)}")
     return all_inmates
 
-def save_to_csv(data, filename):
+def scrape_score_jail(roster_url, base_url):
+    """
+    Scrapes the SCORE roster at roster_url with SCORE's configured field map.
+    """
+    facility = next(f for f in load_config()[0] if f["id"] == "score")
+    return scrape_roster(dict(facility, roster_url=roster_url, base_url=base_url))
+
+def save_to_csv(data, filename, in_custody_text="In SCORE Custody"):
     """
     Saves the processed inmate data to a CSV file.
     The 'date_released' field is converted to a boolean:
-      - True if the value equals "In SCORE Custody"
+      - True if the value equals in_custody_text (the facility's custody status)
       - False otherwise.
+    The column keeps its SCORE-era name, In_Score_Custody, for every facility.
     
     Args:
         data (list of dict): List of inmate records.
         filename (str): The file path to save the CSV.
+        in_custody_text (str): What the roster shows for people still in custody.
+
+    Returns:
+        list of str: The CSV headers that were written.
     """
     # Convert the "date_released" field to boolean.
     for row in data:
-        row["date_released"] = True if row.get("date_released", "").strip() == "In SCORE Custody" else False
+        row["date_released"] = True if row.get("date_released", "").strip() == in_custody_text else False
 
     # Define CSV headers without datatype annotations.
     headers = [
@@ -310,28 +322,54 @@ def save_to_csv(data, filename):
                 new_row[new_header] = row.get(orig_key, "")
             writer.writerow(new_row)
     print(f"[DEBUG] Data saved successfully to '{filename}'.")
+    return headers
 
 
-def lambda_handler(event, context):
+def scrape_facility(facility, fetcher, bucket_name, region):
     """
-    AWS Lambda handler that:
-      1. Scrapes the main inmate roster from SCORE Jail (without detailed inmate view).
-      2. Post-processes date fields and combines date and time into datetime fields.
-      3. Saves the result as a CSV in the Lambda environment.
-      4. Uploads the CSV to an S3 bucket specified in the environment variables.
-      5. Returns a simple status message.
+    Scrapes, post-processes and uploads one facility's roster to its own output key
+    (its partition). Returns the output entry for the ingestion notification.
     """
-    base_url = "https://jils.scorejail.org"
-    roster_url = f"{base_url}/roster"
-    print("[DEBUG] Starting scraping process in Lambda...")
-    all_inmates_data = scrape_score_jail(roster_url, base_url)
+    started = time.monotonic()
+    all_inmates_data = scrape_roster(facility, get=fetcher.get)
 
     # Post-process data to combine date and time fields.
     processed_data = post_process_data(all_inmates_data)
 
-    csv_filename = "/tmp/score_jail_data.csv"  # Lambda can write to /tmp
-    save_to_csv(processed_data, csv_filename)
+    csv_filename = f"/tmp/{facility['id']}_roster.csv"  # Lambda can write to /tmp
+    csv_headers = save_to_csv(processed_data, csv_filename, facility.get("in_custody_text", "In SCORE Custody"))
 
+    s3_object_key = facility.get("output_key") or f"jail_rosters/{facility['id']}.csv"
+    get_client("s3", region).upload_file(csv_filename, bucket_name, s3_object_key)
+
+    with open(csv_filename, "rb") as f:
+        csv_bytes = f.read()
+    print(f"[DEBUG] {facility['id']}: saved {len(processed_data)} inmate records to '{s3_object_key}' in {time.monotonic() - started:.1f}s")
+    return {
+        "key": s3_object_key,
+        "schema": csv_headers,
+        "rows": len(processed_data),
+        "bytes": len(csv_bytes),
+        "sha256": hashlib.sha256(csv_bytes).hexdigest(),
+    }
+
+
+def lambda_handler(event, context):
+    """
+    AWS Lambda handler that, for every facility in facilities.json (or the ids in
+    the FACILITIES environment variable or the event's "facilities"):
+      1. Scrapes the main inmate roster (without detailed inmate view).
+      2. Post-processes date fields and combines date and time into datetime fields.
+      3. Saves the result as a CSV in the Lambda environment.
+      4. Uploads the CSV to the facility's own key in the S3 bucket; SCORE's stays
+         score_jail_data.csv.
+    Facilities run concurrently, and requests to each host are spaced by its
+    politeness budget, so a run takes about as long as its slowest host.
+    Then it notifies the ingestion coordinator of the uploads and their content
+    hashes, and returns the outputs and any facilities that failed. A run where
+    only some facilities failed answers 207 with their ids in failed_facilities,
+    so the orchestrator can retry just those.
+    """
     # Retrieve S3 bucket name and region from environment variables.
     bucket_name = os.environ.get('BUCKET_NAME')
     region = os.environ.get('REGION')
@@ -340,14 +378,38 @@ def lambda_handler(event, context):
     if not region:
         raise ValueError("REGION environment variable is not set.")
 
-    s3_object_key = "score_jail_data.csv"  # Change the key as desired.
-    s3_client = boto3.client("s3", region_name=region)
-    s3_client.upload_file(csv_filename, bucket_name, s3_object_key)
+    facilities, politeness = load_config()
+    selected = (event or {}).get("facilities") or [f for f in os.environ.get("FACILITIES", "").split(",") if f]
+    facilities = [f for f in facilities if f.get("enabled", True) and (not selected or f["id"] in selected)]
+    fetcher = PoliteFetcher(HostLimiter(politeness))
+    # Built before the worker threads start; boto3 client creation is not thread-safe.
+    get_client("s3", region)
+    print(f"[DEBUG] Starting scraping process for {[f['id'] for f in facilities]}...")
+
+    def run(facility):
+        try:
+            return scrape_facility(facility, fetcher, bucket_name, region), None
+        except Exception as e:
+            print(f"[DEBUG] {facility['id']} failed: {e}")
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(facilities))) as executor:
+        results = dict(zip([f["id"] for f in facilities], executor.map(run, facilities)))
+
+    outputs = [output for output, _ in results.values() if output]
+    failed = {facility_id: error for facility_id, (_, error) in results.items() if error}
+    if outputs:
+        notify_ingestion("ScoreJailRosterScraper", outputs, lambda: get_client("lambda", region))
 
-    msg = (f"[DEBUG] Saved {len(processed_data)} inmate records to S3 bucket '{bucket_name}' "
-           f"with key '{s3_object_key}' in region '{region}'.")
+    msg = (f"[DEBUG] Saved {sum(o['rows'] for o in outputs)} inmate records from {len(outputs)} facilities "
+           f"to S3 bucket '{bucket_name}' in region '{region}'.")
+    if failed:
+        msg += f" Failed: {failed}"
     print(msg)
     return {
-        'statusCode': 200,
-        'body': msg
+        # 500 when nothing was scraped, 207 when some facilities failed
+        'statusCode': (207 if outputs else 500) if failed else 200,
+        'body': msg,
+        'outputs': outputs,
+        'failed_facilities': failed,
     }
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import uuid
+import boto3
+from functools import lru_cache
+from botocore.config import Config
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+# Environment variables
+STATE_BUCKET_NAME = os.environ.get("STATE_BUCKET_NAME")
+REGION = os.environ.get("REGION")
+# Upper bound for one refresh, shared by every source and retry in the run.
+RUN_BUDGET_SECONDS = int(os.environ.get("RUN_BUDGET_SECONDS", "240"))
+MAX_ATTEMPTS = int(os.environ.get("MAX_ATTEMPTS", "2"))
+# Time kept back from the Lambda deadline to write the manifest.
+SAFETY_MARGIN_SECONDS = 10
+
+# Registered scrapers: source name -> environment variable holding its function ARN.
+# They all run concurrently in the scrape phase.
+SCRAPERS = {
+    "InmateSummaryScrapper": "INMATE_SUMMARY_FUNCTION_ARN",
+    "CondemnedInmateListScrapper": "CONDEMNED_LIST_FUNCTION_ARN",
+    "ScoreJailRosterScraper": "SCORE_ROSTER_FUNCTION_ARN",
+}
+# Stages that read scraper outputs; they run after the scrape phase, and only once
+# at least one of the sources they depend on has refreshed.
+POST_SCRAPE_STAGES = {
+    "EntityResolver": ("ENTITY_RESOLVER_FUNCTION_ARN", ["CondemnedInmateListScrapper", "ScoreJailRosterScraper"]),
+}
+
+MANIFEST_PREFIX = "runs/"
+LATEST_MANIFEST_KEY = "runs/latest.json"
+
+# Created on first use and reused by warm invocations.
+@lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client("s3", region_name=REGION, config=Config(connect_timeout=5, read_timeout=30, retries={"max_attempts": 3, "mode": "standard"}))
+
+def response_error(payload):
+    """
+    Returns an error message if a scraper's own response reports a failure.
+    The scrapers report failures either as statusCode >= 400 or status == "Error".
+    """
+    if not isinstance(payload, dict):
+        return None
+    if int(payload.get("statusCode", 200)) >= 400:
+        return payload.get("body") or f"statusCode {payload['statusCode']}"
+    if payload.get("status") == "Error":
+        return payload.get("message") or "status Error"
+    return None
+
+def invoke_source(name, function_arn, deadline, event=None):
+    """
+    Invokes one source synchronously with event as its payload, bounded by the
+    time left in the run budget. Never raises: every failure is captured in the
+    returned result. A source that reports failed_facilities next to its outputs
+    is "partial", with those facility ids in the result.
+    """
+    started = time.monotonic()
+    remaining = deadline - started
+    result = {"source": name, "status": "failed", "outputs": []}
+    try:
+        if remaining <= 1:
+            raise TimeoutError("run budget exhausted before the invocation started")
+        # A client per call, because the read timeout has to track the shrinking budget.
+        # Calls run on worker threads, and the default session is not thread-safe.
+        lambda_client = boto3.session.Session().client(
+            "lambda",
+            region_name=REGION,
+            config=Config(read_timeout=remaining, connect_timeout=5, retries={"max_attempts": 0}),
+        )
+        params = {"FunctionName": function_arn, "InvocationType": "RequestResponse"}
+        if event:
+            params["Payload"] = json.dumps(event)
+        response = lambda_client.invoke(**params)
+        payload = json.loads(response["Payload"].read() or b"null")
+        if response.get("FunctionError"):
+            error = payload.get("errorMessage") if isinstance(payload, dict) else str(payload)
+            raise RuntimeError(f"{response['FunctionError']}: {error}")
+        error = response_error(payload)
+        if error:
+            raise RuntimeError(error)
+        result["outputs"] = payload.get("outputs", [])
+        failed_facilities = payload.get("failed_facilities") if isinstance(payload, dict) else None
+        if failed_facilities:
+            result["status"] = "partial"
+            result["failed_facilities"] = failed_facilities
+            result["error"] = f"failed facilities: {sorted(failed_facilities)}"
+            print(f"[DEBUG] {name} partially failed: {sorted(failed_facilities)}")
+        else:
+            result["status"] = "succeeded"
+    except Exception as e:
+        result["error"] = str(e)
+        print(f"[DEBUG] {name} failed: {e}")
+    result["duration_seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+def run_phase(sources, deadline):
+    """
+    Runs all sources concurrently and retries only the ones that failed, for as long
+    as the shared deadline leaves room for another attempt of that source. A
+    partially failed source is retried for its failed facilities only, and keeps
+    the outputs of the ones that succeeded. sources maps a source name to its
+    function ARN.
+    """
+    results = {name: {"source": name, "attempts": 0, "outputs": []} for name in sources}
+    pending = {name: (arn, None) for name, arn in sources.items()}
+    while pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            futures = {name: executor.submit(invoke_source, name, arn, deadline, event) for name, (arn, event) in pending.items()}
+            attempt_results = {name: future.result() for name, future in futures.items()}
+
+        retry = {}
+        for name, attempt in attempt_results.items():
+            previous = results[name]
+            if attempt["status"] == "failed" and previous.get("status") == "partial":
+                # The retry of the failed facilities failed; the earlier outputs still stand
+                attempt = dict(attempt, status="partial", failed_facilities=previous["failed_facilities"])
+            attempts = previous["attempts"] + 1
+            total = previous.get("duration_seconds", 0) + attempt["duration_seconds"]
+            results[name] = dict(attempt, attempts=attempts, duration_seconds=round(total, 3),
+                                 outputs=previous["outputs"] + attempt["outputs"])
+            remaining = deadline - time.monotonic()
+            # Retry only when another attempt as long as the last one still fits.
+            if attempt["status"] != "succeeded" and attempts < MAX_ATTEMPTS and remaining > attempt["duration_seconds"]:
+                arn, event = pending[name]
+                if attempt["status"] == "partial":
+                    event = {"facilities": sorted(attempt["failed_facilities"])}
+                retry[name] = (arn, event)
+        pending = retry
+        if pending:
+            print(f"[DEBUG] Retrying failed sources: {sorted(pending)}")
+    return results
+
+def lambda_handler(event, context):
+    """
+    Refreshes every registered dataset in one run:
+      1. Invokes all scrapers concurrently within one shared time budget, so the run
+         takes as long as the slowest source rather than the sum of all of them.
+      2. Retries only the sources that failed, and only the failed facilities of a
+         partially failed source, while the budget allows.
+      3. Runs the post-scrape stages whose inputs were refreshed.
+      4. Writes a run manifest with each output's row count, duration, bytes and hash
+         to runs/<run_id>.json and runs/latest.json in the state bucket.
+    """
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:8]
+    started_at = datetime.now(timezone.utc)
+    start = time.monotonic()
+    budget = RUN_BUDGET_SECONDS
+    if context is not None:
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000 - SAFETY_MARGIN_SECONDS)
+    deadline = start + budget
+    print(f"[DEBUG] Run {run_id} starting with a {budget:.0f}s budget")
+
+    scrapers = {name: os.environ[env] for name, env in SCRAPERS.items() if os.environ.get(env)}
+    sources = run_phase(scrapers, deadline)
+
+    refreshed = {name for name, result in sources.items() if result["status"] != "failed"}
+    stages = {
+        name: os.environ[env]
+        for name, (env, inputs) in POST_SCRAPE_STAGES.items()
+        if os.environ.get(env) and refreshed.intersection(inputs)
+    }
+    if stages:
+        sources.update(run_phase(stages, deadline))
+
+    failed = sorted(name for name, result in sources.items() if result["status"] != "succeeded")
+    if not failed:
+        status = "succeeded"
+    elif refreshed:
+        status = "partial"
+    else:
+        status = "failed"
+
+    manifest = {
+        "run_id": run_id,
+        "status": status,
+        "started_at": started_at.isoformat(),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "duration_seconds": round(time.monotonic() - start, 3),
+        "budget_seconds": round(budget, 3),
+        "failed_sources": failed,
+        "sources": sources,
+    }
+    body = json.dumps(manifest, indent=2)
+    s3_client = get_s3_client()
+    s3_client.put_object(Bucket=STATE_BUCKET_NAME, Key=f"{MANIFEST_PREFIX}{run_id}.json", Body=body, ContentType="application/json")
+    s3_client.put_object(Bucket=STATE_BUCKET_NAME, Key=LATEST_MANIFEST_KEY, Body=body, ContentType="application/json")
+
+    print(f"[DEBUG] Run {run_id} finished: {status} in {manifest['duration_seconds']}s")
+    status_codes = {"succeeded": 200, "partial": 207, "failed": 500}
+    return {"statusCode": status_codes[status], "body": json.dumps({"run_id": run_id, "status": status, "failed_sources": failed})}
@@ -0,0 +1,19 @@
+import os
+import json
+
+
+def notify_ingestion(source, objects, get_lambda_client):
+    """
+    Hands the uploaded objects and their content hashes to the knowledge base
+    ingestion coordinator (INGESTION_FUNCTION_ARN), which batches them into one
+    debounced ingestion job. get_lambda_client is only called when it is set.
+    """
+    function_arn = os.environ.get("INGESTION_FUNCTION_ARN")
+    if not function_arn:
+        print(f"[DEBUG] {source}: INGESTION_FUNCTION_ARN is not set; skipping ingestion notification.")
+        return
+    get_lambda_client().invoke(
+        FunctionName=function_arn,
+        InvocationType="Event",
+        Payload=json.dumps({"source": source, "objects": objects})
+    )
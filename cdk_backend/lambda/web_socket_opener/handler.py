@@ -1,10 +1,38 @@
 import os
 import json
+import time
+import uuid
 import boto3
+from functools import lru_cache
+from botocore.config import Config
 
-lambda_client = boto3.client('lambda')
+# A report's questions are answered by one invocation of the batch function, so a
+# batch is limited to what fits in its timeout (the batch function enforces the same)
+MAX_BATCH_QUESTIONS = int(os.environ.get('MAX_BATCH_QUESTIONS', '50'))
+
+# The opener only hands the prompt off with an asynchronous invoke, which returns as
+# soon as Lambda has queued the event; keep the timeouts inside the function's own.
+LAMBDA_CONFIG = Config(connect_timeout=1, read_timeout=2, retries={'max_attempts': 2, 'mode': 'standard'}, tcp_keepalive=True)
+
+@lru_cache(maxsize=None)
+def get_lambda_client():
+    return boto3.client('lambda', config=LAMBDA_CONFIG)
+
+def prime():
+    """
+    Builds the Lambda client during init when PRIME_ON_INIT is set, so the first
+    message on a new container does not wait for it.
+    """
+    started = time.perf_counter()
+    get_lambda_client()
+    print(f"Primed in {time.perf_counter() - started:.3f}s")
+
+if os.environ.get('PRIME_ON_INIT', '').lower() == 'true':
+    prime()
 
 def handle_message(event, connection_id):
+    received_at = event.get('requestContext', {}).get('requestTimeEpoch')
+    received_at = received_at / 1000 if received_at else time.time()
     response_function_arn = os.environ['RESPONSE_FUNCTION_ARN']
 
     prompt = json.loads(event.get('body', '{}')).get('prompt')
@@ -23,10 +51,19 @@ def handle_message(event, connection_id):
         "prompt": prompt,
         "connectionId": connection_id,
         "history": history,
-        "sessionId": sessionId    
+        "sessionId": sessionId,
+        # Lets the client resume this answer's stream after a reconnect
+        "streamId": body.get('streamId') or uuid.uuid4().hex,
+        # The response function records its spans under this trace; the client may pass its own traceId
+        "traceContext": {
+            "traceId": body.get('traceId') or uuid.uuid4().hex,
+            "spanId": uuid.uuid4().hex[:16],
+            "receivedAt": received_at
+        }
     }
+    input["traceContext"]["sentAt"] = time.time()
     print(input)
-    lambda_client.invoke(
+    get_lambda_client().invoke(
         FunctionName=response_function_arn,
         InvocationType='Event',
         Payload=json.dumps(input)
@@ -34,11 +71,77 @@ def handle_message(event, connection_id):
     
     return {'statusCode': 200}
 
+def handle_resume(event, connection_id):
+    """
+    Hands a resume request ({"streamId", "fromSeq", "sessionId"}) to the response
+    function, which replays the stored frames on this connection.
+    """
+    body = json.loads(event.get('body') or '{}')
+    if not body.get('streamId'):
+        return {'statusCode': 400, 'body': 'streamId is required'}
+    input = {
+        "connectionId": connection_id,
+        "sessionId": body.get('sessionId'),
+        "resume": {
+            "streamId": body['streamId'],
+            "fromSeq": body.get('fromSeq', 0)
+        }
+    }
+    print(input)
+    get_lambda_client().invoke(
+        FunctionName=os.environ['RESPONSE_FUNCTION_ARN'],
+        InvocationType='Event',
+        Payload=json.dumps(input)
+    )
+    return {'statusCode': 200}
+
+def handle_batch(event, connection_id):
+    """
+    Hands a list of questions ({"questions": [...], "sessionId", "batchId"}) to
+    the batch function, the response function's code with a timeout long enough
+    for a report, which answers them concurrently and streams every answer
+    tagged with its questionIndex. Its answers resume like any other.
+    """
+    received_at = event.get('requestContext', {}).get('requestTimeEpoch')
+    received_at = received_at / 1000 if received_at else time.time()
+    body = json.loads(event.get('body') or '{}')
+    questions = body.get('questions')
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return {'statusCode': 400, 'body': 'questions must be a non-empty list of strings'}
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        return {'statusCode': 400, 'body': f'At most {MAX_BATCH_QUESTIONS} questions per batch'}
+
+    input = {
+        "connectionId": connection_id,
+        "sessionId": body.get('sessionId'),
+        "batch": {
+            "batchId": body.get('batchId') or uuid.uuid4().hex,
+            "questions": questions
+        },
+        "traceContext": {
+            "traceId": body.get('traceId') or uuid.uuid4().hex,
+            "spanId": uuid.uuid4().hex[:16],
+            "receivedAt": received_at
+        }
+    }
+    input["traceContext"]["sentAt"] = time.time()
+    print(input)
+    get_lambda_client().invoke(
+        FunctionName=os.environ['BATCH_FUNCTION_ARN'],
+        InvocationType='Event',
+        Payload=json.dumps(input)
+    )
+    return {'statusCode': 200}
+
 def lambda_handler(event, context):
     route_key = event.get('requestContext', {}).get('routeKey')
     connection_id = event.get('requestContext', {}).get('connectionId')
 
     if route_key == 'sendMessage':
         return handle_message(event, connection_id)
+    elif route_key == 'resumeStream':
+        return handle_resume(event, connection_id)
+    elif route_key == 'batchMessage':
+        return handle_batch(event, connection_id)
     else:
         return {'statusCode': 400, 'body': 'Unsupported route'}
\ No newline at end of file
@@ -10,6 +10,9 @@ import * as apigatewayv2_integrations from 'aws-cdk-lib/aws-apigatewayv2-integra
 import { bedrock as bedrock } from '@cdklabs/generative-ai-cdk-constructs';
 import * as secretsmanager from 'aws-cdk-lib/aws-secretsmanager';
 import * as amplify from '@aws-cdk/aws-amplify-alpha';
+import * as events from 'aws-cdk-lib/aws-events';
+import * as targets from 'aws-cdk-lib/aws-events-targets';
+import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 
 export class CdkBackendStack1 extends cdk.Stack {
   constructor(scope: Construct, id: string, props?: cdk.StackProps) {
@@ -46,6 +49,28 @@ export class CdkBackendStack1 extends cdk.Stack {
       removalPolicy: cdk.RemovalPolicy.RETAIN, 
     });
 
+    // Internal pipeline state (ingestion bookkeeping etc.), kept out of the
+    // knowledge base data source so it never gets ingested.
+    const PipelineState = new s3.Bucket(this, 'PipelineState', {
+      removalPolicy: cdk.RemovalPolicy.RETAIN,
+      // Full-resolution chart/CSV downloads are only linked for the length of a chat
+      lifecycleRules: [
+        { prefix: 'artifacts/', expiration: cdk.Duration.days(1) },
+        // Precomputed answers are per data version; stale versions are never read again
+        { prefix: 'answers/', expiration: cdk.Duration.days(7) },
+        // Completed answer streams for resuming; the agent stops serving them after STREAM_RETENTION_SECONDS
+        { prefix: 'streams/', expiration: cdk.Duration.days(1) },
+      ],
+    });
+
+    // Which CSVs each chat session's code interpreter already has loaded
+    const SessionFiles = new dynamodb.Table(this, 'SessionFiles', {
+      partitionKey: { name: 'sessionId', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
     // role with s3 access and bedrock full access
     const bedrockRole = new iam.Role(this, 'BedrockRole2', {
       assumedBy: new iam.ServicePrincipal('bedrock.amazonaws.com'),
@@ -87,7 +112,7 @@ export class CdkBackendStack1 extends cdk.Stack {
       existingRole: bedrockRole,
   });
 
-    new bedrock2.CfnDataSource(this, 'KnowledgeBaseDataSource', {
+    const knowledgeBaseDataSource = new bedrock2.CfnDataSource(this, 'KnowledgeBaseDataSource', {
       name: 'InmateDataKnowledgeBase12',
       knowledgeBaseId: graphKb.knowledgeBaseId,
       
@@ -205,6 +230,7 @@ export class CdkBackendStack1 extends cdk.Stack {
       - Do not disclose internal messages such as “CSV processing failed; routing to PDF-Agent-With-KB for text-based analysis.”
       - **Internal Instruction:** Do not send internal routing messages (e.g., "CSV processing failed; routing to PDF-Agent-With-KB for text-based analysis.") to the user front end. These messages should be kept internal as part of multi-agent collaboration.
       - Ensure every delegated query includes all necessary context and any attached CSV files for accurate processing.
+      - The retrieved_context session attribute, when present, holds the knowledge base passages already found for this question ("<file> >> <passage>" lines). Use them before searching again, and pass the relevant ones on with any delegated query.
 
     4. CSV List Length Requirement:
       - If the list of items in the CSV has more than 15 rows, return the output as a CSV file.
@@ -256,14 +282,51 @@ export class CdkBackendStack1 extends cdk.Stack {
       autoDeploy: true,
     });
 
+    // Batches scraper uploads into one debounced ingestion job, skipping unchanged objects
+    const KnowledgeBaseIngestion = new lambda.Function(this, 'KnowledgeBaseIngestion', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      handler: 'handler.lambda_handler',
+      code: lambda.Code.fromDockerBuild('lambda/KnowledgeBaseIngestion'), 
+      architecture: lambdaArchitecture,
+      environment: {
+        BUCKET_NAME: WebsiteData.bucketName,
+        STATE_BUCKET_NAME: PipelineState.bucketName,
+        REGION: aws_region,
+        KB_ID: graphKb.knowledgeBaseId,
+        DATA_SOURCE_ID: knowledgeBaseDataSource.attrDataSourceId,
+        QUIET_PERIOD_SECONDS: '300',
+      },
+      // The first run for a dataset writes a document per record; later runs only the changed ones
+      timeout: cdk.Duration.seconds(300),
+    });
+
+    new events.Rule(this, 'KnowledgeBaseIngestionFlush', {
+      schedule: events.Schedule.rate(cdk.Duration.minutes(5)),
+      targets: [
+        new targets.LambdaFunction(KnowledgeBaseIngestion, {
+          event: events.RuleTargetInput.fromObject({ action: 'flush' }),
+        }),
+      ],
+    });
+
+    // Modules shared by the functions that publish data (lambda/shared/python, on the path from /opt/python)
+    const PipelineShared = new lambda.LayerVersion(this, 'PipelineShared', {
+      code: lambda.Code.fromAsset('lambda/shared'),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_12],
+      compatibleArchitectures: [lambdaArchitecture],
+      description: 'Ingestion notification shared by the scrapers and the entity resolver',
+    });
+
     const InmateSummaryScrapper = new lambda.Function(this, 'InmateSummaryScrapper', {
       runtime: lambda.Runtime.PYTHON_3_12,
       handler: 'handler.lambda_handler',
       code: lambda.Code.fromDockerBuild('lambda/InmateSummaryScrapper'), 
+      layers: [PipelineShared],
       architecture: lambdaArchitecture,
       environment: {
         BUCKET_NAME: WebsiteData.bucketName,
         REGION: aws_region,
+        INGESTION_FUNCTION_ARN: KnowledgeBaseIngestion.functionArn,
       },
       timeout: cdk.Duration.seconds(60),
     });
@@ -272,10 +335,13 @@ export class CdkBackendStack1 extends cdk.Stack {
       runtime: lambda.Runtime.PYTHON_3_12,
       handler: 'handler.lambda_handler',
       code: lambda.Code.fromDockerBuild('lambda/CondemnedInmateListScrapper'), 
+      layers: [PipelineShared],
       architecture: lambdaArchitecture,
       environment: {
         BUCKET_NAME: WebsiteData.bucketName,
+        STATE_BUCKET_NAME: PipelineState.bucketName,
         REGION: aws_region,
+        INGESTION_FUNCTION_ARN: KnowledgeBaseIngestion.functionArn,
       },
       timeout: cdk.Duration.seconds(60),
     });
@@ -284,36 +350,123 @@ export class CdkBackendStack1 extends cdk.Stack {
       runtime: lambda.Runtime.PYTHON_3_12,
       handler: 'handler.lambda_handler',
       code: lambda.Code.fromDockerBuild('lambda/ScoreJailRosterScraper'), 
+      layers: [PipelineShared],
       architecture: lambdaArchitecture,
       environment: {
         BUCKET_NAME: WebsiteData.bucketName,
         REGION: aws_region,
+        INGESTION_FUNCTION_ARN: KnowledgeBaseIngestion.functionArn,
       },
       timeout: cdk.Duration.seconds(60),
     });
 
-    const BedrockAIAgent = new lambda.Function(this, 'BedrockAIAgent', {
+    // Post-scrape join between the SCORE roster and the condemned inmate list
+    const EntityResolver = new lambda.Function(this, 'EntityResolver', {
       runtime: lambda.Runtime.PYTHON_3_12,
       handler: 'handler.lambda_handler',
-      code: lambda.Code.fromDockerBuild('lambda/BedrockAIAgent'), 
+      code: lambda.Code.fromDockerBuild('lambda/EntityResolver'), 
+      layers: [PipelineShared],
       architecture: lambdaArchitecture,
       environment: {
         BUCKET_NAME: WebsiteData.bucketName,
         REGION: aws_region,
-        URL: webSocketStage.callbackUrl,
-        KB_ID: graphKb.knowledgeBaseId,
-        SUPERVISOR_AGENT_ID: SupervisorAgentWithCodeInterpreter.agentId,
-        SUPERVISOR_AGENT_ALIAS_ID: Supervisor_Agent_Alias.aliasId,
+        INGESTION_FUNCTION_ARN: KnowledgeBaseIngestion.functionArn,
+        MIN_CONFIDENCE: '0.85',
       },
+      timeout: cdk.Duration.seconds(60),
+    });
+
+    // Runs every scraper concurrently under one time budget and records a run manifest
+    const ScraperOrchestrator = new lambda.Function(this, 'ScraperOrchestrator', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      handler: 'handler.lambda_handler',
+      code: lambda.Code.fromDockerBuild('lambda/ScraperOrchestrator'), 
+      architecture: lambdaArchitecture,
+      environment: {
+        STATE_BUCKET_NAME: PipelineState.bucketName,
+        REGION: aws_region,
+        RUN_BUDGET_SECONDS: '240',
+        INMATE_SUMMARY_FUNCTION_ARN: InmateSummaryScrapper.functionArn,
+        CONDEMNED_LIST_FUNCTION_ARN: CondemnedInmateListScrapper.functionArn,
+        SCORE_ROSTER_FUNCTION_ARN: ScoreJailRosterScraper.functionArn,
+        ENTITY_RESOLVER_FUNCTION_ARN: EntityResolver.functionArn,
+      },
+      timeout: cdk.Duration.seconds(300),
+    });
+
+    const agentEnvironment = {
+      BUCKET_NAME: WebsiteData.bucketName,
+      STATE_BUCKET_NAME: PipelineState.bucketName,
+      REGION: aws_region,
+      URL: webSocketStage.callbackUrl,
+      SESSION_TABLE_NAME: SessionFiles.tableName,
+      // Kept under the supervisor agent's default 10-minute idle session timeout
+      SESSION_FILES_TTL_SECONDS: '540',
+      // How long a completed answer can be resumed after a reconnect
+      STREAM_RETENTION_SECONDS: '900',
+      KB_ID: graphKb.knowledgeBaseId,
+      SUPERVISOR_AGENT_ID: SupervisorAgentWithCodeInterpreter.agentId,
+      SUPERVISOR_AGENT_ALIAS_ID: Supervisor_Agent_Alias.aliasId,
+      // Document-only questions skip the supervisor: one retrieve-and-generate call with this model and guardrail
+      MODEL_ARN: cris_claude.inferenceProfileArn,
+      GUARDRAIL_ID: guardrail.guardrailId,
+      GUARDRAIL_VERSION: guardrail.guardrailVersion,
+      ROUTING_MIN_SCORE: '0.6',
+      // Build clients and load the data catalog during init rather than on the first prompt
+      PRIME_ON_INIT: 'true',
+    };
+
+    const BedrockAIAgent = new lambda.Function(this, 'BedrockAIAgent', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      handler: 'handler.lambda_handler',
+      code: lambda.Code.fromDockerBuild('lambda/BedrockAIAgent'), 
+      architecture: lambdaArchitecture,
+      environment: agentEnvironment,
       timeout: cdk.Duration.seconds(120),
     });
 
+    // The same code for report batches, which run all their questions in one invocation
+    const BedrockAIAgentBatch = new lambda.Function(this, 'BedrockAIAgentBatch', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      handler: 'handler.lambda_handler',
+      code: lambda.Code.fromDockerBuild('lambda/BedrockAIAgent'), 
+      architecture: lambdaArchitecture,
+      environment: {
+        ...agentEnvironment,
+        // Sessions answered at once, questions per session, and the most per batch (the opener enforces the same)
+        BATCH_CONCURRENCY: '4',
+        BATCH_SESSION_QUESTIONS: '3',
+        MAX_BATCH_QUESTIONS: '50',
+      },
+      timeout: cdk.Duration.seconds(900),
+    });
+
+    // Precomputes answers to frequent questions after each completed ingestion, started by KnowledgeBaseIngestion
+    const AnswerPrecompute = new lambda.Function(this, 'AnswerPrecompute', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      handler: 'handler.lambda_handler',
+      code: lambda.Code.fromDockerBuild('lambda/AnswerPrecompute'), 
+      architecture: lambdaArchitecture,
+      environment: {
+        STATE_BUCKET_NAME: PipelineState.bucketName,
+        REGION: aws_region,
+        RESPONSE_FUNCTION_ARN: BedrockAIAgent.functionArn,
+        MAX_QUESTIONS: '20',
+        CONCURRENCY: '2',
+      },
+      timeout: cdk.Duration.seconds(900),
+    });
+    KnowledgeBaseIngestion.addEnvironment('ANSWER_PRECOMPUTE_FUNCTION_ARN', AnswerPrecompute.functionArn);
+
     const webSocketHandler = new lambda.Function(this, 'cla-web-socket-handler', {
       runtime: lambda.Runtime.PYTHON_3_12,
       code: lambda.Code.fromAsset('lambda/web_socket_opener'),
       handler: 'handler.lambda_handler',
       environment: {
-        RESPONSE_FUNCTION_ARN: BedrockAIAgent.functionArn
+        RESPONSE_FUNCTION_ARN: BedrockAIAgent.functionArn,
+        BATCH_FUNCTION_ARN: BedrockAIAgentBatch.functionArn,
+        MAX_BATCH_QUESTIONS: '50',
+        PRIME_ON_INIT: 'true',
       }
     });
 
@@ -321,18 +474,54 @@ export class CdkBackendStack1 extends cdk.Stack {
     WebsiteData.grantReadWrite(InmateSummaryScrapper);
     WebsiteData.grantReadWrite(CondemnedInmateListScrapper);
     WebsiteData.grantReadWrite(ScoreJailRosterScraper);
-    WebsiteData.grantRead(BedrockAIAgent);
+    WebsiteData.grantReadWrite(EntityResolver);
+    for (const agentFunction of [BedrockAIAgent, BedrockAIAgentBatch]) {
+      WebsiteData.grantRead(agentFunction);
+      PipelineState.grantRead(agentFunction);
+      PipelineState.grantPut(agentFunction, 'artifacts/*');
+      PipelineState.grantPut(agentFunction, 'answers/*');
+      PipelineState.grantPut(agentFunction, 'streams/*');
+      SessionFiles.grantReadWriteData(agentFunction);
+    }
+    // Writes and deletes the per-record documents under records/
+    WebsiteData.grantReadWrite(KnowledgeBaseIngestion);
+    PipelineState.grantReadWrite(KnowledgeBaseIngestion);
+    // The condemned list lookup index the agent reads
+    PipelineState.grantPut(CondemnedInmateListScrapper, 'indexes/*');
 
-    // Grant Lambda function full access to bedrock and 
-    BedrockAIAgent.role?.addManagedPolicy(
+    KnowledgeBaseIngestion.role?.addManagedPolicy(
       cdk.aws_iam.ManagedPolicy.fromAwsManagedPolicyName('AmazonBedrockFullAccess'),
     );
-    // api gateway 
-    BedrockAIAgent.role?.addManagedPolicy(
-      cdk.aws_iam.ManagedPolicy.fromAwsManagedPolicyName('AmazonAPIGatewayInvokeFullAccess'),
-    );
+    KnowledgeBaseIngestion.grantInvoke(InmateSummaryScrapper);
+    KnowledgeBaseIngestion.grantInvoke(CondemnedInmateListScrapper);
+    KnowledgeBaseIngestion.grantInvoke(ScoreJailRosterScraper);
+    KnowledgeBaseIngestion.grantInvoke(EntityResolver);
+
+    PipelineState.grantReadWrite(ScraperOrchestrator);
+    InmateSummaryScrapper.grantInvoke(ScraperOrchestrator);
+    CondemnedInmateListScrapper.grantInvoke(ScraperOrchestrator);
+    ScoreJailRosterScraper.grantInvoke(ScraperOrchestrator);
+    EntityResolver.grantInvoke(ScraperOrchestrator);
+    AnswerPrecompute.grantInvoke(KnowledgeBaseIngestion);
+
+    PipelineState.grantRead(AnswerPrecompute);
+    PipelineState.grantPut(AnswerPrecompute, 'answers/*');
+    PipelineState.grantPut(AnswerPrecompute, 'warmup/*');
+    BedrockAIAgent.grantInvoke(AnswerPrecompute);
+
+    // Grant Lambda function full access to bedrock and 
+    for (const agentFunction of [BedrockAIAgent, BedrockAIAgentBatch]) {
+      agentFunction.role?.addManagedPolicy(
+        cdk.aws_iam.ManagedPolicy.fromAwsManagedPolicyName('AmazonBedrockFullAccess'),
+      );
+      // api gateway 
+      agentFunction.role?.addManagedPolicy(
+        cdk.aws_iam.ManagedPolicy.fromAwsManagedPolicyName('AmazonAPIGatewayInvokeFullAccess'),
+      );
+    }
 
     BedrockAIAgent.grantInvoke(webSocketHandler)
+    BedrockAIAgentBatch.grantInvoke(webSocketHandler)
 
 
     const webSocketIntegration = new apigatewayv2_integrations.WebSocketLambdaIntegration('web-socket-integration', webSocketHandler);
@@ -344,6 +533,22 @@ export class CdkBackendStack1 extends cdk.Stack {
       }
     );
 
+    // Replays a completed answer's frames after a client reconnects
+    webSocketApi.addRoute('resumeStream',
+      {
+        integration: webSocketIntegration,
+        returnResponse: true
+      }
+    );
+
+    // Answers a list of report questions concurrently, streamed back by question index
+    webSocketApi.addRoute('batchMessage',
+      {
+        integration: webSocketIntegration,
+        returnResponse: true
+      }
+    );
+
     const amplifyApp = new amplify.App(this, 'ChatbotUI', {
       sourceCodeProvider: new amplify.GitHubSourceCodeProvider({
         owner: githubOwner,
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import Lambda modules with the same helper as the benchmarks and the load test
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
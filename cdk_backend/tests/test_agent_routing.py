@@ -0,0 +1,207 @@
+import json
+
+import pytest
+
+from lambdas import load
+
+DOCUMENT_CHUNK = {
+    "content": {"text": "The jail reform report recommends pretrial release for low-level offenses."},
+    "score": 0.9,
+    "metadata": {"x-amz-bedrock-kb-source-uri": "s3://documents/jail_reform_report.pdf"},
+}
+
+
+class FakeAgentRuntime:
+    """
+    bedrock-agent-runtime for one well-matched PDF chunk: document questions are
+    answered by retrieve_and_generate_stream, everything else by invoke_agent.
+    """
+
+    def __init__(self):
+        self.generated = []
+        self.invoked = []
+
+    def retrieve(self, **params):
+        return {"retrievalResults": [dict(DOCUMENT_CHUNK)]}
+
+    def retrieve_and_generate_stream(self, **params):
+        self.generated.append(params["input"]["text"])
+        return {"stream": [{"output": {"text": "From the report."}}]}
+
+    def invoke_agent(self, **params):
+        self.invoked.append(params)
+        return {"completion": [{"chunk": {"bytes": b"From the supervisor."}}]}
+
+
+class FakeGateway:
+    def __init__(self):
+        self.frames = []
+
+    def post_to_connection(self, ConnectionId, Data):
+        self.frames.append(json.loads(Data))
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    for name, value in {
+        "KB_ID": "KB", "MODEL_ARN": "arn:aws:bedrock:us-east-1::foundation-model/test", "URL": "https://example.test",
+        "SUPERVISOR_AGENT_ID": "SUPERVISOR", "SUPERVISOR_AGENT_ALIAS_ID": "ALIAS", "TRACE_EXPORTER": "none",
+    }.items():
+        monkeypatch.setenv(name, value)
+    for name in ("STATE_BUCKET_NAME", "SESSION_TABLE_NAME", "PRIME_ON_INIT"):
+        monkeypatch.delenv(name, raising=False)
+    handler = load("BedrockAIAgent")
+    runtime, gateway = FakeAgentRuntime(), FakeGateway()
+    handler.get_agent_client = lambda: runtime
+    handler.get_gateway = lambda: gateway
+    handler.get_s3_client = lambda: None
+    return handler, runtime, gateway
+
+
+def send(handler, prompt, session_id):
+    return handler.lambda_handler({"connectionId": "connection", "prompt": prompt, "sessionId": session_id}, None)
+
+
+def test_follow_up_goes_to_supervisor_with_the_earlier_turn(agent):
+    handler, runtime, gateway = agent
+
+    send(handler, "What does the jail reform report recommend?", "session-1")
+    assert runtime.generated == ["What does the jail reform report recommend?"]
+    assert runtime.invoked == []
+
+    # Refers back to the first answer, which the supervisor never saw
+    send(handler, "What does it say about bail?", "session-1")
+    assert runtime.generated == ["What does the jail reform report recommend?"]
+    assert [params["sessionId"] for params in runtime.invoked] == ["session-1"]
+    assert runtime.invoked[0]["sessionState"]["conversationHistory"] == {"messages": [
+        {"role": "user", "content": [{"text": "What does the jail reform report recommend?"}]},
+        {"role": "assistant", "content": [{"text": "From the report."}]},
+    ]}
+    assert [frame["text"] for frame in gateway.frames if frame["type"] == "delta"] == ["From the report.", "From the supervisor."]
+
+    # The supervisor's own turns are in its session memory already
+    send(handler, "And what about parole?", "session-1")
+    assert runtime.invoked[1]["sessionState"]["conversationHistory"] == runtime.invoked[0]["sessionState"]["conversationHistory"]
+
+
+def test_standalone_later_question_keeps_the_fast_route(agent):
+    handler, runtime, _ = agent
+
+    send(handler, "What does the jail reform report recommend?", "session-1")
+    send(handler, "What does the jail reform report recommend for juveniles?", "session-1")
+    assert len(runtime.generated) == 2
+    assert runtime.invoked == []
+
+
+def test_first_turn_of_another_session_is_not_a_follow_up(agent):
+    handler, runtime, _ = agent
+
+    send(handler, "What does the jail reform report recommend?", "session-1")
+    send(handler, "What does it say about bail?", "session-2")
+    assert len(runtime.generated) == 2
+    assert runtime.invoked == []
+
+
+def test_follow_up_is_not_served_from_the_answer_cache(agent):
+    handler, runtime, gateway = agent
+
+    send(handler, "What does the jail reform report recommend?", "session-1")
+    handler.cached_answer = lambda prompt, tracer: {"text": "Cached answer."}
+    send(handler, "How many of them are in custody?", "session-1")
+    assert len(runtime.invoked) == 1
+    assert "Cached answer." not in [frame.get("text") for frame in gateway.frames]
+
+
+def test_prompt_naming_indexed_records_gets_their_rows(agent):
+    handler, runtime, _ = agent
+    index = {
+        "columns": ["last_name", "first_name", "received_date", "trial_county"],
+        "rows": [["Smith", "John", "1995-03-14", "Kern"], ["Young", "Paul", "2001-05-02", "Kern"]],
+        "indexes": {
+            "by_trial_county": {"kern": {"count": 2, "rows": [0, 1]}},
+            "by_received_year": {"1995": {"count": 1, "rows": [0]}, "2001": {"count": 1, "rows": [1]}},
+            "by_last_name_prefix": {"SM": {"count": 1, "rows": [0]}, "YO": {"count": 1, "rows": [1]}},
+        },
+    }
+    catalog = {"datasets": {"condemned_inmate_list": {"key": "condemned_inmate_list.csv", "index": "indexes/condemned_inmate_list.json"}}}
+    handler.get_catalog = lambda: type("Catalog", (), {"get": lambda self: catalog, "version": 1})()
+    handler.get_record_indexes = lambda: type("Indexes", (), {"get": lambda self, key: index})()
+
+    # Would be a document question from its wording and retrieval alone
+    send(handler, "When did Smith arrive?", "session-1")
+    assert runtime.generated == []
+    state = runtime.invoked[0]["sessionState"]
+    assert state["files"][0]["source"]["s3Location"]["uri"].endswith("/condemned_inmate_list.csv")
+    context = state["promptSessionAttributes"]["retrieved_context"]
+    assert "condemned_inmate_list.csv index >> 1 rows with last_name in ['Smith']" in context
+    assert "Smith,John,1995-03-14,Kern," in context and "Young" not in context
+
+
+def test_failed_answer_ends_the_stream_with_an_error_frame(agent):
+    handler, runtime, gateway = agent
+    stored = []
+    handler.store_stream = lambda stream, session_id: stored.append((session_id, list(stream.frames)))
+
+    def fail(**params):
+        raise RuntimeError("accessDeniedException")
+    runtime.invoke_agent = fail
+
+    response = send(handler, "How many people are in custody?", "session-1")
+    assert response["statusCode"] == 500
+    assert [(frame["type"], frame["seq"]) for frame in gateway.frames] == [("error", 0)]
+    assert gateway.frames[0]["message"] == "accessDeniedException"
+    assert stored == [("session-1", gateway.frames)]
+
+
+def test_cached_turn_reaches_the_supervisor_of_a_follow_up(agent):
+    handler, runtime, _ = agent
+    handler.cached_answer = lambda prompt, tracer: {"text": "1,204 people."}
+
+    assert json.loads(send(handler, "How many people are in custody?", "session-1")["body"])["result"] == "Answered from cache"
+    send(handler, "How many of them are in Kern?", "session-1")
+    assert runtime.invoked[0]["sessionState"]["conversationHistory"] == {"messages": [
+        {"role": "user", "content": [{"text": "How many people are in custody?"}]},
+        {"role": "assistant", "content": [{"text": "1,204 people."}]},
+    ]}
+
+
+def test_batch_groups_share_one_retrieval_and_attach_their_csvs_once(agent, monkeypatch):
+    handler, runtime, gateway = agent
+    monkeypatch.setenv("BUCKET_NAME", "data")
+    catalog = handler.CatalogCache(None, None)
+    catalog.get = lambda: {"version": 1, "datasets": {
+        "condemned_inmate_list": {"key": "condemned_inmate_list.csv", "sha256": "a" * 64,
+                                  "schema": ["last_name", "trial_county", "received_date"]},
+        "score_jail_data": {"key": "score_jail_data.csv", "sha256": "b" * 64, "schema": ["facility", "booking_date"]},
+    }}
+    handler.get_catalog = lambda: catalog
+    queries = []
+    runtime.retrieve = lambda **params: queries.append(params["retrievalQuery"]["text"]) or {"retrievalResults": [dict(DOCUMENT_CHUNK)]}
+
+    questions = [
+        "How many condemned inmates per trial county?",
+        "Which facility in the score jail holds the most people?",
+        "What is the average time since the received date for condemned inmates?",
+        "What does the reform report recommend?",
+    ]
+    event = {"connectionId": "connection", "sessionId": "session-1", "batch": {"batchId": "report", "questions": questions}}
+    assert handler.lambda_handler(event, None)["statusCode"] == 200
+
+    # One pass per group: both condemned list questions, the jail question, the report question
+    assert sorted(queries) == sorted([
+        handler.batch_query([questions[0], questions[2]]),
+        handler.batch_query([questions[1]]),
+        handler.batch_query([questions[3]]),
+    ])
+    assert runtime.generated == ["What does the reform report recommend?"]
+
+    sessions = {params["inputText"]: params for params in runtime.invoked}
+    first, second = sessions[questions[0]], sessions[questions[2]]
+    assert first["sessionId"] == second["sessionId"] != sessions[questions[1]]["sessionId"]
+    # The group's CSVs go to its session once
+    assert [file["name"] for file in first["sessionState"]["files"]] == ["condemned_inmate_list.csv"]
+    assert "files" not in second["sessionState"]
+    assert [file["name"] for file in sessions[questions[1]]["sessionState"]["files"]] == ["score_jail_data.csv"]
+
+    complete = [frame for frame in gateway.frames if frame.get("type") == "batch_complete"]
+    assert complete[0]["answered"] == 4 and complete[0]["failed"] == []
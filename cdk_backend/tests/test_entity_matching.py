@@ -0,0 +1,56 @@
+import pytest
+
+from lambdas import load
+
+
+@pytest.fixture(scope="module")
+def matching():
+    return load("EntityResolver", "matching")
+
+
+def names(record):
+    return record["first_name"], record["last_name"]
+
+
+def consistency(matching):
+    return lambda score, condemned: matching.timeline_consistency(
+        matching.parse_date(score.get("booking_datetime")),
+        matching.parse_date(condemned.get("offense_date")),
+        matching.parse_date(condemned.get("received_date")),
+    )
+
+
+def test_booking_between_offense_and_transfer_is_a_match(matching):
+    score = [{"first_name": "Ramon", "last_name": "De La Cruz", "booking_datetime": "1991-07-04T22:15:00"}]
+    condemned = [{"first_name": "RAMÓN", "last_name": "Delacruz", "offense_date": "1991-07-01", "received_date": "1993-02-10"}]
+
+    matches = matching.match_records(score, condemned, names, names, 0.85, consistency(matching))
+    assert [(m[2], m[3]) for m in matches] == [(1.0, "exact")]
+
+
+def test_common_name_booked_after_transfer_is_not_a_match(matching):
+    score = [{"first_name": "John", "last_name": "Smith", "booking_datetime": "2024-03-01T14:05:00"}]
+    condemned = [{"first_name": "John", "last_name": "Smith", "offense_date": "1993-05-02", "received_date": "1995-03-14"}]
+
+    assert matching.match_records(score, condemned, names, names, 0.85) != []
+    assert matching.match_records(score, condemned, names, names, 0.85, consistency(matching)) == []
+    # A booking before the offense neither supports nor rules out the match
+    score[0]["booking_datetime"] = "1990-01-01T08:00:00"
+    assert [m[2] for m in matching.match_records(score, condemned, names, names, 0.85, consistency(matching))] == [0.9]
+
+
+def test_blocking_keeps_spelling_variants_together(matching):
+    pairs = [
+        (("Jon", "Smyth"), ("John", "Smith")),
+        (("Catherine", "Schmidt"), ("Cathy", "Schmitt")),
+        (("Robert", "Gonzales"), ("Rob", "Gonzalez")),
+        (("Maria", "Hernandez-Lopez"), ("Maria", "Hernandez Lopez")),
+        (("William", "O'Neil"), ("Will", "ONeill")),
+    ]
+    score = [{"first_name": a[0], "last_name": a[1]} for a, _ in pairs]
+    condemned = [{"first_name": b[0], "last_name": b[1]} for _, b in pairs]
+
+    found = {(m[0]["last_name"], m[1]["last_name"]) for m in matching.match_records(score, condemned, names, names, 0.0)}
+    assert {(a[1], b[1]) for a, b in pairs} <= found
+    # Unrelated names never share a block, so they are never scored
+    assert ("Smyth", "Gonzalez") not in found
@@ -0,0 +1,120 @@
+from lambdas import load
+
+coordinator = load("KnowledgeBaseIngestion", "coordinator")
+local_stubs = load("KnowledgeBaseIngestion", "local_stubs")
+
+
+def make_coordinator(progression):
+    clock = [1000.0]
+    agent = local_stubs.FakeBedrockAgentClient(progression=progression)
+    ingestion = coordinator.IngestionCoordinator(
+        agent, coordinator.InMemoryStateStore(), "KB", "DS", quiet_period=300, clock=lambda: clock[0],
+    )
+    return ingestion, agent, clock
+
+
+def test_failed_job_objects_are_requeued_without_new_changes():
+    ingestion, agent, clock = make_coordinator(("STARTING", "IN_PROGRESS", "FAILED"))
+    objects = [{"key": "score_jail_data.csv", "sha256": "a" * 64}]
+
+    assert ingestion.record_changes(objects, source="test") == ["score_jail_data.csv"]
+    assert ingestion.flush()["action"] == "deferred"  # inside the quiet period
+
+    clock[0] += 301
+    started = ingestion.flush()
+    assert started["action"] == "started"
+    assert started["keys"] == ["score_jail_data.csv"]
+
+    # Nothing new arrives: the job is polled until it fails, then its objects are retried after a backoff
+    assert ingestion.flush()["action"] == "skipped"  # IN_PROGRESS
+    assert ingestion.flush()["action"] == "deferred"  # FAILED
+    clock[0] += 300
+    retried = ingestion.flush()
+    assert retried["action"] == "started"
+    assert retried["keys"] == ["score_jail_data.csv"]
+    assert len(agent.started) == 2
+
+
+def test_stopped_job_counts_as_not_ingested():
+    ingestion, agent, clock = make_coordinator(("STARTING", "STOPPED"))
+    objects = [{"key": "condemned_inmate_list.csv", "sha256": "b" * 64}]
+    ingestion.record_changes(objects, source="test")
+    clock[0] += 301
+    assert ingestion.flush()["action"] == "started"
+
+    # The job stops: its objects are retried and no longer count as ingested
+    assert ingestion.flush()["action"] == "deferred"
+    state, _ = ingestion.store.load()
+    assert "condemned_inmate_list.csv" not in state["objects"]
+    clock[0] += 300
+    retried = ingestion.flush()
+    assert retried["action"] == "started"
+    assert retried["keys"] == ["condemned_inmate_list.csv"]
+    state, _ = ingestion.store.load()
+    assert state["job"]["objects"]["condemned_inmate_list.csv"]["sha256"] == "b" * 64
+
+
+def test_completed_job_is_not_requeued():
+    ingestion, agent, clock = make_coordinator(("STARTING", "COMPLETE"))
+    objects = [{"key": "summary.csv", "sha256": "c" * 64}]
+    ingestion.record_changes(objects, source="test")
+    clock[0] += 301
+    job_id = ingestion.flush()["ingestionJobId"]
+    finished = ingestion.flush()
+    assert finished["action"] == "skipped" and finished["reason"] == "no changes"
+    assert finished["completed"]["ingestionJobId"] == job_id
+    assert ingestion.flush() == {"action": "skipped", "reason": "no changes"}
+    assert ingestion.record_changes(objects, source="test") == []
+    assert len(agent.started) == 1
+
+
+def test_failing_objects_back_off_and_are_given_up_on():
+    ingestion, agent, clock = make_coordinator(("STARTING", "FAILED"))
+    ingestion.max_job_attempts = 3
+    objects = [{"key": "bad.pdf", "sha256": "d" * 64}]
+    ingestion.record_changes(objects, source="test")
+    clock[0] += 301
+    assert ingestion.flush()["action"] == "started"
+
+    # Retried after 300s, then 600s; the third failure gives up
+    for delay in (300, 600):
+        assert ingestion.flush()["action"] == "deferred"
+        clock[0] += delay - 1
+        assert ingestion.flush()["action"] == "deferred"
+        clock[0] += 1
+        assert ingestion.flush()["action"] == "started"
+    assert ingestion.flush() == {"action": "skipped", "reason": "no changes"}
+    assert len(agent.started) == 3
+    state, _ = ingestion.store.load()
+    assert state["failed"]["bad.pdf"]["attempts"] == 3
+    assert state["pending"] == {}
+
+    # The same content stays given up on; new content is tried again
+    assert ingestion.record_changes(objects, source="test") == []
+    assert ingestion.record_changes([{"key": "bad.pdf", "sha256": "e" * 64}], source="test") == ["bad.pdf"]
+    state, _ = ingestion.store.load()
+    assert "bad.pdf" not in state["failed"]
+    assert "attempts" not in state["pending"]["bad.pdf"]
+
+
+def test_completed_job_is_reported_once_nothing_else_is_queued():
+    ingestion, agent, clock = make_coordinator(("STARTING", "IN_PROGRESS", "COMPLETE"))
+    ingestion.record_changes([{"key": "summary.csv", "sha256": "c" * 64}], source="test")
+    clock[0] += 301
+    job_id = ingestion.flush()["ingestionJobId"]
+
+    # A change arrives while the job runs: the job's data is not the current data
+    ingestion.record_changes([{"key": "score_jail_data.csv", "sha256": "d" * 64}], source="test")
+    assert "completed" not in ingestion.flush()  # IN_PROGRESS
+    finished = ingestion.flush()  # COMPLETE, but score_jail_data.csv is queued
+    assert "completed" not in finished
+
+    clock[0] += 301
+    second = ingestion.flush()
+    assert second["action"] == "started" and second["ingestionJobId"] != job_id
+    ingestion.flush()
+    done = ingestion.flush()
+    assert done["completed"]["ingestionJobId"] == second["ingestionJobId"]
+    assert {key: entry["sha256"] for key, entry in done["completed"]["objects"].items()} == {"score_jail_data.csv": "d" * 64}
+    # Reported only by the flush that saw it complete
+    assert "completed" not in ingestion.flush()
@@ -0,0 +1,59 @@
+from datetime import date
+
+import pytest
+
+from lambdas import load
+
+COLUMNS = ["last_name", "first_name", "age", "age_at_offense", "received_date", "sentenced_date", "offense_date", "trial_county"]
+ROWS = [
+    ["Smith", "John", "61", "25", "03/14/1995", "02/01/1995", "06/30/1992", "Kern"],
+    ["Smithers", "Alan", "48", "30", "07/02/2008", "06/15/2008", "01/09/2006", "Los  Angeles"],
+    ["Sanchez", "Maria", "55", "33", "11/20/1995", "10/01/1995", "04/12/1993", "Los Angeles"],
+    ["Young", "Paul", "70", "40", "", "", "", "Kern"],
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    scraper = load("CondemnedInmateListScrapper")
+    records = scraper.normalize_records(COLUMNS, ROWS)
+    columns = COLUMNS + scraper.DERIVED_COLUMNS
+    return {
+        "columns": columns,
+        "rows": [[scraper.to_csv_value(record.get(column)) for column in columns] for record in records],
+        "indexes": scraper.build_indexes(records),
+    }
+
+
+@pytest.fixture(scope="module")
+def record_index():
+    return load("BedrockAIAgent", "record_index")
+
+
+def test_indexes_hold_positions_and_counts(index):
+    indexes = index["indexes"]
+    assert indexes["by_trial_county"]["los angeles"] == {"count": 2, "rows": [1, 2]}
+    assert indexes["by_received_year"]["1995"] == {"count": 2, "rows": [0, 2]}
+    assert indexes["by_last_name_prefix"]["SM"] == {"count": 2, "rows": [0, 1]}
+    assert "" not in indexes["by_received_year"]
+
+
+def test_county_and_year_narrow_each_other(index, record_index):
+    result = record_index.lookup("How many people from Los Angeles were received in 1995?", index, today=date(2026, 10, 19))
+    assert result["filters"] == {"trial_county": ["los angeles"], "received_year": ["1995"]}
+    assert result["count"] == 1
+    assert [row[0] for row in result["rows"]] == ["Sanchez"]
+
+
+def test_last_name_is_exact_and_years_on_list_is_computed_at_query_time(index, record_index):
+    result = record_index.lookup("When was Smith sentenced?", index, today=date(2026, 3, 13))
+    assert result["filters"] == {"last_name": ["Smith"]}
+    assert [row[0] for row in result["rows"]] == ["Smith"]
+    assert result["rows"][0][result["columns"].index("years_on_list")] == 30
+    later = record_index.lookup("When was Smith sentenced?", index, today=date(2026, 3, 14))
+    assert later["rows"][0][later["columns"].index("years_on_list")] == 31
+
+
+def test_unindexed_prompt_has_no_result(index, record_index):
+    assert record_index.lookup("What does the jail reform report recommend?", index) is None
+    assert record_index.lookup("Who was received in 1970?", index) is None
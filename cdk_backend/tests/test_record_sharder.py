@@ -0,0 +1,93 @@
+import io
+import json
+import hashlib
+import threading
+
+from botocore.exceptions import ClientError
+
+from lambdas import load
+
+records = load("KnowledgeBaseIngestion", "records")
+
+CONDEMNED_KEY = "condemned_inmate_list.csv"
+HEADER = "last_name,first_name,age,received_date,offense_date,trial_county,age_bucket\n"
+SMITH = "Smith,John,61,1995-03-14,1992-06-30,Kern,60-69\n"
+SANCHEZ = "Sanchez,Maria,55,1995-11-20,1993-04-12,Los Angeles,50-59\n"
+YOUNG = "Young,Paul,48,2008-07-02,2006-01-09,Kern,40-49\n"
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.writes = []
+        self.lock = threading.Lock()
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        with self.lock:
+            self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode("utf-8")
+            self.writes.append(Key)
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop((Bucket, obj["Key"]), None)
+
+    def keys(self, bucket, prefix):
+        return sorted(key for b, key in self.objects if b == bucket and key.startswith(prefix))
+
+
+def publish(s3, sharder, *rows):
+    body = (HEADER + "".join(rows)).encode("utf-8")
+    s3.put_object(Bucket="data", Key=CONDEMNED_KEY, Body=body)
+    s3.writes.clear()
+    return sharder.shard(CONDEMNED_KEY, hashlib.sha256(body).hexdigest())
+
+
+def test_each_record_gets_a_document_and_metadata_sidecar():
+    s3 = FakeS3()
+    sharder = records.RecordSharder(s3, "data", "state")
+    result = publish(s3, sharder, SMITH, SANCHEZ)
+
+    prefix = "records/condemned_inmate_list/"
+    assert result["records"] == 2 and result["written"] == 2 and result["deleted"] == 0
+    smith = records.record_id({"last_name": "Smith", "first_name": "John", "trial_county": "Kern", "offense_date": "1992-06-30"},
+                              records.RECORD_DATASETS[CONDEMNED_KEY]["id_fields"])
+    assert s3.keys("data", prefix) == sorted(
+        f"{prefix}{rid}{suffix}" for rid in json.loads(s3.objects[("state", f"{prefix}manifest.json")])["records"]
+        for suffix in (".txt", ".txt.metadata.json"))
+
+    text = s3.objects[("data", f"{prefix}{smith}.txt")].decode("utf-8")
+    assert text.splitlines()[:3] == ["Condemned inmate list record", f"dataset: {CONDEMNED_KEY}", "last_name: Smith"]
+    assert "trial_county: Kern" in text
+    metadata = json.loads(s3.objects[("data", f"{prefix}{smith}.txt.metadata.json")])
+    assert metadata == {"metadataAttributes": {
+        "dataset": "condemned_inmate_list", "source_key": CONDEMNED_KEY, "record_id": smith,
+        "trial_county": "Kern", "received_year": 1995, "age_bucket": "60-69"}}
+    assert result["facets"] == {"trial_county": {"type": "STRING", "values": ["Kern", "Los Angeles"]},
+                                "received_year": {"type": "NUMBER", "values": [1995]}}
+
+
+def test_unchanged_records_are_kept_and_removed_records_deleted():
+    s3 = FakeS3()
+    sharder = records.RecordSharder(s3, "data", "state")
+    publish(s3, sharder, SMITH, SANCHEZ)
+    prefix = "records/condemned_inmate_list/"
+    before = s3.keys("data", prefix)
+
+    # Sanchez leaves the list, Young joins; Smith is untouched
+    result = publish(s3, sharder, SMITH, YOUNG)
+    assert (result["written"], result["deleted"], result["records"]) == (1, 1, 2)
+    after = s3.keys("data", prefix)
+    kept = set(before) & set(after)
+    assert len(kept) == 2 and all("Smith" in s3.objects[("data", k)].decode("utf-8") for k in kept if k.endswith(".txt"))
+    assert not any(("data", k) in s3.objects for k in set(before) - kept)
+    assert all(key.startswith(prefix) for key in s3.writes)
+    assert sum(key.endswith(".txt") for key in s3.writes) == 1
+
+    # The same CSV again is skipped without reading or writing anything
+    assert publish(s3, sharder, SMITH, YOUNG)["skipped"] is True
+    assert s3.writes == []
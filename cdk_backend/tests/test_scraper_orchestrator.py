@@ -0,0 +1,65 @@
+import io
+import json
+
+import pytest
+
+from lambdas import load
+
+
+class FakeLambda:
+    """
+    A facility scraper that fails the facilities listed in `failing` on their
+    first attempt and answers like ScoreJailRosterScraper.
+    """
+
+    def __init__(self, facilities, failing, fail_again=()):
+        self.facilities = facilities
+        self.failing = set(failing)
+        self.fail_again = set(fail_again)
+        self.events = []
+
+    def invoke(self, FunctionName, InvocationType, Payload=None):
+        event = json.loads(Payload) if Payload else {}
+        self.events.append(event)
+        selected = event.get("facilities") or self.facilities
+        bad = self.failing if len(self.events) == 1 else self.fail_again
+        outputs = [{"key": f"jail_rosters/{f}.csv", "sha256": f} for f in selected if f not in bad]
+        failed = {f: "timed out" for f in selected if f in bad}
+        status = (207 if outputs else 500) if failed else 200
+        body = {"statusCode": status, "outputs": outputs, "failed_facilities": failed}
+        return {"Payload": io.BytesIO(json.dumps(body).encode("utf-8"))}
+
+
+@pytest.fixture
+def orchestrator(monkeypatch):
+    handler = load("ScraperOrchestrator")
+    monkeypatch.setattr(handler, "MAX_ATTEMPTS", 3)
+
+    def use(client):
+        session = type("Session", (), {"client": lambda self, *args, **kwargs: client})
+        monkeypatch.setattr(handler.boto3.session, "Session", session)
+    return handler, use
+
+
+def test_only_failed_facilities_are_retried(orchestrator):
+    handler, use = orchestrator
+    client = FakeLambda(["score", "kern", "fresno"], failing=["kern"])
+    use(client)
+
+    result = handler.run_phase({"ScoreJailRosterScraper": "arn:score"}, handler.time.monotonic() + 60)["ScoreJailRosterScraper"]
+    assert client.events == [{}, {"facilities": ["kern"]}]
+    assert result["status"] == "succeeded" and result["attempts"] == 2
+    assert sorted(output["key"] for output in result["outputs"]) == [
+        "jail_rosters/fresno.csv", "jail_rosters/kern.csv", "jail_rosters/score.csv"]
+
+
+def test_facility_that_keeps_failing_leaves_the_source_partial(orchestrator):
+    handler, use = orchestrator
+    client = FakeLambda(["score", "kern"], failing=["kern"], fail_again=["kern"])
+    use(client)
+
+    result = handler.run_phase({"ScoreJailRosterScraper": "arn:score"}, handler.time.monotonic() + 60)["ScoreJailRosterScraper"]
+    assert client.events == [{}, {"facilities": ["kern"]}, {"facilities": ["kern"]}]
+    assert result["status"] == "partial"
+    assert result["failed_facilities"] == {"kern": "timed out"}
+    assert [output["key"] for output in result["outputs"]] == ["jail_rosters/score.csv"]
@@ -0,0 +1,153 @@
+import re
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from lambdas import load
+
+session_files = load("BedrockAIAgent", "session_files")
+
+
+class FakeDynamoDB:
+    """
+    One table, with get_item and the ADD/SET/REMOVE update expressions,
+    list_append and conditions the session store uses, applied atomically like
+    DynamoDB does.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get_item(self, TableName, Key, ConsistentRead):
+        with self.lock:
+            item = self.items.get(Key["sessionId"]["S"])
+            return {"Item": dict(item)} if item else {}
+
+    def check(self, condition, item, values):
+        for clause in condition.split(" OR "):
+            if clause == "attribute_not_exists(expiresAt)" and "expiresAt" not in item:
+                return True
+            if clause == "attribute_exists(sessionId)" and item:
+                return True
+            match = re.fullmatch(r"size\(history\) = (:\w+)", clause)
+            if match and len(item.get("history", {"L": []})["L"]) == int(values[match.group(1)]["N"]):
+                return True
+            match = re.fullmatch(r"expiresAt (>|<=) (:\w+)", clause)
+            if match and "expiresAt" in item:
+                expires, bound = int(item["expiresAt"]["N"]), int(values[match.group(2)]["N"])
+                if (expires > bound) if match.group(1) == ">" else (expires <= bound):
+                    return True
+        return False
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues, ReturnValues, ConditionExpression=None):
+        session_id = Key["sessionId"]["S"]
+        with self.lock:
+            item = dict(self.items.get(session_id, {}))
+            if ConditionExpression and not self.check(ConditionExpression, item, ExpressionAttributeValues):
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+            old = dict(item)
+            removed = []
+            for action, body in re.findall(r"(ADD|SET|REMOVE) (.*?)(?= ADD | SET | REMOVE |$)", UpdateExpression):
+                for part in re.split(r", (?![^(]*\))", body):
+                    if action == "REMOVE":
+                        removed.append(part)
+                    elif action == "SET":
+                        name, value = part.split(" = ")
+                        appended = re.fullmatch(r"list_append\(if_not_exists\((\w+), (:\w+)\), (:\w+)\)", value)
+                        if appended:
+                            existing = item.get(appended.group(1), ExpressionAttributeValues[appended.group(2)])
+                            item[name] = {"L": existing["L"] + ExpressionAttributeValues[appended.group(3)]["L"]}
+                        else:
+                            item[name] = ExpressionAttributeValues[value]
+                    else:
+                        name, value = part.split(" ")
+                        value = ExpressionAttributeValues[value]
+                        if "N" in value:
+                            item[name] = {"N": str(int(item.get(name, {"N": "0"})["N"]) + int(value["N"]))}
+                        else:
+                            item[name] = {"SS": sorted(set(item.get(name, {"SS": []})["SS"]) | set(value["SS"]))}
+            positions = {int(i) for part in removed for i in re.findall(r"history\[(\d+)\]", part)}
+            if positions:
+                item["history"] = {"L": [e for i, e in enumerate(item["history"]["L"]) if i not in positions]}
+            for part in removed:
+                if "[" not in part:
+                    item.pop(part, None)
+            item["sessionId"] = {"S": session_id}
+            self.items[session_id] = item
+            return {"Attributes": old} if ReturnValues == "ALL_OLD" else {}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "dynamodb"])
+def tracker(request):
+    clock = Clock()
+    if request.param == "memory":
+        store = session_files.InMemorySessionStore(clock=clock)
+    else:
+        store = session_files.DynamoDBSessionStore(FakeDynamoDB(), "sessions", clock=clock)
+    return session_files.SessionFileTracker(store, ttl=540, clock=clock), clock
+
+
+def test_concurrent_turns_and_attachments_are_all_kept(tracker):
+    tracker, _ = tracker
+    files = [{"s3_uri": f"s3://data/{n}.csv", "version": "sha256:1"} for n in range(8)]
+
+    assert tracker.begin_turn("session-1") == []
+    threads = [threading.Thread(target=tracker.record_exchange, args=("session-1", f"Question {n}?", f"Answer {n}.", "data"))
+               for n in range(8)]
+    threads += [threading.Thread(target=tracker.record, args=("session-1", [file])) for file in files]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    history = tracker.begin_turn("session-1")
+    assert sorted(entry["question"] for entry in history) == [f"Question {n}?" for n in range(8)]
+    assert tracker.pending("session-1", files) == []
+    changed = {"s3_uri": "s3://data/0.csv", "version": "sha256:2"}
+    assert tracker.pending("session-1", [changed, {"s3_uri": "s3://data/9.csv", "version": None}]) == [
+        changed, {"s3_uri": "s3://data/9.csv", "version": None}]
+
+
+def test_expired_session_starts_over(tracker):
+    tracker, clock = tracker
+    file = {"s3_uri": "s3://data/a.csv", "version": "sha256:1"}
+    assert tracker.begin_turn("session-1") == []
+    tracker.record("session-1", [file])
+    tracker.record_exchange("session-1", "What does the report recommend?", "Pretrial release.", "documents")
+    assert tracker.begin_turn("session-1") == [
+        {"question": "What does the report recommend?", "answer": "Pretrial release.", "route": "documents"}]
+
+    clock.now += 541
+    assert tracker.pending("session-1", [file]) == [file]
+    assert tracker.begin_turn("session-1") == []
+    assert tracker.pending("session-1", [file]) == [file]
+
+
+def test_history_keeps_the_latest_turns(tracker):
+    tracker, _ = tracker
+    tracker.begin_turn("session-1")
+    for n in range(25):
+        tracker.record_exchange("session-1", f"Question {n}?", "x" * 5000, "data")
+
+    history = tracker.begin_turn("session-1")
+    assert [entry["question"] for entry in history] == [f"Question {n}?" for n in range(15, 25)]
+    assert all(len(entry["answer"]) == session_files.MAX_ANSWER_CHARS for entry in history)
+    # The stored history was trimmed too
+    tracker.record_exchange("session-1", "Question 25?", "y", "data")
+    assert len(tracker.store.start_turn("session-1", 10 ** 6)) == session_files.MAX_HISTORY_TURNS + 1
+
+
+def test_recording_no_files_does_not_create_a_session(tracker):
+    tracker, _ = tracker
+    tracker.record("session-1", [])
+    assert tracker.begin_turn("session-1") == []
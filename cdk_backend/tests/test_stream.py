@@ -0,0 +1,74 @@
+import io
+import json
+import hashlib
+
+from botocore.exceptions import ClientError
+
+from lambdas import load
+
+stream = load("BedrockAIAgent", "stream")
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)].encode("utf-8"))}
+
+
+def test_frames_are_numbered_in_order_and_tagged():
+    sent = []
+    answer = stream.AnswerStream("stream-1", sent.append, batchId="batch-1", questionIndex=2)
+    answer.thinking("Looking at the roster")
+    answer.delta("Forty ")
+    answer.delta("people.")
+    answer.files([{"name": "chart.png"}])
+    answer.final()
+
+    assert sent == answer.frames
+    assert [frame["seq"] for frame in sent] == [0, 1, 2, 3, 4]
+    assert [frame["type"] for frame in sent] == ["thinking", "delta", "delta", "files", "final_text"]
+    assert all(frame["streamId"] == "stream-1" and frame["batchId"] == "batch-1" and frame["questionIndex"] == 2 for frame in sent)
+
+
+def test_final_frame_carries_the_length_and_hash_of_the_deltas():
+    sent = []
+    answer = stream.AnswerStream("stream-1", sent.append)
+    answer.thinking("not part of the answer")
+    for part in ("Los Ángeles ", "has ", "12 ✓"):
+        answer.delta(part)
+    final = answer.final()
+
+    text = "".join(frame["text"] for frame in sent if frame["type"] == "delta").encode("utf-8")
+    assert "text" not in final
+    assert final["length"] == len(text) == len("Los Ángeles has 12 ✓") + 3
+    assert final["sha256"] == hashlib.sha256(text).hexdigest()
+
+
+def test_error_frame_ends_the_stream_with_a_500():
+    answer = stream.AnswerStream("stream-1", lambda frame: None)
+    answer.delta("Partial")
+    error = answer.error("The agent failed")
+    assert (error["type"], error["statusCode"], error["seq"], error["message"]) == ("error", 500, 1, "The agent failed")
+
+
+def test_store_replays_only_live_streams_of_the_same_session():
+    now = [1000.0]
+    s3 = FakeS3()
+    store = stream.StreamStore(s3, "state", retention=900, clock=lambda: now[0])
+    frames = [{"type": "delta", "seq": 0, "text": "Hi"}]
+
+    assert store.get("stream-1", "session-1") == (None, stream.PENDING)
+    store.put("stream-1", "session-1", frames)
+    assert json.loads(s3.objects[("state", "streams/stream-1.json")])["sessionId"] == "session-1"
+    assert store.get("stream-1", "session-1") == (frames, None)
+    assert store.get("stream-1", "session-2") == (None, stream.PENDING)
+
+    now[0] += 901
+    assert store.get("stream-1", "session-1") == (None, stream.EXPIRED)
@@ -0,0 +1,208 @@
+"""
+Fixture pages for the scraper benchmarks.
+
+The saved fixtures in fixtures/ mirror the markup the scrapers parse: the SCORE
+roster and detail view, the CDCR condemned inmate list and the CDCR summary
+report. Scaled copies with 10x, 100x and 1000x the rows are synthesized from the
+same templates into fixtures/scaled/ (not committed):
+
+    python fixtures.py            # rewrite the 1x fixtures and all scaled copies
+    python fixtures.py --scales 10 100
+"""
+import os
+import random
+import argparse
+from html import escape
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SCALED_DIR = os.path.join(FIXTURE_DIR, "scaled")
+DEFAULT_SCALES = (10, 100, 1000)
+
+# Row counts of the 1x fixtures, close to the size of the live pages.
+BASE_ROWS = {
+    "score_roster": 40,
+    "score_view": 6,
+    "condemned_list": 60,
+    "summary_report": 12,
+}
+
+LAST_NAMES = ["GARCIA", "SMITH", "NGUYEN", "JOHNSON", "MARTINEZ", "LEE", "BROWN", "LOPEZ",
+              "WILLIAMS", "HERNANDEZ", "DAVIS", "GONZALEZ", "WILSON", "ANDERSON", "DE LA CRUZ"]
+FIRST_NAMES = ["JOHN", "MARIA", "JAMES", "ROBERT", "LUIS", "DAVID", "MICHAEL", "JOSE",
+               "ANTHONY", "CARLOS", "DANIEL", "KEVIN", "STEVEN", "BRIAN", "JUAN"]
+COUNTIES = ["Los Angeles", "Riverside", "San Bernardino", "Orange", "Alameda", "Kern",
+            "Sacramento", "San Diego", "Santa Clara", "Fresno", "Tulare", "Contra Costa"]
+OFFENSES = ["PC 459 BURGLARY", "VC 23152(A) DUI", "PC 273.5 DOMESTIC VIOLENCE",
+            "HS 11377 POSSESSION", "PC 666 PETTY THEFT W/PRIOR", "PC 148 RESISTING"]
+
+
+def _date(rng, start_year, end_year):
+    return f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(start_year, end_year)}"
+
+
+def _datetime(rng, start_year, end_year):
+    return f"{_date(rng, start_year, end_year)} {rng.randint(1, 12)}:{rng.randint(0, 59):02d} {rng.choice(['AM', 'PM'])}"
+
+
+def _row(label, value):
+    return (f'<div class="row"><b class="uk-visible-small">{escape(label)}:</b>'
+            f'<ul class="uk-list"><li>{value}</li></ul></div>')
+
+
+def score_roster_page(rows, seed=1):
+    rng = random.Random(seed)
+    panels = []
+    for i in range(rows):
+        name_number = f"{100000 + i}"
+        released = rng.choice(["In SCORE Custody", _datetime(rng, 2023, 2025)])
+        scheduled = rng.choice(["To Be Determined", _datetime(rng, 2025, 2027), ""])
+        vine = f'<a href="https://vinelink.vineapps.com/search/CA/Person?nn={name_number}">VINE</a>'
+        panels.append(
+            '<div class="uk-width-1 uk-panel">'
+            + _row("Name Number", name_number)
+            + _row("Last Name", rng.choice(LAST_NAMES))
+            + _row("First Name", rng.choice(FIRST_NAMES))
+            + _row("Middle Name", rng.choice(["", "A", "LEE", "MARIE"]))
+            + _row("Booking #", f"{24000000 + i}")
+            + _row("Date Booked", _datetime(rng, 2023, 2025))
+            + _row("Date Released", released)
+            + _row("Scheduled Release Date", scheduled)
+            + _row("VINE", vine)
+            + "</div>"
+        )
+    return ("<!DOCTYPE html><html><head><title>SCORE Roster</title></head><body>"
+            '<h1>Current Roster</h1><div class="uk-grid list">' + "".join(panels) + "</div></body></html>")
+
+
+def score_view_page(rows, seed=2):
+    rng = random.Random(seed)
+    offenses = []
+    for _ in range(rows):
+        offenses.append(
+            '<div class="uk-width-1 uk-panel">'
+            + _row("Agency", rng.choice(["HAYWARD PD", "CHP", "SAN LEANDRO PD"]))
+            + _row("Offense", rng.choice(OFFENSES))
+            + _row("Cause Number", f"{rng.randint(10000000, 99999999)}")
+            + _row("Offense Status", rng.choice(["SENTENCED", "PRE-TRIAL", "HOLD"]))
+            + _row("Bond", rng.choice(["NO BAIL", "CASH", "SURETY"]))
+            + _row("Bond Amount", f"${rng.randint(0, 50) * 1000:,}")
+            + "</div>"
+        )
+    bookings = []
+    for i in range(rows):
+        bookings.append(
+            '<div class="uk-width-1 uk-panel">'
+            + _row("Booking #", f"{23000000 + i}")
+            + _row("Date Booked", _datetime(rng, 2015, 2024))
+            + _row("Date Released", _datetime(rng, 2015, 2024))
+            + _row("Release Type", rng.choice(["TIME SERVED", "BAIL", "TRANSFER"]))
+            + "</div>"
+        )
+    return ("<!DOCTYPE html><html><body>"
+            '<h1>Current Booking</h1><div class="list"><h2>Booking # 24000001</h2>'
+            + _row("Date Booked", _datetime(rng, 2024, 2025))
+            + _row("Date Released", "In SCORE Custody")
+            + _row("Scheduled Release Date", "To Be Determined")
+            + '<h3>Offenses</h3><div class="list">' + "".join(offenses) + "</div></div>"
+            '<h1>Booking List</h1><div class="list">' + "".join(bookings) + "</div>"
+            "</body></html>")
+
+
+def condemned_list_page(rows, seed=3):
+    rng = random.Random(seed)
+    body = []
+    for _ in range(rows):
+        age = rng.randint(25, 85)
+        cells = [
+            rng.choice(LAST_NAMES).title(),
+            rng.choice(FIRST_NAMES).title(),
+            str(age),
+            str(rng.randint(18, min(age, 60))),
+            _date(rng, 1978, 2019),
+            _date(rng, 1978, 2019),
+            _date(rng, 1975, 2018),
+            rng.choice(COUNTIES),
+        ]
+        body.append("<tr>" + "".join(f"<td>{escape(c)}</td>" for c in cells) + "</tr>")
+    headers = ["Last Name", "First Name", "Age", "Age at Offense", "Received Date",
+               "Sentenced Date", "Offense Date", "Trial County"]
+    return ("<!DOCTYPE html><html><body><h1>Condemned Inmate List</h1>"
+            '<figure class="wp-block-table"><table class="has-fixed-layout"><thead><tr>'
+            + "".join(f"<th>{h}</th>" for h in headers)
+            + "</tr></thead><tbody>" + "".join(body) + "</tbody></table></figure></body></html>")
+
+
+def summary_report_page(rows, seed=4):
+    rng = random.Random(seed)
+    sections = [
+        ("Ethnicity", ["Black", "Hispanic", "White", "Other"]),
+        ("Age Range", ["18â€“29", "30â€“39", "40â€“49", "50â€“59", "60Â+"]),
+        ("Year Received", [str(y) for y in range(1978, 2020)]),
+        ("Sentencing County", COUNTIES),
+    ]
+    html = ["<!DOCTYPE html><html><body><h1>Condemned Inmate Summary Report</h1>"]
+    for title, labels in sections:
+        body = []
+        for i in range(rows):
+            label = labels[i % len(labels)] + ("" if i < len(labels) else f" ({i // len(labels)})")
+            male, female = rng.randint(0, 300), rng.randint(0, 20)
+            total = male + female
+            cells = [label, str(total), f"{rng.random() * 10:.1f}%", str(male),
+                     f"{rng.random() * 10:.1f}%", str(female), f"{rng.random() * 10:.1f}%"]
+            body.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+        body.append("<tr><td>Total</td>" + "<td>0</td>" * 6 + "</tr>")
+        html.append(
+            f'<h2 class="wp-block-heading">{title}</h2><p>As of the latest report.</p>'
+            '<figure class="wp-block-table"><table><thead><tr>'
+            f"<th>{title}</th><th>Total</th><th>%</th><th>Male</th><th>%</th><th>Female</th><th>%</th>"
+            "</tr></thead><tbody>" + "".join(body) + "</tbody></table></figure>"
+        )
+    html.append("</body></html>")
+    return "".join(html)
+
+
+PAGES = {
+    "score_roster": score_roster_page,
+    "score_view": score_view_page,
+    "condemned_list": condemned_list_page,
+    "summary_report": summary_report_page,
+}
+
+
+def fixture_path(name, scale=1):
+    if scale == 1:
+        return os.path.join(FIXTURE_DIR, f"{name}.html")
+    return os.path.join(SCALED_DIR, f"{name}_x{scale}.html")
+
+
+def load_fixture(name, scale=1):
+    """
+    Returns the fixture page for the given scale, synthesizing it on first use.
+    """
+    path = fixture_path(name, scale)
+    if not os.path.exists(path):
+        write_fixture(name, scale)
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def write_fixture(name, scale=1):
+    path = fixture_path(name, scale)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(PAGES[name](BASE_ROWS[name] * scale))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the 1x fixtures and synthesize scaled copies.")
+    parser.add_argument("--scales", type=int, nargs="*", default=list(DEFAULT_SCALES))
+    args = parser.parse_args()
+    for name in PAGES:
+        for scale in [1] + args.scales:
+            path = write_fixture(name, scale)
+            print(f"{path}: {os.path.getsize(path):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
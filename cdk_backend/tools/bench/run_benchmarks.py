@@ -0,0 +1,257 @@
+"""
+Offline benchmarks for the scraper stages.
+
+Serves the fixture pages from a local HTTP stub and runs scrape_score_jail,
+scrape_inmate_view (fetch and parse) and parse_inmate_view, post_process_data, save_to_csv and the CDCR extractors
+against it at each scale. Every stage is run once for timing and once under
+tracemalloc, and reports throughput, peak RSS, peak traced memory and the
+number of allocated blocks still alive when the stage returns.
+
+    pip install boto3 -r ../../lambda/ScoreJailRosterScraper/requirements.txt
+    python run_benchmarks.py --scales 1 10 100
+    python run_benchmarks.py --scales 1000 --stages score_post_process score_save_csv --json out.json
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import tracemalloc
+import contextlib
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fixtures import load_fixture, BASE_ROWS
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lambdas import load  # noqa: E402
+
+# The handlers read these at import time; nothing in the benchmark talks to AWS.
+os.environ.setdefault("BUCKET_NAME", "benchmark-bucket")
+os.environ.setdefault("STATE_BUCKET_NAME", "benchmark-state-bucket")
+os.environ.setdefault("REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+
+class FixtureServer:
+    """
+    Local stand-in for jils.scorejail.org and cdcr.ca.gov that serves the fixture
+    pages at the currently selected scale.
+    """
+
+    ROUTES = {
+        ("GET", "/roster"): "score_roster",
+        ("POST", "/view"): "score_view",
+        ("GET", "/condemned"): "condemned_list",
+        ("GET", "/summary"): "summary_report",
+    }
+
+    def __init__(self):
+        self.pages = {}
+        self.scale = None
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self, method):
+                name = server.ROUTES.get((method, self.path))
+                if name is None:
+                    self.send_error(404)
+                    return
+                if method == "POST":
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                body = server.pages[name]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def use_scale(self, scale):
+        self.scale = scale
+        self.pages = {name: load_fixture(name, scale).encode("utf-8") for name in BASE_ROWS}
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def reset_peak_rss():
+    """
+    Resets the kernel's high-water mark so the next reading is per stage (Linux only).
+    Returns False when the platform only exposes the process-lifetime peak.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(stage, rows, prepare, run):
+    """
+    Runs a stage twice: a clean timing pass, then a pass under tracemalloc.
+    prepare() builds fresh inputs outside the measured region; run(inputs) is the stage.
+    """
+    quiet = open(os.devnull, "w")
+
+    inputs = prepare()
+    per_stage_rss = reset_peak_rss()
+    with contextlib.redirect_stdout(quiet):
+        started = time.perf_counter()
+        run(inputs)
+        elapsed = time.perf_counter() - started
+    rss = peak_rss_bytes()
+
+    inputs = prepare()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    with contextlib.redirect_stdout(quiet):
+        result = run(inputs)
+    after = tracemalloc.take_snapshot()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+    quiet.close()
+
+    return {
+        "stage": stage,
+        "rows": rows,
+        "seconds": round(elapsed, 4),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(rss / 2 ** 20, 1),
+        "peak_rss_scope": "stage" if per_stage_rss else "process",
+        "peak_traced_mb": round(traced_peak / 2 ** 20, 2),
+        "retained_blocks": retained_blocks,
+    }
+
+
+def build_stages(server, workdir):
+    """
+    Returns stage name -> (row count at 1x, prepare, run).
+    """
+    score = load("ScoreJailRosterScraper")
+    condemned = load("CondemnedInmateListScrapper")
+    summary = load("InmateSummaryScrapper")
+    base = server.base_url
+
+    def without_sleep(run):
+        # The detail view sleeps between requests for politeness; that is not parsing
+        # cost. Only sleep is replaced, and only while a SCORE stage runs.
+        def wrapped(*args):
+            with mock.patch.object(score.time, "sleep", lambda seconds: None):
+                return run(*args)
+        return wrapped
+
+    cache = {}
+
+    def roster():
+        key = ("roster", server.scale)
+        if key not in cache:
+            with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+                cache[key] = without_sleep(score.scrape_score_jail)(f"{base}/roster", base)
+        return cache[key]
+
+    def processed():
+        key = ("processed", server.scale)
+        if key not in cache:
+            with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+                cache[key] = score.post_process_data(roster())
+        return copy.deepcopy(cache[key])
+
+    def condemned_table():
+        return condemned.extract_condemned_table(score.requests.get(f"{base}/condemned").content)
+
+    def summary_tables(html):
+        tables = summary.extract_tables(summary.BeautifulSoup(html, "html.parser"))
+        return [summary.post_process_table(section, *summary.extract_table_data(table))
+                for section, table in tables.items()]
+
+    return {
+        "score_scrape_roster": (
+            BASE_ROWS["score_roster"], lambda: None,
+            without_sleep(lambda _: score.scrape_score_jail(f"{base}/roster", base))),
+        "score_scrape_view": (
+            BASE_ROWS["score_view"], lambda: None,
+            without_sleep(lambda _: score.scrape_inmate_view(base, "100000"))),
+        "score_parse_view": (
+            BASE_ROWS["score_view"], lambda: server.pages["score_view"].decode("utf-8"),
+            score.parse_inmate_view),
+        "score_post_process": (
+            BASE_ROWS["score_roster"], lambda: copy.deepcopy(roster()),
+            score.post_process_data),
+        "score_save_csv": (
+            BASE_ROWS["score_roster"], processed,
+            lambda data: score.save_to_csv(data, os.path.join(workdir, "score_jail_data.csv"))),
+        "condemned_extract": (
+            BASE_ROWS["condemned_list"], lambda: None,
+            lambda _: condemned_table()),
+        "condemned_normalize_index": (
+            BASE_ROWS["condemned_list"], condemned_table,
+            lambda table: condemned.build_indexes(condemned.normalize_records(*table))),
+        "summary_extract": (
+            BASE_ROWS["summary_report"] * 4, lambda: summary.fetch_webpage(f"{base}/summary"),
+            summary_tables),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper stages against local fixtures.")
+    parser.add_argument("--scales", type=int, nargs="*", default=[1, 10, 100])
+    parser.add_argument("--stages", nargs="*", help="Only run these stages.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    server = FixtureServer()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        stages = build_stages(server, workdir)
+        selected = args.stages or list(stages)
+        print(f"{'stage':<28}{'scale':>7}{'rows':>9}{'seconds':>10}{'rows/s':>12}{'rss MB':>9}{'traced MB':>11}{'retained':>10}")
+        for scale in args.scales:
+            server.use_scale(scale)
+            for name in selected:
+                base_rows, prepare, run = stages[name]
+                result = dict(measure(name, base_rows * scale, prepare, run), scale=scale)
+                results.append(result)
+                print(f"{name:<28}{scale:>7}{result['rows']:>9}{result['seconds']:>10}"
+                      f"{result['rows_per_second'] or 0:>12}{result['peak_rss_mb']:>9}"
+                      f"{result['peak_traced_mb']:>11}{result['retained_blocks']:>10}")
+    server.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Builds the frequent-question list the answer warm-up precomputes after each
+completed ingestion (warmup/frequent_questions.json in the pipeline state bucket).
+
+Reads BedrockAIAgent log streams exported from CloudWatch, where every user
+prompt is logged as "DEBUG: Received prompt: ...", and counts the prompts after
+the same normalization the agent's answer cache applies. Prompts are anonymized
+before they are counted:
+  - prompts with e-mail addresses, phone numbers, long ID-like numbers (booking
+    or CDCR numbers) or what looks like a person's name are dropped, since their
+    answers are about one person rather than the data;
+  - only questions asked at least --min-count times are kept, so a rare prompt
+    never reaches the list.
+
+    pip install boto3
+    python build_frequent_questions.py exported-log-stream-*.txt --top 20
+    python build_frequent_questions.py logs/*.txt --upload s3://<state-bucket>/warmup/frequent_questions.json
+"""
+import os
+import re
+import sys
+import json
+import argparse
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "BedrockAIAgent"))
+from answer_cache import normalize_question  # noqa: E402
+
+PROMPT_PATTERN = re.compile(r"DEBUG: Received prompt: (.*)$")
+
+PERSONAL_PATTERNS = [
+    re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+"),                           # e-mail address
+    re.compile(r"\(?\b\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b"),           # phone number
+    re.compile(r"\b[A-Za-z]{0,2}\d{5,}\b"),                           # booking / CDCR style ids
+]
+# Runs of two or more capitalized words inside a sentence look like a person's name,
+# unless they are a place or institution ("Los Angeles County", "San Quentin State Prison").
+CAPITALIZED_RUN = re.compile(r"(?<=[a-z0-9,] )[A-Z][a-z]+(?: [A-Z][a-z]+)+")
+PLACE_WORDS = {"County", "Counties", "Jail", "Prison", "Court", "Department", "State", "California", "Sheriff"}
+
+
+def read_prompts(paths):
+    prompts = []
+    for path in paths:
+        with open(path, errors="replace") as f:
+            for line in f:
+                match = PROMPT_PATTERN.search(line.rstrip("\n"))
+                if match and match.group(1).strip():
+                    prompts.append(match.group(1).strip())
+    return prompts
+
+
+def is_personal(prompt, allowed=()):
+    if any(pattern.search(prompt) for pattern in PERSONAL_PATTERNS):
+        return True
+    for run in CAPITALIZED_RUN.findall(prompt):
+        if not PLACE_WORDS.intersection(run.split()) and run not in allowed:
+            return True
+    return False
+
+
+def frequent_questions(prompts, top, min_count, allowed=()):
+    """
+    Groups prompts by normalized text and returns the `top` groups asked at least
+    `min_count` times, each represented by its most common wording.
+    """
+    wordings = defaultdict(Counter)
+    for prompt in prompts:
+        normalized = normalize_question(prompt)
+        if normalized and not is_personal(prompt, allowed):
+            wordings[normalized][prompt] += 1
+    groups = [(sum(counter.values()), counter.most_common(1)[0][0]) for counter in wordings.values()]
+    groups = [(count, question) for count, question in groups if count >= min_count]
+    groups.sort(key=lambda group: (-group[0], group[1]))
+    return [{"question": question, "count": count} for count, question in groups[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the frequent-question list for the answer warm-up.")
+    parser.add_argument("paths", nargs="+", help="Exported BedrockAIAgent log streams.")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--min-count", type=int, default=3, help="Minimum times a question was asked.")
+    parser.add_argument("--allow", nargs="*", default=[], help='Capitalized phrases that are not names, e.g. "San Diego".')
+    parser.add_argument("--output", default="frequent_questions.json")
+    parser.add_argument("--upload", help="Also upload to this s3://bucket/key.")
+    args = parser.parse_args()
+
+    prompts = read_prompts(args.paths)
+    questions = frequent_questions(prompts, args.top, args.min_count, set(args.allow))
+    document = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "prompts": len(prompts),
+        "min_count": args.min_count,
+        "questions": questions,
+    }
+    with open(args.output, "w") as f:
+        json.dump(document, f, indent=2)
+    for entry in questions:
+        print(f"{entry['count']:>6}  {entry['question']}")
+    print(f"{len(questions)} questions from {len(prompts)} prompts -> {args.output}")
+
+    if args.upload:
+        import boto3
+        bucket, _, key = args.upload[len("s3://"):].partition("/")
+        boto3.client("s3").put_object(Bucket=bucket, Key=key, Body=json.dumps(document, indent=2), ContentType="application/json")
+        print(f"Uploaded to {args.upload}")
+
+
+if __name__ == "__main__":
+    main()
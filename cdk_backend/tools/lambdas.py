@@ -0,0 +1,30 @@
+"""
+Imports Lambda modules for the offline tests, benchmarks and load test the way the
+containers do: with the function's directory on sys.path, so sibling modules
+resolve. Every module is loaded under a unique name, so each function's handler.py
+can be imported side by side.
+
+    pip install boto3 beautifulsoup4 Pillow pytest
+    python -m pytest cdk_backend/tests
+"""
+import os
+import sys
+import importlib.util
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda")
+# The shared layer's modules, which Lambda puts on the path from /opt/python
+SHARED_DIR = os.path.abspath(os.path.join(LAMBDA_DIR, "shared", "python"))
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
+
+
+def load(function_name, module_name="handler"):
+    directory = os.path.abspath(os.path.join(LAMBDA_DIR, function_name))
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location(f"{function_name}_{module_name}", os.path.join(directory, f"{module_name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        sys.path.remove(directory)
@@ -0,0 +1,333 @@
+"""
+Load test of the chat path against local stand-ins.
+
+Simulated users send sendMessage events through web_socket_opener.lambda_handler.
+The opener's asynchronous invoke is dispatched to BedrockAIAgent.lambda_handler on
+a pool the size of the function's concurrency. Bedrock and the API Gateway
+connection-management API are replaced with fakes that have configurable latency,
+token rate and concurrency quota. For each load level the run reports time to
+first token, time to final answer, frames per answer and error rates.
+
+    pip install boto3 Pillow
+    python load_test.py --users 10 50 100 200 400
+    python load_test.py --users 100 --tokens-per-second 40 --bedrock-quota 50 --json out.json
+
+All latencies are multiplied by --time-scale, so a quick smoke run can use 0.1.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import contextlib
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from lambdas import load
+
+# The handlers read these; nothing in the load test talks to AWS.
+os.environ.update({
+    "RESPONSE_FUNCTION_ARN": "arn:aws:lambda:us-east-1:000000000000:function:BedrockAIAgent",
+    "URL": "https://example.execute-api.us-east-1.amazonaws.com/production",
+    "KB_ID": "LOADTESTKB",
+    "SUPERVISOR_AGENT_ID": "LOADTESTAGENT",
+    "SUPERVISOR_AGENT_ALIAS_ID": "LOADTESTALIAS",
+    "BUCKET_NAME": "load-test-bucket",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "TRACE_EXPORTER": "none",
+})
+for name in ("STATE_BUCKET_NAME", "SESSION_TABLE_NAME", "PRIME_ON_INIT"):
+    os.environ.pop(name, None)
+
+QUESTIONS = [
+    "How many people are on the condemned inmate list in Los Angeles County?",
+    "What is the average age of inmates currently in SCORE custody?",
+    "Show the number of condemned inmates received per year since 2000.",
+    "Which trial counties have the most condemned inmates?",
+    "Summarize the condemned inmate summary report by ethnicity.",
+]
+
+
+def client_error(code, operation):
+    return ClientError({"Error": {"Code": code, "Message": f"simulated {code}"}}, operation)
+
+
+class FakeBedrockRuntime:
+    """
+    Stand-in for bedrock-agent-runtime. retrieve() returns a fixed set of chunks after
+    retrieve_latency; invoke_agent() streams a rationale trace after
+    first_token_latency and then answer_tokens words at tokens_per_second. More
+    than `quota` concurrent streams are rejected with a throttling error, and
+    error_rate injects dependency failures.
+    """
+
+    def __init__(self, scale, retrieve_latency=0.3, first_token_latency=2.0, tokens_per_second=30.0,
+                 answer_tokens=120, quota=None, error_rate=0.0):
+        self.scale = scale
+        self.retrieve_latency = retrieve_latency
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.quota = quota
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.active = 0
+        self.peak_active = 0
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+        time.sleep(self.retrieve_latency * self.scale)
+        k = retrievalConfiguration["vectorSearchConfiguration"]["numberOfResults"]
+        results = []
+        for i in range(k):
+            source = ["condemned_inmate_list.csv", "score_jail_data.csv", "summary_report.pdf"][i % 3]
+            results.append({
+                "content": {"text": f"{retrievalQuery['text']} chunk {i} " + "inmate county received " * 20},
+                "metadata": {"x-amz-bedrock-kb-source-uri": f"s3://load-test-bucket/{source}"},
+                "score": 0.8 - i * 0.02,
+            })
+        return {"retrievalResults": results}
+
+    def invoke_agent(self, **params):
+        if random.random() < self.error_rate:
+            raise client_error("dependencyFailedException", "InvokeAgent")
+        with self._lock:
+            if self.quota is not None and self.active >= self.quota:
+                raise client_error("throttlingException", "InvokeAgent")
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        return {"completion": self._stream()}
+
+    def _stream(self):
+        try:
+            time.sleep(self.first_token_latency * self.scale)
+            rationale = {"rationale": {"text": "Looking at the attached CSV files."}}
+            yield {"trace": {"trace": {"orchestrationTrace": rationale}}}
+            interval = self.scale / self.tokens_per_second
+            for i in range(self.answer_tokens):
+                time.sleep(interval)
+                yield {"chunk": {"bytes": f"word{i} ".encode("utf-8")}}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class FakeGateway:
+    """
+    Stand-in for apigatewaymanagementapi that timestamps every frame per connection
+    and wakes the waiting user when its final_text frame arrives.
+    """
+
+    def __init__(self, scale, post_latency=0.01):
+        self.scale = scale
+        self.post_latency = post_latency
+        self._lock = threading.Lock()
+        self.connections = {}
+
+    def open(self, connection_id):
+        with self._lock:
+            self.connections[connection_id] = {"frames": [], "done": threading.Event()}
+        return self.connections[connection_id]
+
+    def post_to_connection(self, ConnectionId, Data):
+        time.sleep(self.post_latency * self.scale)
+        frame = json.loads(Data)
+        connection = self.connections[ConnectionId]
+        connection["frames"].append((time.monotonic(), frame.get("type")))
+        if frame.get("type") == "final_text":
+            connection["done"].set()
+
+
+class FakeS3:
+    def head_object(self, Bucket, Key):
+        return {"ETag": '"load-test"'}
+
+    def put_object(self, **params):
+        return {}
+
+    def generate_presigned_url(self, *args, **kwargs):
+        return "https://example.com/artifact"
+
+
+class FakeLambda:
+    """
+    Dispatches asynchronous invokes of the agent onto a pool the size of its
+    concurrency, so requests queue the way they would behind a concurrency limit.
+    """
+
+    def __init__(self, handler, concurrency, gateway):
+        self.handler = handler
+        self.gateway = gateway
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.pool.submit(self._run, json.loads(Payload))
+        return {"StatusCode": 202}
+
+    def _run(self, event):
+        connection = self.gateway.connections[event["connectionId"]]
+        try:
+            self.handler(event, None)
+        except Exception as e:
+            connection["error"] = getattr(e, "response", {}).get("Error", {}).get("Code") or type(e).__name__
+        finally:
+            connection["done"].set()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def run_level(opener, agent, users, messages, args):
+    scale = args.time_scale
+    runtime = FakeBedrockRuntime(scale, args.retrieve_latency, args.first_token_latency, args.tokens_per_second,
+                                 args.answer_tokens, args.bedrock_quota, args.error_rate)
+    gateway = FakeGateway(scale, args.post_latency)
+    dispatcher = FakeLambda(agent.lambda_handler, args.agent_concurrency, gateway)
+    s3 = FakeS3()
+    agent.get_agent_client = lambda: runtime
+    agent.get_gateway = lambda: gateway
+    agent.get_s3_client = lambda: s3
+    opener.get_lambda_client = lambda: dispatcher
+
+    answers = []
+    answers_lock = threading.Lock()
+
+    def user(index):
+        session_id = f"session-{index}"
+        history = []
+        for turn in range(messages):
+            connection_id = f"conn-{index}-{turn}"
+            connection = gateway.open(connection_id)
+            prompt = random.choice(QUESTIONS)
+            event = {
+                "requestContext": {"routeKey": "sendMessage", "connectionId": connection_id},
+                "body": json.dumps({"prompt": prompt, "history": history, "sessionId": session_id}),
+            }
+            sent = time.monotonic()
+            result = {"error": None}
+            try:
+                opener.lambda_handler(event, None)
+                if not connection["done"].wait(args.timeout * max(scale, 0.01)):
+                    result["error"] = "timeout"
+            except Exception as e:
+                result["error"] = type(e).__name__
+            frames = list(connection["frames"])
+            result["error"] = result["error"] or connection.get("error")
+            deltas = [t for t, kind in frames if kind == "delta"]
+            finals = [t for t, kind in frames if kind == "final_text"]
+            result["ttft"] = (deltas[0] - sent) if deltas else None
+            result["final"] = (finals[0] - sent) if finals else None
+            result["frames"] = len(frames)
+            with answers_lock:
+                answers.append(result)
+            history.append({"role": "user", "content": prompt})
+            time.sleep(random.uniform(0, args.think_time) * scale)
+
+    started = time.monotonic()
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+        threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+        for thread in threads:
+            thread.start()
+            time.sleep(args.ramp_up * scale / max(users, 1))
+        for thread in threads:
+            thread.join()
+        dispatcher.close()
+    elapsed = time.monotonic() - started
+
+    ok = [a for a in answers if not a["error"]]
+    errors = {}
+    for a in answers:
+        if a["error"]:
+            errors[a["error"]] = errors.get(a["error"], 0) + 1
+    ttft = [a["ttft"] / scale for a in ok if a["ttft"] is not None]
+    final = [a["final"] / scale for a in ok if a["final"] is not None]
+    return {
+        "users": users,
+        "answers": len(answers),
+        "error_rate": round(1 - len(ok) / len(answers), 4) if answers else 0.0,
+        "errors": errors,
+        "ttft_p50": percentile(ttft, 50),
+        "ttft_p95": percentile(ttft, 95),
+        "ttft_p99": percentile(ttft, 99),
+        "final_p50": percentile(final, 50),
+        "final_p95": percentile(final, 95),
+        "final_p99": percentile(final, 99),
+        "frames_per_answer": round(sum(a["frames"] for a in ok) / len(ok), 1) if ok else 0,
+        "answers_per_second": round(len(ok) / (elapsed / scale), 2),
+        "peak_bedrock_streams": runtime.peak_active,
+    }
+
+
+def saturation_point(results, baseline_factor=2.0, max_error_rate=0.01):
+    """
+    The first load level whose p95 time to first token is more than baseline_factor
+    times the lightest level's, or whose error rate exceeds max_error_rate.
+    """
+    if not results or results[0]["ttft_p95"] is None:
+        return None
+    baseline = results[0]["ttft_p95"]
+    for result in results:
+        if result["error_rate"] > max_error_rate or (result["ttft_p95"] or float("inf")) > baseline * baseline_factor:
+            return result["users"]
+    return None
+
+
+def seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the WebSocket chat path against local stand-ins.")
+    parser.add_argument("--users", type=int, nargs="*", default=[10, 50, 100, 200], help="Concurrent users per load level.")
+    parser.add_argument("--messages", type=int, default=2, help="Messages each user sends, one after another.")
+    parser.add_argument("--think-time", type=float, default=3.0, help="Max seconds a user waits between messages.")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which users connect.")
+    parser.add_argument("--agent-concurrency", type=int, default=100, help="Concurrent BedrockAIAgent executions.")
+    parser.add_argument("--bedrock-quota", type=int, default=None, help="Concurrent invoke_agent streams before throttling.")
+    parser.add_argument("--retrieve-latency", type=float, default=0.3)
+    parser.add_argument("--first-token-latency", type=float, default=2.0)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--post-latency", type=float, default=0.01, help="Seconds per post_to_connection.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of invoke_agent calls that fail.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds a user waits for the final answer.")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplier applied to every simulated latency.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    opener = load("web_socket_opener")
+    agent = load("BedrockAIAgent")
+    # The agent backs off for seconds between retries; keep that on the simulated clock.
+    agent.time = SimpleNamespace(sleep=lambda seconds: time.sleep(seconds * args.time_scale), perf_counter=time.perf_counter, time=time.time)
+
+    print(f"{'users':>6}{'answers':>9}{'errors':>8}{'ttft p50':>10}{'p95':>8}{'p99':>8}"
+          f"{'final p50':>11}{'p95':>8}{'p99':>8}{'frames':>8}{'ans/s':>8}{'streams':>9}")
+    results = []
+    for users in args.users:
+        result = run_level(opener, agent, users, args.messages, args)
+        results.append(result)
+        print(f"{users:>6}{result['answers']:>9}{result['error_rate']:>8.1%}"
+              f"{seconds(result['ttft_p50']):>10}{seconds(result['ttft_p95']):>8}{seconds(result['ttft_p99']):>8}"
+              f"{seconds(result['final_p50']):>11}{seconds(result['final_p95']):>8}{seconds(result['final_p99']):>8}"
+              f"{result['frames_per_answer']:>8}{result['answers_per_second']:>8}{result['peak_bedrock_streams']:>9}"
+              + (f"  {result['errors']}" if result["errors"] else ""))
+
+    saturated = saturation_point(results)
+    print(f"\nSaturation: {saturated} users" if saturated else "\nNo saturation within the tested levels.")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "saturation_users": saturated, "settings": vars(args)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Import-time profile of the Lambda handlers.
+
+Imports each handler in a fresh interpreter under `python -X importtime` and
+reports the total import time, the cost of each top-level import and the most
+expensive modules overall. With --prime, the handler's prime() hook (client
+construction and any init-time loading) is timed too.
+
+    pip install boto3 requests beautifulsoup4
+    python profile_imports.py
+    python profile_imports.py BedrockAIAgent web_socket_opener --runs 5 --prime
+
+The same profile can be captured in Lambda by setting PYTHONPROFILEIMPORTTIME=1
+on a function; the lines land in its CloudWatch log stream, and
+
+    python profile_imports.py --log exported-log-stream.txt
+
+summarizes them.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from lambdas import SHARED_DIR
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda")
+
+# The handlers read these at import time; nothing here talks to AWS.
+HANDLER_ENV = {
+    "BUCKET_NAME": "profile-bucket",
+    "STATE_BUCKET_NAME": "profile-state-bucket",
+    "REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "URL": "https://example.execute-api.us-east-1.amazonaws.com/prod",
+}
+
+# "import time:       344 |        566 |   botocore.utils"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+# Child script: import the handler (and optionally prime it) and report wall times.
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import handler
+imported = time.perf_counter()
+if {prime} and hasattr(handler, "prime"):
+    handler.prime()
+primed = time.perf_counter()
+sys.stdout.write("\\n" + json.dumps({{"import_ms": (imported - started) * 1000, "prime_ms": (primed - imported) * 1000}}))
+"""
+
+
+def handler_names():
+    return sorted(d for d in os.listdir(LAMBDA_DIR) if os.path.isfile(os.path.join(LAMBDA_DIR, d, "handler.py")))
+
+
+def parse_importtime(lines):
+    """
+    Returns [(module, self_us, cumulative_us, depth)] from -X importtime output.
+    Depth 0 marks modules imported directly by the code being profiled.
+    """
+    modules = []
+    for line in lines:
+        match = IMPORTTIME_LINE.search(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return modules
+
+
+def summarize(modules, top):
+    """
+    Aggregates parsed import lines into per-top-level and per-package costs.
+    """
+    packages = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    roots = [(name, cumulative_us) for name, _, cumulative_us, depth in modules if depth == 0]
+    return {
+        "total_ms": round(sum(self_us for _, self_us, _, _ in modules) / 1000, 1),
+        "top_level_ms": {name: round(us / 1000, 1) for name, us in sorted(roots, key=lambda r: -r[1])[:top]},
+        "packages_ms": {name: round(us / 1000, 1) for name, us in sorted(packages.items(), key=lambda p: -p[1])[:top]},
+        "slowest_modules_ms": {name: round(us / 1000, 1) for name, us, _, _ in sorted(modules, key=lambda m: -m[1])[:top]},
+    }
+
+
+def profile_handler(name, runs, prime, top):
+    """
+    Imports one handler `runs` times in fresh interpreters. Wall times are reported
+    as the median; the importtime breakdown comes from the last run.
+    """
+    directory = os.path.abspath(os.path.join(LAMBDA_DIR, name))
+    # The shared layer is on the path from /opt/python in Lambda
+    env = dict(os.environ, **HANDLER_ENV, PYTHONDONTWRITEBYTECODE="1", PYTHONPATH=SHARED_DIR)
+    env.pop("PRIME_ON_INIT", None)
+    import_ms, prime_ms = [], []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE.format(prime=prime)],
+            cwd=directory, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            return {"handler": name, "error": completed.stderr.strip().splitlines()[-1]}
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        import_ms.append(timings["import_ms"])
+        prime_ms.append(timings["prime_ms"])
+    # importtime prints a module after everything it imported, so the handler's
+    # subtree is the run of nested lines directly above its own line.
+    modules = parse_importtime(completed.stderr.splitlines())
+    end = max((i for i, m in enumerate(modules) if m[0] == "handler"), default=len(modules))
+    start = end
+    while start > 0 and modules[start - 1][3] > 0:
+        start -= 1
+    handler_modules = [(n, s, c, d - 1) for n, s, c, d in modules[start:end]]
+    result = {
+        "handler": name,
+        "import_ms": round(statistics.median(import_ms), 1),
+        **summarize(handler_modules, top),
+    }
+    if prime:
+        result["prime_ms"] = round(statistics.median(prime_ms), 1)
+    return result
+
+
+def print_result(result):
+    if "error" in result:
+        print(f"\n{result['handler']}: import failed: {result['error']}")
+        return
+    header = f"\n{result['handler']}: import {result['import_ms']} ms"
+    if "prime_ms" in result:
+        header += f", prime {result['prime_ms']} ms"
+    print(header)
+    for title, key in (("top-level imports", "top_level_ms"), ("by package (self time)", "packages_ms"), ("slowest modules", "slowest_modules_ms")):
+        print(f"  {title}:")
+        for module, ms in result[key].items():
+            print(f"    {ms:>8.1f} ms  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile module import cost of the Lambda handlers.")
+    parser.add_argument("handlers", nargs="*", help="Handler directories to profile (default: all).")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per handler; wall times are the median.")
+    parser.add_argument("--prime", action="store_true", help="Also time the handler's prime() hook.")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--log", help="Summarize importtime lines from a saved Lambda log instead.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    if args.log:
+        with open(args.log) as f:
+            summary = summarize(parse_importtime(f), args.top)
+        results = [dict(handler=os.path.basename(args.log), import_ms=summary["total_ms"], **summary)]
+    else:
+        results = [profile_handler(name, args.runs, args.prime, args.top) for name in args.handlers or handler_names()]
+    for result in results:
+        print_result(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Waterfall view of the request traces the chat Lambdas export.
+
+Reads spans from JSON lines (TRACE_EXPORTER=file) or from exported CloudWatch
+log streams (TRACE_EXPORTER=log, one "TRACE {...}" line per span), groups them
+by trace and prints each request as a timeline: the opener, the asynchronous
+invoke hop, retrieval, catalog and session-file lookups, the agent call and
+every model, code-interpreter and collaborator step inside the stream.
+
+    python trace_waterfall.py /tmp/traces.jsonl
+    python trace_waterfall.py exported-log-stream.txt --trace 3f2c... --width 80
+    python trace_waterfall.py *.txt --slowest 5 --summary
+"""
+import sys
+import json
+import argparse
+import statistics
+from collections import defaultdict
+
+
+def read_spans(paths):
+    spans = []
+    for path in paths:
+        with open(path, errors="replace") as f:
+            for line in f:
+                if "TRACE {" in line:
+                    start = line.index("TRACE {") + len("TRACE ")
+                elif line.lstrip().startswith("{"):
+                    start = 0
+                else:
+                    continue
+                try:
+                    span = json.loads(line[start:])
+                except json.JSONDecodeError:
+                    continue
+                if "traceId" in span and "spanId" in span:
+                    spans.append(span)
+    return spans
+
+
+def group_traces(spans):
+    traces = defaultdict(dict)
+    for span in spans:
+        # The same span can appear twice when log exports overlap
+        traces[span["traceId"]][span["spanId"]] = span
+    return {trace_id: list(spans.values()) for trace_id, spans in traces.items()}
+
+
+def ordered(spans):
+    """
+    Depth-first order, children by start time. Spans whose parent was not
+    exported are treated as roots.
+    """
+    ids = {span["spanId"] for span in spans}
+    children = defaultdict(list)
+    for span in spans:
+        parent = span.get("parentSpanId")
+        children[parent if parent in ids else None].append(span)
+    rows = []
+
+    def walk(parent, depth):
+        for span in sorted(children[parent], key=lambda s: s["start"]):
+            rows.append((depth, span))
+            walk(span["spanId"], depth + 1)
+
+    walk(None, 0)
+    return rows
+
+
+def describe(span):
+    attributes = span.get("attributes") or {}
+    keys = ("calls", "first_token_ms", "bedrock_ms", "input_tokens", "output_tokens", "retrieved",
+            "in_context", "expanded", "attached", "files", "attempts", "error", "unfinished", "unterminated")
+    return " ".join(f"{key}={attributes[key]}" for key in keys if attributes.get(key) not in (None, False, ""))
+
+
+def print_waterfall(trace_id, spans, width):
+    begin = min(span["start"] for span in spans)
+    total = max(max(span["end"] for span in spans) - begin, 1e-6)
+    print(f"trace {trace_id}  {total * 1000:.0f} ms  {len(spans)} spans")
+    for depth, span in ordered(spans):
+        left = int((span["start"] - begin) / total * width)
+        length = max(1, int(round((span["end"] - span["start"]) / total * width)))
+        bar = " " * left + "#" * min(length, width - left)
+        label = ("  " * depth + span["name"])[:32]
+        print(f"  {label:<32} {span['durationMs']:>9.1f} ms |{bar:<{width}}| {describe(span)}")
+    print()
+
+
+def print_summary(traces):
+    durations = defaultdict(list)
+    for spans in traces.values():
+        for span in spans:
+            durations[span["name"]].append(span["durationMs"])
+    print(f"{'span':<24}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, values in sorted(durations.items(), key=lambda item: -statistics.median(item[1])):
+        values.sort()
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{name:<24}{len(values):>7}{statistics.median(values):>10.1f}{p95:>10.1f}{values[-1]:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print request traces as waterfalls.")
+    parser.add_argument("paths", nargs="+", help="Span JSON-lines files or exported log streams.")
+    parser.add_argument("--trace", help="Only this traceId (a prefix is enough).")
+    parser.add_argument("--slowest", type=int, help="Only the N longest traces.")
+    parser.add_argument("--width", type=int, default=60)
+    parser.add_argument("--summary", action="store_true", help="Also print per-span percentiles.")
+    args = parser.parse_args()
+
+    traces = group_traces(read_spans(args.paths))
+    if args.trace:
+        traces = {trace_id: spans for trace_id, spans in traces.items() if trace_id.startswith(args.trace)}
+    if not traces:
+        sys.exit("No spans found.")
+
+    def duration(trace_id):
+        spans = traces[trace_id]
+        return max(span["end"] for span in spans) - min(span["start"] for span in spans)
+
+    trace_ids = sorted(traces, key=lambda trace_id: min(span["start"] for span in traces[trace_id]))
+    if args.slowest:
+        trace_ids = sorted(trace_ids, key=duration, reverse=True)[:args.slowest]
+    for trace_id in trace_ids:
+        print_waterfall(trace_id, traces[trace_id], args.width)
+    if args.summary:
+        print_summary({trace_id: traces[trace_id] for trace_id in trace_ids})
+
+
+if __name__ == "__main__":
+    main()
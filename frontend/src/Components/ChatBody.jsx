@@ -4,6 +4,7 @@ import Attachment from "./Attachment";
 import ChatInput from "./ChatInput";
 import UserAvatar from "../Assets/UserAvatar.svg";
 import createMessageBlock from "../utilities/createMessageBlock";
+import textDigest from "../utilities/textDigest";
 import { ALLOW_FILE_UPLOAD, ALLOW_VOICE_RECOGNITION, ALLOW_FAQ, WEBSOCKET_API } from "../utilities/constants";
 import SpeechRecognitionComponent from "./SpeechRecognition";
 import { FAQExamples } from "./index";
@@ -13,6 +14,14 @@ import InitialProcessing from "./BotStates/InitialProcessing";
 import { v4 as uuidv4 } from "uuid";
 import FileResponse from "./FileResponse";
 const sessionId = uuidv4();
+// A dropped connection is reopened and the answer being streamed is resumed from
+// its last received frame. The backend can only replay an answer once it is
+// complete, so a resume is retried, with exponential backoff, while the answer is
+// still being generated; 10 attempts wait about two and a half minutes in all.
+const RECONNECT_DELAY_MS = 1000;
+const RESUME_RETRY_MAX_DELAY_MS = 30000;
+const MAX_RESUME_ATTEMPTS = 10;
+const resumeDelay = (attempts) => Math.min(RECONNECT_DELAY_MS * 2 ** Math.max(attempts - 1, 0), RESUME_RETRY_MAX_DELAY_MS);
 function ChatBody() {
   const [messageList, setMessageList] = useState([]);
   const [processing, setProcessing] = useState(false);
@@ -21,6 +30,8 @@ function ChatBody() {
   const messagesEndRef = useRef(null);
   const ws = useRef(null);
   const messageBuffer = useRef("");
+  // The answer being streamed: { id, nextSeq, text, done, resuming, attempts, repaired }
+  const stream = useRef(null);
 
   useEffect(() => {
     scrollToBottom();
@@ -44,9 +55,13 @@ function ChatBody() {
 
     setMessageList((prevList) => [...prevList, userMessageBlock, botMessageBlock]);
 
+    // Named here so the answer can be resumed even if none of its frames arrive
+    const streamId = uuidv4();
+    stream.current = { id: streamId, nextSeq: 0, text: "", done: false, resuming: false, attempts: 0, repaired: false };
+
     // Send message to WebSocket if connected
     if (ws.current && ws.current.readyState === WebSocket.OPEN) {
-      ws.current.send(JSON.stringify({ action: "sendMessage", prompt: message, sessionId: sessionId }));
+      ws.current.send(JSON.stringify({ action: "sendMessage", prompt: message, sessionId: sessionId, streamId: streamId }));
     }
 
     setQuestionAsked(true);
@@ -78,91 +93,173 @@ function ChatBody() {
     handleSendMessage(prompt);
   };
 
+  // Updates the bot's text message for the current answer (the last BOT TEXT block;
+  // a files block may have been added after it)
+  const updateBotMessage = (update) => {
+    setMessageList((prevList) => {
+      const updatedList = [...prevList];
+      for (let index = updatedList.length - 1; index >= 0; index--) {
+        if (updatedList[index].sentBy === "BOT" && updatedList[index].type === "TEXT") {
+          updatedList[index] = { ...updatedList[index], ...update(updatedList[index]) };
+          break;
+        }
+      }
+      return updatedList;
+    });
+  };
+
+  const requestResume = (fromSeq) => {
+    const current = stream.current;
+    if (!current || current.done || !ws.current || ws.current.readyState !== WebSocket.OPEN) {
+      return;
+    }
+    current.resuming = true;
+    current.attempts += 1;
+    ws.current.send(JSON.stringify({ action: "resumeStream", streamId: current.id, fromSeq: fromSeq, sessionId: sessionId }));
+  };
+
+  const finishStream = () => {
+    if (stream.current) {
+      stream.current.done = true;
+    }
+    setProcessing(false);
+  };
+
+  const handleFrame = async (parsedData) => {
+    const current = stream.current;
+
+    if (parsedData.type === "stream_unavailable") {
+      // "pending": not stored yet (still being answered); "expired": it never will be again
+      if (current && !current.done && parsedData.streamId === current.id) {
+        if (parsedData.reason !== "expired" && current.attempts < MAX_RESUME_ATTEMPTS) {
+          setTimeout(() => requestResume(current.nextSeq), resumeDelay(current.attempts));
+        } else {
+          updateBotMessage(() => ({ state: "RECEIVED" }));
+          finishStream();
+        }
+      }
+      return;
+    }
+
+    // Frames are numbered per answer: ignore other answers' and already received frames,
+    // and resume from the first missing one when frames were skipped
+    if (!current || parsedData.streamId !== current.id || parsedData.seq < current.nextSeq) {
+      return;
+    }
+    if (parsedData.seq > current.nextSeq) {
+      if (!current.resuming) {
+        requestResume(current.nextSeq);
+      }
+      return;
+    }
+    current.nextSeq += 1;
+    current.resuming = false;
+
+    if (parsedData.type === "thinking") {
+      // Update the bot's response, appending the new text to the thinking array
+      updateBotMessage((botMessage) => ({
+        thinking: [...botMessage.thinking, parsedData.text],
+        state: "THINKING",
+      }));
+    } else if (parsedData.type === "delta") {
+      current.text += parsedData.text;
+      updateBotMessage((botMessage) => ({
+        message: botMessage.message + parsedData.text,
+        state: "STREAMING",
+      }));
+    } else if (parsedData.type === "files") {
+      //Remove duplicate files
+      const uniqueFiles = parsedData.files.filter(
+        (file, index, self) => index === self.findIndex((t) => t.filename === file.filename) // Check if the filename is unique
+      );
+      // Tagged with the stream so a replay can replace it
+      const fileMessageBlock = { ...createMessageBlock("", "BOT", "FILE", "RECEIVED", uniqueFiles), streamId: current.id };
+      setMessageList((prevList) => {
+        return [...prevList, fileMessageBlock];
+      });
+    } else if (parsedData.type === "final_text") {
+      // The final frame only carries the answer's length and checksum; check the assembled text against them
+      const digest = await textDigest(current.text);
+      if ((digest.length !== parsedData.length || digest.sha256 !== parsedData.sha256) && !current.repaired) {
+        console.log("Streamed answer does not match its checksum, replaying it");
+        current.repaired = true;
+        current.nextSeq = 0;
+        current.text = "";
+        updateBotMessage(() => ({ message: "", thinking: [] }));
+        setMessageList((prevList) => prevList.filter((msg) => msg.streamId !== current.id));
+        requestResume(0);
+        return;
+      }
+      // Mark the message as received when complete
+      updateBotMessage(() => ({ state: "RECEIVED" }));
+      finishStream();
+    } else if (parsedData.type === "error") {
+      // The answer failed; show why after whatever was streamed and end it
+      updateBotMessage((botMessage) => ({
+        message: botMessage.message ? `${botMessage.message}\n\n${parsedData.message}` : parsedData.message,
+        state: "RECEIVED",
+      }));
+      finishStream();
+    }
+  };
+
   useEffect(() => {
-    ws.current = new WebSocket(WEBSOCKET_API);
+    let closed = false;
 
-    ws.current.onopen = () => {
-      console.log("WebSocket Connected");
-    };
+    const connect = () => {
+      ws.current = new WebSocket(WEBSOCKET_API);
 
-    ws.current.onmessage = (event) => {
-      try {
-        messageBuffer.current += event.data;
-        const parsedData = JSON.parse(messageBuffer.current);
-
-        if (parsedData.type === "thinking") {
-          // Update the last message (which should be the bot's response)
-          setMessageList((prevList) => {
-            const lastIndex = prevList.length - 1;
-            const updatedList = [...prevList];
-
-            if (lastIndex >= 0 && updatedList[lastIndex].sentBy === "BOT") {
-              updatedList[lastIndex] = {
-                ...updatedList[lastIndex],
-                // Append new text to the thinking array
-                thinking: [
-                  ...updatedList[lastIndex].thinking, // Keep the previous thinking text
-                  parsedData.text, // Add the new text
-                ],
-                state: "THINKING",
-              };
-            }
-            return updatedList;
-          });
-        } else if (parsedData.type === "final_text") {
-          // Mark the message as received when complete
-          setMessageList((prevList) => {
-            const lastIndex = prevList.length - 1;
-            const updatedList = [...prevList];
-
-            if (lastIndex >= 0 && updatedList[lastIndex].sentBy === "BOT") {
-              updatedList[lastIndex] = {
-                ...updatedList[lastIndex],
-                message: updatedList[lastIndex].message + parsedData.text,
-                state: parsedData.type === "final_text" ? "RECEIVED" : "STREAMING",
-              };
-            }
-            return updatedList;
-          });
-
-          setProcessing(false);
-        } else if (parsedData.type === "files") {
-          //Remove duplicate files
-          const uniqueFiles = parsedData.files.filter(
-            (file, index, self) => index === self.findIndex((t) => t.filename === file.filename) // Check if the filename is unique
-          );
-          const fileMessageBlock = createMessageBlock("", "BOT", "FILE", "RECEIVED", uniqueFiles);
-          setMessageList((prevList) => {
-            return [...prevList, fileMessageBlock];
-          });
+      ws.current.onopen = () => {
+        console.log("WebSocket Connected");
+        // Reconnected in the middle of an answer: pick it up where it stopped
+        if (stream.current && !stream.current.done && stream.current.attempts > 0) {
+          requestResume(stream.current.nextSeq);
         }
+      };
 
-        messageBuffer.current = "";
-      } catch (e) {
-        if (e instanceof SyntaxError) {
-          console.log("Received incomplete JSON, waiting for more data...");
-        } else {
-          console.error("Error processing message: ", e);
+      ws.current.onmessage = (event) => {
+        try {
+          messageBuffer.current += event.data;
+          const parsedData = JSON.parse(messageBuffer.current);
           messageBuffer.current = "";
+          handleFrame(parsedData).catch((e) => console.error("Error processing message: ", e));
+        } catch (e) {
+          if (e instanceof SyntaxError) {
+            console.log("Received incomplete JSON, waiting for more data...");
+          } else {
+            console.error("Error processing message: ", e);
+            messageBuffer.current = "";
+          }
         }
-      }
-    };
+      };
 
-    ws.current.onerror = (error) => {
-      console.log("WebSocket Error: ", error);
-      setProcessing(false);
-    };
+      ws.current.onerror = (error) => {
+        console.log("WebSocket Error: ", error);
+      };
 
-    ws.current.onclose = (event) => {
-      if (event.wasClean) {
-        console.log(`WebSocket closed cleanly, code=${event.code}, reason=${event.reason}`);
-      } else {
-        console.log("WebSocket Disconnected unexpectedly");
-      }
-      setProcessing(false);
+      ws.current.onclose = (event) => {
+        if (event.wasClean) {
+          console.log(`WebSocket closed cleanly, code=${event.code}, reason=${event.reason}`);
+        } else {
+          console.log("WebSocket Disconnected unexpectedly");
+        }
+        messageBuffer.current = "";
+        if (!closed && stream.current && !stream.current.done) {
+          // Counted as a resume attempt so onopen resumes the answer
+          stream.current.attempts += 1;
+          if (stream.current.attempts <= MAX_RESUME_ATTEMPTS) {
+            setTimeout(connect, resumeDelay(stream.current.attempts));
+            return;
+          }
+        }
+        setProcessing(false);
+      };
     };
 
+    connect();
+
     return () => {
+      closed = true;
       if (ws.current) {
         ws.current.close();
       }
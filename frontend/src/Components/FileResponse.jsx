@@ -55,19 +55,47 @@ const getFileIcon = (fileType) => {
   }
 };
 
+// Decodes an inline file, gunzipping text/CSV content the backend compressed
+const fileToBlob = async (file) => {
+  const byteCharacters = atob(file.base64);
+  const byteArray = new Uint8Array(byteCharacters.length);
+
+  for (let i = 0; i < byteCharacters.length; i++) {
+    byteArray[i] = byteCharacters.charCodeAt(i);
+  }
+
+  if (file.encoding === "gzip") {
+    const stream = new Blob([byteArray]).stream().pipeThrough(new DecompressionStream("gzip"));
+    const decompressed = await new Response(stream).arrayBuffer();
+    return new Blob([decompressed], { type: file.type });
+  }
+  return new Blob([byteArray], { type: file.type });
+};
+
+// Inline preview: the thumbnail when the full image is only linked, otherwise the image itself
+const getThumbnailSrc = (file) => {
+  if (file.preview) {
+    return `data:${file.preview_type};base64,${file.preview}`;
+  }
+  return file.base64 ? `data:${file.type};base64,${file.base64}` : null;
+};
+
 const FileHandler = ({ message }) => {
   // eslint-disable-next-line
   const [hoveredFile, setHoveredFile] = useState(null);
-  const handlePreview = (file) => {
-    const byteCharacters = atob(file.base64);
-    const byteArrays = [];
-
-    for (let i = 0; i < byteCharacters.length; i++) {
-      byteArrays.push(byteCharacters.charCodeAt(i));
+  const handlePreview = async (file) => {
+    // Large files are not inlined; the full-resolution version is fetched only now
+    if (file.url) {
+      const newWindow = window.open(file.url, "_blank");
+      if (newWindow) {
+        newWindow.focus();
+      } else {
+        alert("Please allow pop-ups to view the file.");
+      }
+      return;
     }
 
-    const byteArray = new Uint8Array(byteArrays);
-    const blob = new Blob([byteArray], { type: file.type });
+    const blob = await fileToBlob(file);
     const blobUrl = URL.createObjectURL(blob);
 
     // Open the blob URL in a new tab
@@ -82,13 +110,20 @@ const FileHandler = ({ message }) => {
     setTimeout(() => URL.revokeObjectURL(blobUrl), 10000);
   };
 
-  const handleDownload = (file) => {
+  const handleDownload = async (file) => {
     // Trigger file download
-    const fileUrl = `data:${file.type};base64,${file.base64}`;
     const link = document.createElement("a");
-    link.href = fileUrl;
     link.download = file.filename;
+    if (file.url) {
+      link.href = file.url;
+      link.click();
+      return;
+    }
+
+    const blobUrl = URL.createObjectURL(await fileToBlob(file));
+    link.href = blobUrl;
     link.click();
+    setTimeout(() => URL.revokeObjectURL(blobUrl), 10000);
   };
 
   return (
@@ -130,7 +165,7 @@ const FileHandler = ({ message }) => {
             <Box>
               <Typography variant="body2">{file.filename}</Typography>
               {/* Displaying image files directly in the UI */}
-              {file.type.startsWith("image") && <img src={`data:${file.type};base64,${file.base64}`} alt={file.filename} style={{ maxWidth: "100px", maxHeight: "100px", marginTop: "8px" }} />}
+              {file.type.startsWith("image") && getThumbnailSrc(file) && <img src={getThumbnailSrc(file)} alt={file.filename} style={{ maxWidth: "100px", maxHeight: "100px", marginTop: "8px" }} />}
             </Box>
           </Box>
         </Grid>
@@ -12,9 +12,13 @@
  * @param {string} [files=[ { // expected format
               filename: "abc.csv",
               type: "text/csv",
-              link:"",
-              base64:
-                "Rmlyc3ROYW1lLExhc3ROYW1lClBFRFJPLEFHVUlMQVIKg==",
+              size: 1024, // original size in bytes
+              base64: // inline content, absent when the file is only linked
+                "H4sIAAAAAAACA3PLLCou8UvMTdXxSYQwuAJcXYL8dRzdQz19HIO4AFoa9v0hAAAA",
+              encoding: "gzip", // set when base64 holds gzipped text/CSV
+              url: "", // presigned link to the full file when it is too large to inline
+              preview: "", // small JPEG thumbnail (base64) for linked images
+              preview_type: "image/jpeg",
             },]] - List of Files.
  * 
  * @returns {Object} - A message block object.
@@ -0,0 +1,18 @@
+/**
+ * Length and checksum of a streamed answer, computed the way the backend does for
+ * the final_text frame (stream.text_digest in BedrockAIAgent): the UTF-8 byte
+ * length and the hex SHA-256 of the concatenated delta texts.
+ *
+ * @param {string} text - The answer text assembled from the delta frames.
+ * @returns {Promise<{length: number, sha256: string}>}
+ */
+const textDigest = async (text) => {
+  const data = new TextEncoder().encode(text);
+  const hash = await crypto.subtle.digest("SHA-256", data);
+  const sha256 = Array.from(new Uint8Array(hash))
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+  return { length: data.length, sha256 };
+};
+
+export default textDigest;